@@ -0,0 +1 @@
+"""Data-access and analytics layer for the Sleep Tracker app."""
@@ -0,0 +1,118 @@
+"""Statistics aggregated by the database instead of in pandas.
+
+``fetch_statistics`` sends one GROUP BY over every combination of factor
+levels (at most a few hundred groups) with the counts, sums and sums of
+squares the statistics need. Per-factor results and the overall means and
+correlation are then derived from those sums, so no per-session rows leave
+the database. The SQL is plain ANSI (CASE, CAST AS FLOAT, COUNT/SUM) and runs
+unchanged on SQL Server and SQLite. Raw rows are only read by
+``fetch_series``, for charts.
+"""
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from sleep_tracker.factors import FACTORS, combine, level_statistics
+from sleep_tracker.frames import fetch_frame
+from sleep_tracker.instrumentation import query_name
+from sleep_tracker.storage import window_start
+
+StatisticsSummary = namedtuple(
+    'StatisticsSummary',
+    ['sessions', 'avg_duration', 'avg_quality', 'correlation', 'factors'],
+)
+
+# Table alias of each factor column in the query below
+_SOURCE = {'times_woken': 'sq'}
+
+# Aggregates per group; d is duration in hours, r the rating, px/py the paired values
+_MEASURES = (
+    'COUNT(d)', 'SUM(d)', 'SUM(d * d)',
+    'COUNT(r)', 'SUM(r)', 'SUM(r * r)',
+    'COUNT(px)', 'SUM(px)', 'SUM(py)', 'SUM(px * px)', 'SUM(py * py)', 'SUM(px * py)',
+)
+
+SERIES_QUERY = '''
+SELECT ss.session_id, ss.date, ss.duration, sq.rating
+FROM Sleep_Sessions ss
+LEFT JOIN Sleep_Quality sq ON ss.session_id = sq.session_id
+WHERE ss.user_id = ?
+ORDER BY ss.date
+'''
+
+
+def level_expression(factor):
+    """SQL CASE mapping a factor column to its level index (-1 when unknown)."""
+    column = f"{_SOURCE.get(factor.column, 'sf')}.{factor.column}"
+    if factor.bins is None:
+        return f"CASE WHEN {column} IS NULL THEN -1 WHEN {column} = 0 THEN 0 ELSE 1 END"
+    branches = ' '.join(f"WHEN {column} >= {edge} THEN {index}"
+                        for index, edge in reversed(list(enumerate(factor.bins))))
+    return f"CASE WHEN {column} IS NULL THEN -1 {branches} ELSE -1 END"
+
+
+def statistics_query(factors=FACTORS):
+    """Grouped aggregate query; parameters are ``(user_id, since)``."""
+    levels = ',\n               '.join(f"{level_expression(factor)} AS f{i}"
+                                   for i, factor in enumerate(factors))
+    keys = ', '.join(f"f{i}" for i in range(len(factors)))
+    return f'''
+    SELECT {keys}, {', '.join(_MEASURES)}
+    FROM (
+        SELECT CAST(ss.duration AS FLOAT) / 60 AS d,
+               CAST(sq.rating AS FLOAT) AS r,
+               CASE WHEN sq.rating IS NOT NULL THEN CAST(ss.duration AS FLOAT) / 60 END AS px,
+               CASE WHEN ss.duration IS NOT NULL THEN CAST(sq.rating AS FLOAT) END AS py,
+               {levels}
+        FROM Sleep_Sessions ss
+        LEFT JOIN Sleep_Quality sq ON ss.session_id = sq.session_id
+        LEFT JOIN Sleep_Factors sf ON ss.session_id = sf.session_id
+        WHERE ss.user_id = ? AND ss.date >= ?
+    ) s
+    GROUP BY {keys}
+    '''
+
+
+def _correlation(n, sx, sy, sxx, syy, sxy):
+    if n < 2:
+        return None
+    denominator = math.sqrt(max(n * sxx - sx * sx, 0) * max(n * syy - sy * sy, 0))
+    return (n * sxy - sx * sy) / denominator if denominator else math.nan
+
+
+@query_name('statistics.aggregates')
+def fetch_statistics(conn, user_id, days, factors=FACTORS):
+    """StatisticsSummary for the last ``days`` days; durations are in hours."""
+    cursor = conn.cursor()
+    cursor.execute(statistics_query(factors), (user_id, window_start(days)))
+    rows = np.array(cursor.fetchall(), dtype=float).reshape(-1, len(factors) + len(_MEASURES))
+    codes = rows[:, :len(factors)].astype(np.int64)
+    measures = np.nan_to_num(rows[:, len(factors):])   # SUM over no rows is NULL
+
+    totals = measures.sum(axis=0)
+    sessions = int(totals[0])
+    avg_duration = totals[1] / totals[0] if totals[0] else None
+    avg_quality = totals[4] / totals[3] if totals[3] else None
+    correlation = _correlation(*totals[6:12])
+
+    # Marginalize the groups onto each factor's levels
+    sizes = [len(factor.levels) for factor in factors]
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    total = int(sum(sizes))
+    ids = np.where(codes >= 0, codes + offsets, total).T.ravel()
+    tiled = np.tile(measures, (len(factors), 1))
+    by_level = np.column_stack([
+        np.bincount(ids, weights=tiled[:, column], minlength=total + 1)[:total]
+        for column in range(6)
+    ])
+    pieces = [level_statistics(factors, outcome, *by_level[:, first:first + 3].T)
+              for outcome, first in (('duration', 0), ('rating', 3))
+              if by_level[:, first].any()]
+    return StatisticsSummary(sessions, avg_duration, avg_quality, correlation, combine(pieces))
+
+
+@query_name('statistics.series')
+def fetch_series(conn, user_id):
+    """Every session's date, duration (minutes) and rating as a typed frame, for charts."""
+    return fetch_frame(conn.cursor(), SERIES_QUERY, (user_id,))
@@ -0,0 +1,86 @@
+"""Sleep statistics for a user and time range, independent of any UI.
+
+Short ranges slice the user's cached full-history frame (StatsCache), take
+means and the duration/quality correlation from the merged per-day moment
+buckets (MomentsStore) and let the database aggregate the factor effects.
+Ranges longer than ``STREAMING_DAYS`` are read chunk by chunk and charted as
+daily means, so memory stays bounded however long the history is.
+numpy and pandas are imported on first use.
+"""
+from collections import namedtuple
+
+from sleep_tracker.moments import MomentsStore
+from sleep_tracker.stats_cache import StatsCache
+
+# Ranges longer than this are aggregated chunk by chunk and charted as daily means
+STREAMING_DAYS = 365
+
+# Time ranges offered to users, in days
+TIME_RANGES = {
+    "Last 7 Days": 7,
+    "Last 30 Days": 30,
+    "Last 90 Days": 90,
+    "All Time": 3650,   # ~10 years
+}
+
+SleepStatistics = namedtuple(
+    'SleepStatistics',
+    ['series', 'avg_duration', 'avg_quality', 'correlation', 'factors'],
+)
+SleepStatistics.__doc__ = """Statistics for one range.
+
+``series`` is a frame of date, duration (hours) and rating to chart;
+averages are NaN without data and ``correlation`` is None below two rated
+nights. ``factors`` is the per-level effects frame from ``factors.combine``.
+"""
+
+
+class SleepAnalytics:
+    """Statistics over a SleepRepository, served from in-memory caches where possible."""
+
+    def __init__(self, repository, stats_cache=None, moments=None,
+                 streaming_days=STREAMING_DAYS):
+        self.repository = repository
+        self.stats_cache = stats_cache if stats_cache is not None else StatsCache()
+        self.moments = moments if moments is not None else MomentsStore(repository.pool)
+        self.streaming_days = streaming_days
+
+    def statistics(self, user_id, days_back):
+        """SleepStatistics for the last ``days_back`` days, or None without sessions.
+
+        Blocks on the database, so call it from a worker thread in a UI.
+        """
+        if days_back > self.streaming_days:
+            return self.streamed_statistics(user_id, days_back)
+
+        # Chart series are served from memory unless the user is not cached yet
+        series = self.stats_cache.get_frame(user_id, days_back, self.repository.series)
+        if series.empty:
+            return None
+        series['duration'] = series['duration'] / 60
+
+        # Means and correlation come from merged per-day Welford buckets
+        moments = self.moments.range_moments(user_id, days_back)
+        return SleepStatistics(
+            series,
+            moments.duration.mean / 60 if moments.duration.n else float('nan'),
+            moments.rating.mean if moments.rating.n else float('nan'),
+            moments.pair.correlation if moments.pair.n > 1 else None,
+            # Factor effects are aggregated by the database; only sums come back
+            self.repository.factor_effects(user_id, days_back),
+        )
+
+    def streamed_statistics(self, user_id, days_back):
+        """SleepStatistics computed in bounded memory, charted as daily means."""
+        streamed = self.repository.stream(user_id, days_back)
+        series = streamed.daily_series()
+        if series.empty:
+            return None
+        summary = streamed.summary
+        return SleepStatistics(
+            series,
+            summary.duration.mean if summary.duration.n else float('nan'),
+            summary.rating.mean if summary.rating.n else float('nan'),
+            summary.pair.correlation if summary.pair.n > 1 else None,
+            streamed.factor_effects(),
+        )
@@ -0,0 +1,406 @@
+"""Startup and interaction latency benchmarks for the Tk app.
+
+The suite seeds a SQLite database with synthetic users, then measures:
+
+* ``startup``: ``python sleep_tracker_app.py`` until the login screen has
+  painted, in a fresh interpreter each time;
+* ``login``: ``login()`` until the dashboard summary is on screen;
+* ``statistics_<range>_cold`` / ``statistics_<range>_warm``:
+  ``generate_statistics`` for each time range, with the frame, moments and
+  chart caches cleared first, and then repeated against the warm caches;
+* ``history_first_page`` / ``history_next_page``: ``load_sleep_history`` and
+  each following ``load_more_history``.
+
+Interactions are driven through the real ``SleepTrackerApp``. Tk events are
+pumped until the keyed background task behind the interaction has reported
+back and the idle redraw has run. A display is needed, and a virtual one
+is enough: ``xvfb-run python -m sleep_tracker.benchmarks``.
+
+Where there is no display at all, ``--core`` times the work behind the same
+interactions without Tk: ``startup`` becomes the import of
+``sleep_tracker_app``, and the others call what the app's background tasks
+call, on the benchmark thread. Painting, widget updates and the executor
+hop are left out, so core results are only compared with a core baseline.
+
+Each interaction is reported as p50/p95 in milliseconds. Results can be
+saved as a JSON baseline, and later runs of the same mode compared
+against it.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from sleep_tracker import synthetic
+from sleep_tracker.analytics import TIME_RANGES
+from sleep_tracker.migrations import migrate
+from sleep_tracker.storage import DB_CONFIG, SqliteBackend
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BASELINE_PATH = os.path.join(_ROOT, 'benchmark_baseline.json')
+TOLERANCE = 0.25        # allowed slowdown against the baseline before a run fails
+USERNAME = 'bench1'
+PASSWORD = 'bench'
+
+RANGES = (
+    ('7d', "Last 7 Days"),
+    ('30d', "Last 30 Days"),
+    ('90d', "Last 90 Days"),
+    ('all', "All Time"),
+)
+
+# Prints a line as soon as the login screen has painted
+_STARTUP_PROBE = '''
+import tkinter as tk
+import sleep_tracker_app
+root = tk.Tk()
+app = sleep_tracker_app.SleepTrackerApp(root)
+root.update()
+print('ready', flush=True)
+root.destroy()
+'''
+
+# Without a display: just the import the login screen waits on
+_IMPORT_PROBE = '''
+import sleep_tracker_app
+print('ready', flush=True)
+'''
+
+
+def seed_database(path, users=50, nights=3650, seed=0):
+    """Create a migrated SQLite database at ``path`` filled by ``synthetic.generate``.
+
+    Users are named ``bench1``, ``bench2``... with password ``bench``; the
+    suite logs in as the first.
+    """
+    backend = SqliteBackend(path)
+    conn = backend.connect()
+    try:
+        migrate(conn, backend)
+        synthetic.generate(conn, backend, users, nights, seed, prefix='bench', password=PASSWORD,
+                           in_progress=0)
+    finally:
+        conn.close()
+
+
+def percentiles(samples):
+    """p50 and p95 of ``samples`` (seconds) in milliseconds, with the sample count."""
+    values = np.asarray(samples, dtype=float) * 1000
+    return {'n': len(values), 'p50': float(np.percentile(values, 50)),
+            'p95': float(np.percentile(values, 95))}
+
+
+def measure_startup(db_path, repeat, probe_code=_STARTUP_PROBE):
+    """Seconds from process launch until ``probe_code`` reports ready, per fresh interpreter."""
+    env = dict(os.environ, SLEEP_TRACKER_BACKEND='sqlite', SLEEP_TRACKER_SQLITE_PATH=db_path)
+    samples = []
+    for _ in range(repeat):
+        launched = time.perf_counter()
+        probe = subprocess.Popen([sys.executable, '-c', probe_code], cwd=_ROOT, env=env,
+                                 stdout=subprocess.PIPE, text=True)
+        ready = probe.stdout.readline()
+        painted = time.perf_counter()
+        probe.wait()
+        if ready.strip() != 'ready':
+            raise RuntimeError(f"Startup probe failed (exit code {probe.returncode})")
+        samples.append(painted - launched)
+    return samples
+
+
+class AppDriver:
+    """Drives a SleepTrackerApp in this process and times its interactions."""
+
+    def __init__(self, db_path, timeout=120):
+        import tkinter as tk
+
+        import sleep_tracker_app
+
+        self.timeout = timeout
+        # The app picks its database from DB_CONFIG when it is constructed
+        DB_CONFIG['backend'] = 'sqlite'
+        DB_CONFIG['sqlite']['path'] = db_path
+        self.root = tk.Tk()
+        self.app = sleep_tracker_app.SleepTrackerApp(self.root)
+        # A private chart cache, so a run never starts with images from an earlier run
+        self._chart_cache = tempfile.TemporaryDirectory(prefix='sleep-bench-charts-')
+        self.app.chart_renderer.cache_dir = self._chart_cache.name
+        self.root.update()
+
+    def close(self):
+        self.app.executor.shutdown()
+        self.app.chart_renderer.shutdown()
+        self.app.pool.close()
+        self.root.destroy()
+        self._chart_cache.cleanup()
+
+    def settle(self, *keys):
+        """Pump Tk events until the tasks behind ``keys`` have reported and the UI redrew."""
+        deadline = time.perf_counter() + self.timeout
+        self.root.update()
+        while any(self.app.executor.is_pending(key) for key in keys):
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"Interaction did not finish: {', '.join(keys)}")
+            self.root.update()
+            time.sleep(0.001)
+        self.root.update_idletasks()
+
+    def timed(self, action, *keys):
+        started = time.perf_counter()
+        action()
+        self.settle(*keys)
+        return time.perf_counter() - started
+
+    def login(self, username=USERNAME, password=PASSWORD):
+        app = self.app
+        app.username_entry.delete(0, 'end')
+        app.username_entry.insert(0, username)
+        app.password_entry.delete(0, 'end')
+        app.password_entry.insert(0, password)
+        # The dashboard task is submitted by the auth callback, before auth stops pending
+        seconds = self.timed(app.login, 'auth', 'dashboard')
+        if not app.is_logged_in:
+            raise RuntimeError(f"Could not log in as {username}")
+        return seconds
+
+    def logout(self):
+        self.app.logout()
+        self.settle()
+
+    def select_tab(self, frame, *keys):
+        self.app.notebook.select(frame)
+        self.settle(*keys)
+
+    def open_statistics(self):
+        self.select_tab(self.app.statistics_frame, 'statistics')
+
+    def open_history(self):
+        self.select_tab(self.app.history_frame, 'history')
+
+    def clear_caches(self):
+        """Drop the logged-in user's cached frame, moment buckets and chart images."""
+        self.app.stats_cache.invalidate()
+        self.app.moments.invalidate(self.app.current_user_id)
+        self.app.chart_renderer.clear()
+
+    def statistics(self, label, cold=False):
+        self.app.time_range.set(label)
+        if cold:
+            self.clear_caches()
+        return self.timed(self.app.generate_statistics, 'statistics')
+
+    def history_first_page(self):
+        return self.timed(self.app.load_sleep_history, 'history')
+
+    def history_next_page(self):
+        return self.timed(self.app.load_more_history, 'history')
+
+
+class CoreDriver:
+    """Times the work behind each interaction without Tk, for machines with no display.
+
+    Builds the pool, caches, service, analytics and chart renderer the way
+    SleepTrackerApp does and calls what its background tasks call.
+    """
+
+    def __init__(self, db_path):
+        import sleep_tracker_app
+        from sleep_tracker.analytics import SleepAnalytics
+        from sleep_tracker.moments import MomentsStore
+        from sleep_tracker.rendering import ChartRenderer
+        from sleep_tracker.repository import SleepRepository
+        from sleep_tracker.service import SleepService
+        from sleep_tracker.stats_cache import StatsCache
+
+        backend = SqliteBackend(db_path)
+        self.pool = backend.create_pool()
+        self.stats_cache = StatsCache()
+        self.moments = MomentsStore(self.pool)
+        self.repository = SleepRepository(self.pool, backend)
+        self.service = SleepService(self.repository, self.stats_cache, self.moments)
+        self.analytics = SleepAnalytics(self.repository, self.stats_cache, self.moments)
+        self._chart_cache = tempfile.TemporaryDirectory(prefix='sleep-bench-charts-')
+        self.chart_renderer = ChartRenderer(sleep_tracker_app.CHART_STYLE,
+                                            cache_dir=self._chart_cache.name)
+        # The app spawns its chart workers at login, before the first Statistics visit
+        self.chart_renderer.warm()
+        self.user_id = None
+        self.history_key = None
+
+    def close(self):
+        self.chart_renderer.shutdown()
+        self.pool.close()
+        self._chart_cache.cleanup()
+
+    def login(self, username=USERNAME, password=PASSWORD):
+        started = time.perf_counter()
+        self.user_id = self.service.login(username, password)
+        if self.user_id is None:
+            raise RuntimeError(f"Could not log in as {username}")
+        self.repository.dashboard_summary(self.user_id)
+        return time.perf_counter() - started
+
+    def logout(self):
+        self.user_id = None
+
+    def open_statistics(self):
+        self.statistics(RANGES[0][1])
+
+    def open_history(self):
+        self.history_first_page()
+
+    def clear_caches(self):
+        """Drop the logged-in user's cached frame, moment buckets and chart images."""
+        self.stats_cache.invalidate()
+        self.moments.invalidate(self.user_id)
+        self.chart_renderer.clear()
+
+    def statistics(self, label, cold=False):
+        from sleep_tracker.frames import as_float
+        days_back = TIME_RANGES[label]
+        if cold:
+            self.clear_caches()
+        started = time.perf_counter()
+        stats = self.analytics.statistics(self.user_id, days_back)
+        if stats is not None:
+            series = stats.series
+            self.chart_renderer.render(self.user_id, days_back, series['date'],
+                                       as_float(series['duration']), as_float(series['rating']))
+        return time.perf_counter() - started
+
+    def history_first_page(self):
+        self.history_key = None
+        return self.history_next_page()
+
+    def history_next_page(self):
+        from sleep_tracker.history import page_key
+        started = time.perf_counter()
+        rows = self.repository.history_page(self.user_id, self.history_key)
+        if rows:
+            self.history_key = page_key(rows[-1])
+        return time.perf_counter() - started
+
+
+def run_suite(db_path, repeat=10, startup_repeat=5, pages=5, core=False):
+    """Samples in seconds for every interaction, keyed by interaction name.
+
+    ``core`` measures through CoreDriver and the import probe instead of the app.
+    """
+    probe = _IMPORT_PROBE if core else _STARTUP_PROBE
+    samples = {'startup': measure_startup(db_path, startup_repeat, probe)}
+
+    driver = CoreDriver(db_path) if core else AppDriver(db_path)
+    try:
+        samples['login'] = []
+        for _ in range(repeat):
+            samples['login'].append(driver.login())
+            driver.logout()
+
+        driver.login()
+        driver.open_statistics()
+        for name, label in RANGES:
+            # Repeats of the same range are cache hits; time cold and warm runs apart
+            samples[f'statistics_{name}_cold'] = [driver.statistics(label, cold=True)
+                                                  for _ in range(repeat)]
+            samples[f'statistics_{name}_warm'] = [driver.statistics(label)
+                                                  for _ in range(repeat)]
+
+        driver.open_history()
+        samples['history_first_page'] = []
+        samples['history_next_page'] = []
+        for _ in range(repeat):
+            samples['history_first_page'].append(driver.history_first_page())
+            for _ in range(pages):
+                samples['history_next_page'].append(driver.history_next_page())
+    finally:
+        driver.close()
+    return samples
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Lines describing each interaction against ``baseline``, and whether any regressed."""
+    lines, regressed = [], False
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            lines.append(f"{name:<20} {result['p50']:9.1f} {result['p95']:9.1f}   (no baseline)")
+            continue
+        changes = [result[key] / before[key] - 1 if before[key] else 0.0 for key in ('p50', 'p95')]
+        slower = [change > tolerance for change in changes]
+        regressed |= any(slower)
+        flag = '  REGRESSION' if any(slower) else ''
+        lines.append(f"{name:<20} {result['p50']:9.1f} {result['p95']:9.1f}   "
+                     f"p50 {changes[0]:+6.1%}  p95 {changes[1]:+6.1%}{flag}")
+    return lines, regressed
+
+
+def environment():
+    """Where a baseline was measured, saved next to its results."""
+    import pandas as pd
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(), 'cpus': os.cpu_count(),
+            'numpy': np.__version__, 'pandas': pd.__version__}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Sleep Tracker startup and interactions.")
+    parser.add_argument('--db', help="seeded SQLite database to use (default: a fresh temporary one)")
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--nights', type=int, default=3650, help="history length per user")
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--startup-repeat', type=int, default=5)
+    parser.add_argument('--core', action='store_true',
+                        help="time the work behind each interaction without Tk (no display needed)")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="store this run as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help="fail when p50 or p95 is this much slower than the baseline")
+    args = parser.parse_args(argv)
+    if not args.core and sys.platform.startswith('linux') and not os.environ.get('DISPLAY'):
+        parser.error("no display; run under a virtual one, e.g. "
+                     "xvfb-run python -m sleep_tracker.benchmarks, or pass --core")
+    mode = 'core' if args.core else 'app'
+
+    with tempfile.TemporaryDirectory(prefix='sleep-bench-') as scratch:
+        db_path = args.db
+        if db_path is None or not os.path.exists(db_path):
+            db_path = db_path or os.path.join(scratch, 'bench.db')
+            started = time.perf_counter()
+            seed_database(db_path, args.users, args.nights)
+            print(f"Seeded {args.users} users x {args.nights} nights in "
+                  f"{time.perf_counter() - started:.1f}s")
+        samples = run_suite(db_path, args.repeat, args.startup_repeat, core=args.core)
+
+    results = {name: percentiles(values) for name, values in samples.items()}
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        # App and core timings measure different things; never compare across modes
+        if saved.get('mode', 'app') == mode:
+            baseline = saved['results']
+        else:
+            print(f"Baseline {args.baseline} is from a {saved['mode']} run; not comparing")
+
+    print(f"{'interaction':<20} {'p50 ms':>9} {'p95 ms':>9}")
+    lines, regressed = compare(results, baseline, args.tolerance)
+    print('\n'.join(lines))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'mode': mode, 'users': args.users, 'nights': args.nights,
+                       'environment': environment(), 'results': results}, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif regressed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
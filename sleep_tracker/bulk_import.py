@@ -0,0 +1,303 @@
+"""Bulk import of historical sleep data from CSV or JSON files.
+
+Input rows are validated a chunk at a time with vectorized pandas checks and
+written in one transaction per chunk. SQL Server loads each chunk into a temp
+staging table with pyodbc ``fast_executemany`` and fans it out with set-based
+INSERT ... SELECT statements; SQLite inserts with ``executemany`` under a
+write lock and maps child rows from the block of ids AUTOINCREMENT assigned.
+
+Expected columns: ``sleep_start_time``, ``sleep_end_time`` and optionally
+``user_id``, ``rating``, ``times_woken``, ``notes``, ``caffeine_intake``,
+``exercise``, ``screen_time_before_bed`` and ``stress_level``.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from sleep_tracker import daily_summary, moments
+from sleep_tracker.storage import load_backend
+
+CHUNK_SIZE = 50000
+
+SESSION_COLUMNS = ['user_id', 'sleep_start_time', 'sleep_end_time', 'duration', 'date']
+QUALITY_COLUMNS = ['session_id', 'rating', 'times_woken', 'notes']
+FACTOR_COLUMNS = ['session_id', 'caffeine_intake', 'exercise', 'screen_time_before_bed', 'stress_level']
+STAGING_COLUMNS = ['row_no', 'user_id', 'sleep_start_time', 'sleep_end_time', 'duration', 'date',
+                   'rating', 'times_woken', 'notes', 'caffeine_intake', 'exercise',
+                   'screen_time_before_bed', 'stress_level']
+
+_TRUE_STRINGS = {'1', 'true', 't', 'yes', 'y'}
+
+
+class ImportReport:
+    """Counters for a running or finished import."""
+
+    def __init__(self):
+        self.rows_read = 0
+        self.rows_imported = 0
+        self.rows_rejected = 0
+        self.started = time.perf_counter()
+        self.finished = None
+
+    @property
+    def seconds(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def rows_per_sec(self):
+        return self.rows_imported / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f"{self.rows_imported:,} imported, {self.rows_rejected:,} rejected "
+                f"of {self.rows_read:,} read in {self.seconds:.1f}s "
+                f"({self.rows_per_sec:,.0f} rows/sec)")
+
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    """Yield DataFrames of at most ``chunk_size`` rows from a CSV, JSON or JSON Lines file."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        yield from pd.read_csv(path, chunksize=chunk_size, dtype={'notes': str})
+    elif extension in ('.jsonl', '.ndjson'):
+        yield from pd.read_json(path, lines=True, chunksize=chunk_size, dtype={'notes': str})
+    elif extension == '.json':
+        # A JSON array cannot be streamed; parse once and slice it
+        frame = pd.read_json(path, orient='records', dtype={'notes': str})
+        for start in range(0, len(frame), chunk_size):
+            yield frame.iloc[start:start + chunk_size]
+    else:
+        raise ValueError(f"Unsupported import format: {extension}")
+
+
+def _flag(series):
+    """Parse a boolean-ish column (1/0, true/false, yes/no) without a Python loop."""
+    if series.dtype == bool:
+        return series
+    if pd.api.types.is_numeric_dtype(series):
+        return series.fillna(0).astype(bool)
+    return series.astype(str).str.strip().str.lower().isin(_TRUE_STRINGS)
+
+
+def _whole(series):
+    """Missing or integral values; 7.5 in an integer column rejects its row."""
+    return series.isna() | (series % 1 == 0)
+
+
+def known_user_ids(conn):
+    """Every user_id in Users, to reject rows for unknown users before writing."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT user_id FROM Users")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def validate(frame, user_id=None, known_users=None):
+    """Normalize one chunk and split it into (valid rows, rejected count).
+
+    Rows whose user is not in ``known_users`` (when given) are rejected,
+    so a bad id cannot fail a chunk after earlier chunks were committed.
+    """
+    frame = frame.copy()
+    if 'user_id' not in frame.columns:
+        if user_id is None:
+            raise ValueError("Input has no user_id column and no --user-id was given")
+        frame['user_id'] = user_id
+
+    # ISO 8601 with or without seconds or a 'T', as the app stores and exports them
+    start = pd.to_datetime(frame['sleep_start_time'], errors='coerce', format='ISO8601')
+    end = pd.to_datetime(frame['sleep_end_time'], errors='coerce', format='ISO8601')
+    duration = (end - start).dt.total_seconds() // 60
+
+    for column, default in (('rating', np.nan), ('times_woken', 0), ('notes', ''),
+                            ('caffeine_intake', False), ('exercise', False),
+                            ('screen_time_before_bed', 0), ('stress_level', np.nan)):
+        if column not in frame.columns:
+            frame[column] = default
+
+    rating = pd.to_numeric(frame['rating'], errors='coerce')
+    stress = pd.to_numeric(frame['stress_level'], errors='coerce')
+    woken = pd.to_numeric(frame['times_woken'], errors='coerce').fillna(0)
+    screen = pd.to_numeric(frame['screen_time_before_bed'], errors='coerce').fillna(0)
+    user = pd.to_numeric(frame['user_id'], errors='coerce')
+
+    valid = (
+        start.notna() & end.notna() & user.notna()
+        & (duration > 0) & (duration <= 24 * 60)
+        & (rating.isna() | rating.between(1, 10))
+        & (stress.isna() | stress.between(1, 10))
+        & (woken >= 0) & (screen >= 0)
+        & _whole(rating) & _whole(stress) & _whole(woken) & _whole(screen) & _whole(user)
+    )
+    if known_users is not None:
+        valid &= user.isin(known_users)
+
+    clean = pd.DataFrame({
+        'user_id': user[valid].astype('int64'),
+        'sleep_start_time': start[valid],
+        'sleep_end_time': end[valid],
+        'duration': duration[valid].astype('int64'),
+        'date': start[valid].dt.normalize(),
+        'rating': rating[valid].astype('Int64'),
+        'times_woken': woken[valid].astype('int64'),
+        'notes': frame['notes'][valid].fillna('').astype(str),
+        'caffeine_intake': _flag(frame['caffeine_intake'])[valid],
+        'exercise': _flag(frame['exercise'])[valid],
+        'screen_time_before_bed': screen[valid].astype('int64'),
+        'stress_level': stress[valid].astype('Int64'),
+    })
+    return clean.reset_index(drop=True), int((~valid).sum())
+
+
+def _rows(frame, columns):
+    """Convert frame columns to driver-friendly Python values (None for missing)."""
+    values = []
+    for column in columns:
+        series = frame[column]
+        if column == 'date':
+            values.append(series.dt.date.tolist())
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            values.append(list(series.dt.to_pydatetime()))
+        elif pd.api.types.is_extension_array_dtype(series):
+            # Nullable Int64 / string columns: pd.NA must become None
+            values.append([None if v is pd.NA else v for v in series.astype(object).tolist()])
+        else:
+            values.append(series.tolist())
+    return list(zip(*values))
+
+
+def _write_chunk_sqlite(conn, frame):
+    cursor = conn.cursor()
+    # The write lock keeps other writers out, so AUTOINCREMENT hands this
+    # chunk one consecutive block of ids ending at last_insert_rowid()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.executemany(
+            f"INSERT INTO Sleep_Sessions ({', '.join(SESSION_COLUMNS)}) VALUES (?, ?, ?, ?, ?)",
+            _rows(frame, SESSION_COLUMNS))
+        cursor.execute("SELECT last_insert_rowid()")
+        last_id = cursor.fetchone()[0]
+        frame = frame.assign(session_id=np.arange(last_id - len(frame) + 1, last_id + 1))
+        cursor.executemany(
+            f"INSERT INTO Sleep_Quality ({', '.join(QUALITY_COLUMNS)}) VALUES (?, ?, ?, ?)",
+            _rows(frame, QUALITY_COLUMNS))
+        cursor.executemany(
+            f"INSERT INTO Sleep_Factors ({', '.join(FACTOR_COLUMNS)}) VALUES (?, ?, ?, ?, ?)",
+            _rows(frame, FACTOR_COLUMNS))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _write_chunk_mssql(conn, frame):
+    cursor = conn.cursor()
+    cursor.fast_executemany = True
+    try:
+        cursor.execute('''
+        SET NOCOUNT ON;
+        IF OBJECT_ID('tempdb..#Import_Staging') IS NOT NULL DROP TABLE #Import_Staging;
+        IF OBJECT_ID('tempdb..#Import_Map') IS NOT NULL DROP TABLE #Import_Map;
+        CREATE TABLE #Import_Staging (
+            row_no INT PRIMARY KEY,
+            user_id INT NOT NULL,
+            sleep_start_time DATETIME NOT NULL,
+            sleep_end_time DATETIME NOT NULL,
+            duration INT NOT NULL,
+            date DATE NOT NULL,
+            rating INT,
+            times_woken INT,
+            notes NVARCHAR(MAX),
+            caffeine_intake BIT,
+            exercise BIT,
+            screen_time_before_bed INT,
+            stress_level INT
+        );
+        CREATE TABLE #Import_Map (row_no INT PRIMARY KEY, session_id INT NOT NULL);
+        ''')
+        frame = frame.assign(row_no=np.arange(len(frame)))
+        cursor.executemany(
+            f"INSERT INTO #Import_Staging ({', '.join(STAGING_COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in STAGING_COLUMNS)})",
+            _rows(frame, STAGING_COLUMNS))
+        # MERGE (unlike INSERT) can OUTPUT source columns, giving row_no -> session_id
+        cursor.execute('''
+        MERGE Sleep_Sessions AS target
+        USING #Import_Staging AS source ON 1 = 0
+        WHEN NOT MATCHED THEN
+            INSERT (user_id, sleep_start_time, sleep_end_time, duration, date)
+            VALUES (source.user_id, source.sleep_start_time, source.sleep_end_time,
+                    source.duration, source.date)
+        OUTPUT source.row_no, INSERTED.session_id INTO #Import_Map (row_no, session_id);
+
+        INSERT INTO Sleep_Quality (session_id, rating, times_woken, notes)
+        SELECT m.session_id, s.rating, s.times_woken, s.notes
+        FROM #Import_Staging s JOIN #Import_Map m ON s.row_no = m.row_no;
+
+        INSERT INTO Sleep_Factors (session_id, caffeine_intake, exercise,
+                                   screen_time_before_bed, stress_level)
+        SELECT m.session_id, s.caffeine_intake, s.exercise, s.screen_time_before_bed, s.stress_level
+        FROM #Import_Staging s JOIN #Import_Map m ON s.row_no = m.row_no;
+
+        DROP TABLE #Import_Staging;
+        DROP TABLE #Import_Map;
+        ''')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+CHUNK_WRITERS = {
+    'mssql': _write_chunk_mssql,
+    'sqlite': _write_chunk_sqlite,
+}
+
+
+def import_file(conn, backend, path, user_id=None, chunk_size=CHUNK_SIZE, progress=None):
+    """Import ``path`` chunk by chunk and return an ImportReport.
+
+    ``progress`` is called with the report after every committed chunk. The
+    daily summary and moments of every imported user are rebuilt at the end.
+    """
+    write_chunk = CHUNK_WRITERS[backend.dialect]
+    report = ImportReport()
+    known_users = known_user_ids(conn)
+    users = set()
+    for chunk in read_chunks(path, chunk_size):
+        clean, rejected = validate(chunk, user_id, known_users)
+        report.rows_read += len(chunk)
+        report.rows_rejected += rejected
+        if not clean.empty:
+            write_chunk(conn, clean)
+            report.rows_imported += len(clean)
+            users.update(clean['user_id'].unique().tolist())
+        if progress is not None:
+            progress(report)
+    for imported_user in sorted(users):
+        daily_summary.rebuild(conn, imported_user)
+        moments.rebuild(conn, imported_user)
+    report.finished = time.perf_counter()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import sleep history from CSV or JSON.")
+    parser.add_argument('path', help=".csv, .json (array of records) or .jsonl file")
+    parser.add_argument('--user-id', type=int, help="owner of rows without a user_id column")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    backend = load_backend()
+    conn = backend.connect()
+    try:
+        report = import_file(conn, backend, args.path, args.user_id, args.chunk_size,
+                             progress=lambda r: print(f"  {r}", flush=True))
+        print(f"Import finished: {report}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Persistent matplotlib charts for the Statistics tab.
+
+The figure, axes and Line2D artists are created once and refreshed in place
+with ``set_data``. Series longer than the downsampling threshold are reduced
+to about one point per horizontal pixel first. The figure is drawn offscreen
+with Agg and ``render`` returns the finished bitmap, so charts are rendered
+in worker processes (see ``rendering``) that never load Tk.
+"""
+import io
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from sleep_tracker.downsample import DOWNSAMPLE_THRESHOLD, downsample, spread_band
+
+
+class SleepCharts:
+    """Duration and quality time series sharing one offscreen figure.
+
+    ``mode`` picks the downsampler (``'lttb'`` or ``'minmax'``); with
+    ``show_band`` a reduced series also gets a shaded per-bucket min/max band.
+    """
+
+    def __init__(self, duration_color, quality_color, background='white',
+                 mode='lttb', show_band=False, threshold=DOWNSAMPLE_THRESHOLD,
+                 size=(10, 8), dpi=100):
+        self.mode = mode
+        self.show_band = show_band
+        self.threshold = threshold
+        self.figure = Figure(figsize=size, dpi=dpi)
+        self.figure.patch.set_facecolor(background)
+
+        self.duration_axes = self.figure.add_subplot(2, 1, 1)
+        self.quality_axes = self.figure.add_subplot(2, 1, 2)
+        self.duration_line = self._series(self.duration_axes, duration_color, background,
+                                          'Sleep Duration Over Time', 'Hours')
+        self.quality_line = self._series(self.quality_axes, quality_color, background,
+                                         'Sleep Quality Over Time', 'Quality Rating (1-10)')
+        self.figure.subplots_adjust(hspace=0.4)
+        self._bands = {}   # line -> spread band collection currently shown
+        self.canvas = FigureCanvasAgg(self.figure)
+
+    @staticmethod
+    def _series(axes, color, background, title, ylabel):
+        axes.set_title(title, fontsize=14, pad=20)
+        axes.set_ylabel(ylabel, fontsize=12)
+        axes.set_xlabel('Date', fontsize=12)
+        axes.grid(True, linestyle='--', alpha=0.7)
+        axes.set_facecolor(background)
+        axes.xaxis_date()
+        line, = axes.plot([], [], 'o-', color=color, linewidth=2, markersize=8)
+        return line
+
+    @property
+    def lines(self):
+        return (self.duration_line, self.quality_line)
+
+    def update(self, dates, durations, ratings):
+        """Show new series; durations are in hours."""
+        dates = np.asarray(dates, dtype='datetime64[ns]')
+        for line, values in ((self.duration_line, durations), (self.quality_line, ratings)):
+            self._set_series(line, dates, np.asarray(values, dtype=float))
+
+    def _set_series(self, line, dates, values):
+        """Update one line (and its band) and rescale its axes to fit."""
+        axes = line.axes
+        target = max(int(axes.bbox.width), 3)
+        x, y = downsample(dates, values, target, self.mode, self.threshold)
+        reduced = len(x) < len(dates)
+        line.set_data(x, y)
+        # Thousands of 8pt markers dominate rasterization; a reduced series is drawn as a line
+        line.set_marker('' if reduced else 'o')
+
+        band = self._bands.pop(line, None)
+        if band is not None:
+            band.remove()
+        if reduced and self.show_band:
+            bx, low, high = spread_band(dates, values, target // 4)
+            self._bands[line] = axes.fill_between(bx, low, high, color=line.get_color(),
+                                                  alpha=0.2, linewidth=0)
+
+        axes.relim()
+        if line in self._bands:
+            # relim ignores collections, and the band can reach past the kept points
+            band_x = np.tile(axes.xaxis.convert_units(bx), 2)
+            axes.update_datalim(np.column_stack((band_x, np.concatenate((low, high)))))
+        axes.autoscale_view()
+
+    def render(self, fmt='png'):
+        """Draw an offscreen figure and return PNG bytes, or RGBA pixels for ``'rgba'``.
+
+        RGBA results are ``(width, height, bytes)`` with rows top to bottom.
+        """
+        if fmt == 'rgba':
+            self.canvas.draw()
+            width, height = self.canvas.get_width_height()
+            return width, height, bytes(self.canvas.buffer_rgba())
+        output = io.BytesIO()
+        # Fast zlib level: the image is decoded moments later, size matters little
+        self.canvas.print_png(output, pil_kwargs={'compress_level': 1})
+        return output.getvalue()
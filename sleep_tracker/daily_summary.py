@@ -0,0 +1,135 @@
+"""Per-user daily rollup of sleep sessions, quality ratings and factors.
+
+Daily_Sleep_Summary is maintained incrementally inside the same transaction
+as the raw writes, so the dashboard's window averages are read from one row
+per day instead of scanning Sleep_Sessions. Statistics ranges, which also
+need variances and the correlation, read the per-day Sleep_Moments buckets
+instead (see ``moments``). ``rebuild`` recomputes it from scratch.
+"""
+import argparse
+
+from sleep_tracker.instrumentation import query_name
+from sleep_tracker.storage import load_backend
+
+COUNTERS = (
+    'total_minutes',   # sum of completed session durations
+    'session_count',   # completed sessions (duration known)
+    'rating_sum',
+    'rating_count',
+    'factor_count',    # sessions with a Sleep_Factors row
+    'caffeine_count',
+    'exercise_count',
+    'screen_time_sum',
+    'stress_sum',
+    'stress_count',
+)
+
+# Aggregates the raw tables into the same columns, used for backfill
+ROLLUP_SELECT = '''
+SELECT ss.user_id, ss.date,
+       COALESCE(SUM(ss.duration), 0), COUNT(ss.duration),
+       COALESCE(SUM(sq.rating), 0), COUNT(sq.rating),
+       COUNT(sf.factor_id),
+       SUM(CASE WHEN sf.caffeine_intake = 1 THEN 1 ELSE 0 END),
+       SUM(CASE WHEN sf.exercise = 1 THEN 1 ELSE 0 END),
+       COALESCE(SUM(sf.screen_time_before_bed), 0),
+       COALESCE(SUM(sf.stress_level), 0), COUNT(sf.stress_level)
+FROM Sleep_Sessions ss
+LEFT JOIN Sleep_Quality sq ON ss.session_id = sq.session_id
+LEFT JOIN Sleep_Factors sf ON ss.session_id = sf.session_id
+'''
+
+ROLLUP_INSERT = (
+    f"INSERT INTO Daily_Sleep_Summary (user_id, date, {', '.join(COUNTERS)})\n"
+    + ROLLUP_SELECT
+)
+
+_COLUMNS = ', '.join(COUNTERS)
+_PLACEHOLDERS = ', '.join('?' for _ in COUNTERS)
+
+UPSERT = {
+    # UPDLOCK/SERIALIZABLE stops two writers both inserting the same day
+    'mssql': (
+        "UPDATE Daily_Sleep_Summary WITH (UPDLOCK, SERIALIZABLE) SET "
+        + ', '.join(f"{name} = {name} + ?" for name in COUNTERS)
+        + " WHERE user_id = ? AND date = ?;\n"
+        "IF @@ROWCOUNT = 0\n"
+        f"INSERT INTO Daily_Sleep_Summary (user_id, date, {_COLUMNS}) "
+        f"VALUES (?, ?, {_PLACEHOLDERS})"
+    ),
+    'sqlite': (
+        f"INSERT INTO Daily_Sleep_Summary (user_id, date, {_COLUMNS}) "
+        f"VALUES (?, ?, {_PLACEHOLDERS})\n"
+        "ON CONFLICT (user_id, date) DO UPDATE SET "
+        + ', '.join(f"{name} = {name} + excluded.{name}" for name in COUNTERS)
+    ),
+}
+
+
+def sleep_delta(duration=None, rating=None, factors=None):
+    """Counter increments for one session's duration, rating and/or factors.
+
+    ``factors`` is ``(caffeine, exercise, screen_time, stress_level)``.
+    """
+    delta = dict.fromkeys(COUNTERS, 0)
+    if duration is not None:
+        delta['total_minutes'] = duration
+        delta['session_count'] = 1
+    if rating is not None:
+        delta['rating_sum'] = rating
+        delta['rating_count'] = 1
+    if factors is not None:
+        caffeine, exercise, screen_time, stress_level = factors
+        delta['factor_count'] = 1
+        delta['caffeine_count'] = int(bool(caffeine))
+        delta['exercise_count'] = int(bool(exercise))
+        delta['screen_time_sum'] = screen_time or 0
+        if stress_level is not None:
+            delta['stress_sum'] = stress_level
+            delta['stress_count'] = 1
+    return delta
+
+
+@query_name('daily_summary.record')
+def record_sleep(cursor, backend, user_id, day, duration=None, rating=None, factors=None):
+    """Fold one write into the user's row for ``day``; caller commits."""
+    values = [sleep_delta(duration, rating, factors)[name] for name in COUNTERS]
+    if backend.dialect == 'mssql':
+        params = values + [user_id, day, user_id, day] + values
+    else:
+        params = [user_id, day] + values
+    cursor.execute(UPSERT[backend.dialect], params)
+
+
+def rebuild(conn, user_id=None):
+    """Recompute the rollup from the raw tables, for one user or everyone."""
+    cursor = conn.cursor()
+    try:
+        if user_id is None:
+            cursor.execute("DELETE FROM Daily_Sleep_Summary")
+            cursor.execute(ROLLUP_INSERT + "GROUP BY ss.user_id, ss.date")
+        else:
+            cursor.execute("DELETE FROM Daily_Sleep_Summary WHERE user_id = ?", (user_id,))
+            cursor.execute(ROLLUP_INSERT + "WHERE ss.user_id = ?\nGROUP BY ss.user_id, ss.date",
+                           (user_id,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild Daily_Sleep_Summary from raw sessions.")
+    parser.add_argument('--user-id', type=int, help="only rebuild this user's rows")
+    args = parser.parse_args(argv)
+
+    conn = load_backend().connect()
+    try:
+        rebuild(conn, args.user_id)
+        print("Daily summary rebuilt")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
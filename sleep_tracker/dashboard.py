@@ -0,0 +1,44 @@
+"""Dashboard figures fetched in a single database round trip."""
+from collections import namedtuple
+
+from sleep_tracker.instrumentation import query_name
+from sleep_tracker.storage import window_start
+
+DashboardSummary = namedtuple('DashboardSummary', [
+    'avg_duration',    # minutes, over the window
+    'avg_quality',     # 1-10 rating, over the window
+    'last_start',      # most recent session, or None if the user has none
+    'last_end',
+    'last_duration',
+])
+DashboardSummary.__doc__ = "Averages for the recent window plus the latest sleep session."
+
+
+def dashboard_query(backend):
+    """SQL returning every dashboard figure as one row."""
+    last_session = backend.limit('''
+        SELECT sleep_start_time, sleep_end_time, duration
+        FROM Sleep_Sessions
+        WHERE user_id = ?
+        ORDER BY sleep_start_time DESC
+    ''', 1)
+    # Window averages come from the per-day rollup rather than raw sessions
+    return f'''
+    SELECT
+        w.total_minutes * 1.0 / NULLIF(w.session_count, 0) AS avg_duration,
+        w.rating_sum * 1.0 / NULLIF(w.rating_count, 0) AS avg_quality,
+        ls.sleep_start_time, ls.sleep_end_time, ls.duration
+    FROM (SELECT SUM(total_minutes) AS total_minutes, SUM(session_count) AS session_count,
+                 SUM(rating_sum) AS rating_sum, SUM(rating_count) AS rating_count
+          FROM Daily_Sleep_Summary
+          WHERE user_id = ? AND date >= ?) w
+    LEFT JOIN ({last_session}) ls ON 1 = 1
+    '''
+
+
+@query_name('dashboard.summary')
+def fetch_dashboard_summary(conn, backend, user_id, days=7):
+    """Load the DashboardSummary for ``user_id`` over the last ``days`` days."""
+    cursor = conn.cursor()
+    cursor.execute(dashboard_query(backend), (user_id, window_start(days), user_id))
+    return DashboardSummary(*cursor.fetchone())
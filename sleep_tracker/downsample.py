@@ -0,0 +1,104 @@
+"""Downsampling of long time series before they are plotted.
+
+Both modes return indices into the input, so the caller keeps real data
+points. ``lttb`` (Largest-Triangle-Three-Buckets) preserves the visual shape
+of a series; ``minmax`` keeps every bucket's extremes, so spikes survive.
+``spread_band`` aggregates equal-count buckets into a min/max envelope.
+Points with a NaN ``y`` are skipped once a series is reduced.
+"""
+import numpy as np
+
+# Series longer than this are reduced to roughly the axes width in pixels
+DOWNSAMPLE_THRESHOLD = 1000
+
+
+def _as_float(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(float)
+    return x.astype(float)
+
+
+def _bucket_edges(count, buckets):
+    return np.linspace(0, count, buckets + 1).astype(np.int64)
+
+
+def lttb(x, y, target):
+    """Indices of ``target`` points chosen by Largest-Triangle-Three-Buckets."""
+    x = _as_float(x)
+    y = np.asarray(y, dtype=float)
+    count = len(x)
+    if target >= count or target < 3:
+        return np.arange(count)
+
+    # Interior points split into target - 2 buckets; first and last are always kept
+    edges = 1 + _bucket_edges(count - 2, target - 2)
+    starts, ends = edges[:-1], edges[1:]
+
+    # Average point of each following bucket, via prefix sums (the last uses the end point)
+    sum_x = np.concatenate(([0.0], np.cumsum(x)))
+    sum_y = np.concatenate(([0.0], np.cumsum(y)))
+    sizes = ends - starts
+    next_x = np.append(((sum_x[ends] - sum_x[starts]) / sizes)[1:], x[-1])
+    next_y = np.append(((sum_y[ends] - sum_y[starts]) / sizes)[1:], y[-1])
+
+    selected = np.empty(target, dtype=np.int64)
+    selected[0], selected[-1] = 0, count - 1
+    a = 0
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        bx, by = x[start:end], y[start:end]
+        # Twice the triangle area; the constant factor does not change the argmax
+        area = np.abs((x[a] - next_x[i]) * (by - y[a]) - (x[a] - bx) * (next_y[i] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(x, y, target):
+    """Indices of the minimum and maximum of ``target // 2`` equal-count buckets."""
+    y = np.asarray(y, dtype=float)
+    count = len(y)
+    buckets = target // 2
+    if target >= count or buckets < 1:
+        return np.arange(count)
+
+    edges = _bucket_edges(count, buckets)
+    bucket = np.repeat(np.arange(buckets), np.diff(edges))
+    # Sorted by (bucket, y): each bucket's first entry is its min, its last its max
+    order = np.lexsort((y, bucket))
+    return np.unique(np.concatenate((order[edges[:-1]], order[edges[1:] - 1])))
+
+
+MODES = {
+    'lttb': lttb,
+    'minmax': minmax,
+}
+
+
+def downsample(x, y, target, mode='lttb', threshold=DOWNSAMPLE_THRESHOLD):
+    """Return ``(x, y)`` reduced to about ``target`` points if longer than ``threshold``.
+
+    Short series come back unchanged, NaN gaps included.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    if len(x) <= max(threshold, target):
+        return x, y
+    keep = ~np.isnan(y)
+    x, y = x[keep], y[keep]
+    index = MODES[mode](x, y, target)
+    return x[index], y[index]
+
+
+def spread_band(x, y, buckets):
+    """Per-bucket ``(x, low, high)`` envelope of ``y`` over ``buckets`` equal-count buckets."""
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    keep = ~np.isnan(y)
+    x, y = x[keep], y[keep]
+    if not len(y):
+        return x, y, y
+    edges = _bucket_edges(len(y), min(buckets, len(y)))
+    starts = edges[:-1]
+    middle = starts + (edges[1:] - starts) // 2
+    return x[middle], np.minimum.reduceat(y, starts), np.maximum.reduceat(y, starts)
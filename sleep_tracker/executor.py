@@ -0,0 +1,88 @@
+"""Thread-pool executor whose results are delivered back on the Tk thread."""
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TaskExecutor:
+    """Run blocking work off the UI thread and call back on the UI thread.
+
+    Workers never touch Tk: finished futures are queued and drained by a
+    ``root.after`` poll that only runs while tasks are outstanding. Tasks
+    submitted with a ``key`` supersede earlier tasks with the same key, whose
+    callbacks are then dropped (and which are cancelled if not yet running).
+    """
+
+    def __init__(self, root, max_workers=4, poll_interval=15):
+        self.root = root
+        self.poll_interval = poll_interval
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sleep-worker')
+        self._done = queue.SimpleQueue()
+        self._latest = {}     # key -> future that is allowed to report back
+        self._pending = 0     # futures whose callbacks have not been delivered
+        self._lock = threading.Lock()
+        self._polling = False
+
+    def submit(self, fn, *args, key=None, on_success=None, on_error=None, **kwargs):
+        """Run ``fn(*args, **kwargs)`` on a worker thread and return its future."""
+        future = self._pool.submit(fn, *args, **kwargs)
+        with self._lock:
+            if key is not None:
+                stale = self._latest.get(key)
+                if stale is not None:
+                    stale.cancel()
+                self._latest[key] = future
+            self._pending += 1
+        future.add_done_callback(lambda f: self._done.put((f, key, on_success, on_error)))
+        self._schedule_poll()
+        return future
+
+    def cancel(self, key=None):
+        """Drop callbacks for ``key``, or for every keyed task if ``key`` is None."""
+        with self._lock:
+            keys = list(self._latest) if key is None else [key]
+            for name in keys:
+                future = self._latest.pop(name, None)
+                if future is not None:
+                    future.cancel()
+
+    def is_pending(self, key):
+        """True while the latest task submitted with ``key`` has not reported back."""
+        with self._lock:
+            return key in self._latest
+
+    def shutdown(self):
+        """Stop accepting work; queued tasks are cancelled."""
+        self.cancel()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _schedule_poll(self):
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_interval, self._poll)
+
+    def _poll(self):
+        self._polling = False
+        try:
+            while True:
+                try:
+                    future, key, on_success, on_error = self._done.get_nowait()
+                except queue.Empty:
+                    break
+                with self._lock:
+                    self._pending -= 1
+                    current = key is None or self._latest.get(key) is future
+                    if current and key is not None:
+                        del self._latest[key]
+                if not current or future.cancelled():
+                    continue
+                error = future.exception()
+                if error is None:
+                    if on_success is not None:
+                        on_success(future.result())
+                elif on_error is not None:
+                    on_error(error)
+        finally:
+            # A failing callback must not stop delivery of the others
+            if self._pending:
+                self._schedule_poll()
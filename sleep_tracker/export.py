@@ -0,0 +1,135 @@
+"""Streaming export of sleep history to CSV or Parquet.
+
+Rows are pulled from the database with ``fetchmany`` and written out batch by
+batch, so memory use depends on the batch size rather than the history size.
+"""
+import argparse
+import csv
+import os
+
+from sleep_tracker.storage import load_backend
+
+BATCH_SIZE = 10000
+
+EXPORT_COLUMNS = [
+    'session_id', 'user_id', 'date', 'sleep_start_time', 'sleep_end_time', 'duration',
+    'rating', 'times_woken', 'notes',
+    'caffeine_intake', 'exercise', 'screen_time_before_bed', 'stress_level',
+]
+
+EXPORT_QUERY = '''
+SELECT ss.session_id, ss.user_id, ss.date, ss.sleep_start_time, ss.sleep_end_time, ss.duration,
+       sq.rating, sq.times_woken, sq.notes,
+       sf.caffeine_intake, sf.exercise, sf.screen_time_before_bed, sf.stress_level
+FROM Sleep_Sessions ss
+LEFT JOIN Sleep_Quality sq ON ss.session_id = sq.session_id
+LEFT JOIN Sleep_Factors sf ON ss.session_id = sf.session_id
+{where}
+ORDER BY ss.session_id
+'''
+
+
+def iter_batches(conn, user_id=None, batch_size=BATCH_SIZE):
+    """Yield lists of export rows, ``batch_size`` at a time."""
+    cursor = conn.cursor()
+    if user_id is None:
+        cursor.execute(EXPORT_QUERY.format(where=''))
+    else:
+        cursor.execute(EXPORT_QUERY.format(where='WHERE ss.user_id = ?'), (user_id,))
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield rows
+
+
+def export_csv(conn, path, user_id=None, batch_size=BATCH_SIZE, progress=None):
+    """Write the export to a CSV file; returns the number of rows written."""
+    written = 0
+    with open(path, 'w', newline='', encoding='utf-8') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in iter_batches(conn, user_id, batch_size):
+            writer.writerows(rows)
+            written += len(rows)
+            if progress is not None:
+                progress(written)
+    return written
+
+
+def _parquet_schema(pa):
+    return pa.schema([
+        ('session_id', pa.int32()),
+        ('user_id', pa.int32()),
+        ('date', pa.date32()),
+        ('sleep_start_time', pa.timestamp('us')),
+        ('sleep_end_time', pa.timestamp('us')),
+        ('duration', pa.int32()),
+        ('rating', pa.int8()),
+        ('times_woken', pa.int16()),
+        ('notes', pa.string()),
+        ('caffeine_intake', pa.bool_()),
+        ('exercise', pa.bool_()),
+        ('screen_time_before_bed', pa.int16()),
+        ('stress_level', pa.int8()),
+    ])
+
+
+def export_parquet(conn, path, user_id=None, batch_size=BATCH_SIZE, progress=None):
+    """Write the export to a Parquet file, one row group per batch.
+
+    Requires the optional ``pyarrow`` package.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)") from e
+
+    schema = _parquet_schema(pa)
+    flags = {'caffeine_intake', 'exercise'}  # BIT/BOOLEAN may arrive as 0/1
+    written = 0
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        for rows in iter_batches(conn, user_id, batch_size):
+            columns = []
+            for field, values in zip(schema, zip(*rows)):
+                if field.name in flags:
+                    values = [None if v is None else bool(v) for v in values]
+                columns.append(pa.array(values, type=field.type))
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+            written += len(rows)
+            if progress is not None:
+                progress(written)
+    return written
+
+
+EXPORTERS = {
+    'csv': export_csv,
+    'parquet': export_parquet,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export sleep history to CSV or Parquet.")
+    parser.add_argument('path', help="output file (.csv or .parquet)")
+    parser.add_argument('--user-id', type=int, help="only export this user (default: everyone)")
+    parser.add_argument('--format', choices=sorted(EXPORTERS),
+                        help="output format (default: from the file extension)")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    fmt = args.format or os.path.splitext(args.path)[1].lstrip('.').lower()
+    if fmt not in EXPORTERS:
+        parser.error(f"Cannot infer export format from {args.path!r}; pass --format")
+
+    conn = load_backend().connect()
+    try:
+        count = EXPORTERS[fmt](conn, args.path, args.user_id, args.batch_size,
+                               progress=lambda n: print(f"  {n:,} rows", flush=True))
+        print(f"Exported {count:,} rows to {args.path}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
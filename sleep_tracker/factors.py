@@ -0,0 +1,195 @@
+"""Impact of sleep factors on sleep duration and rating.
+
+``analyze`` takes any frame with the factor and outcome columns (an export,
+or a frame built by a script) and returns one row per factor level and
+outcome: count, mean with a 95% confidence interval, the difference from the
+factor's baseline (its first level with data) with a Welch interval, and
+Cohen's d. Continuous factors are binned. All levels of all factors are
+aggregated together with ``np.bincount`` over one offset code array, so the
+cost is a few vectorized passes regardless of how many factors there are.
+
+The app does not build a frame for this: the Statistics tab gets the same
+per-level count, sum and sum of squares from SQL (``aggregates``) or, for
+long histories, from ``streaming``, and both pass them to
+``level_statistics`` so their rows match ``analyze``.
+"""
+import argparse
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from sleep_tracker.frames import compact
+
+Factor = namedtuple('Factor', ['column', 'label', 'bins', 'levels'])
+
+# bins are left edges for continuous factors; None means a 0/1 flag
+FACTORS = (
+    Factor('caffeine_intake', 'Caffeine', None, ('No', 'Yes')),
+    Factor('exercise', 'Exercise', None, ('No', 'Yes')),
+    Factor('screen_time_before_bed', 'Screen time (min)', (0, 15, 30, 60, 120),
+           ('0-14', '15-29', '30-59', '60-119', '120+')),
+    Factor('stress_level', 'Stress level', (1, 4, 7), ('1-3', '4-6', '7-10')),
+    Factor('times_woken', 'Times woken', (0, 1, 2, 3), ('0', '1', '2', '3+')),
+)
+
+OUTCOMES = ('duration', 'rating')
+
+RESULT_COLUMNS = [
+    'factor', 'level', 'outcome', 'baseline', 'n', 'mean', 'ci_low', 'ci_high',
+    'delta', 'delta_ci_low', 'delta_ci_high', 'effect_size',
+]
+
+Z_95 = 1.959964
+
+
+def _codes(frame, factor):
+    """Level index of every row for ``factor`` (-1 where unknown)."""
+    if factor.column not in frame.columns:
+        return np.full(len(frame), -1, dtype=np.int64)
+    values = pd.to_numeric(frame[factor.column], errors='coerce').to_numpy(dtype=float,
+                                                                          na_value=np.nan)
+    if factor.bins is None:
+        codes = (values != 0).astype(np.int64)
+    else:
+        codes = np.searchsorted(np.asarray(factor.bins, dtype=float), values, side='right') - 1
+    codes[np.isnan(values)] = -1
+    return codes
+
+
+def _layout(factors):
+    sizes = np.array([len(factor.levels) for factor in factors])
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    return sizes, offsets
+
+
+def level_statistics(factors, outcome, n, sums, squares, center=0.0):
+    """Result rows for one outcome from per-level count, sum and sum of squares.
+
+    The arrays hold every level of every factor back to back (in ``factors``
+    order). ``sums`` and ``squares`` may be taken around ``center``.
+    """
+    sizes, offsets = _layout(factors)
+    total = int(sizes.sum())
+    level_factor = np.repeat(np.arange(len(factors)), sizes)
+    n = np.asarray(n, dtype=float)
+
+    # Each factor's baseline is its first level that has observations
+    firsts = np.array([offset + int(np.argmax(n[offset:offset + size] > 0))
+                       for offset, size in zip(offsets, sizes)])
+    baseline = firsts[level_factor]
+    is_baseline = np.arange(total) == baseline
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sums / n
+        var = np.maximum(squares - sums * mean, 0) / (n - 1)
+        sem = np.sqrt(var / n)
+        delta = mean - mean[baseline]
+        delta_se = np.sqrt(var / n + (var / n)[baseline])
+        pooled = np.sqrt(((n - 1) * var + (n - 1)[baseline] * var[baseline])
+                         / (n + n[baseline] - 2))
+        effect = delta / pooled
+    # A baseline has no difference to itself to put an interval on
+    delta_se[is_baseline] = np.nan
+
+    return pd.DataFrame({
+        'factor': [factors[i].label for i in level_factor],
+        'level': [level for factor in factors for level in factor.levels],
+        'outcome': outcome,
+        'baseline': is_baseline,
+        'n': n.astype(np.int64),
+        'mean': mean + center,
+        'ci_low': mean + center - Z_95 * sem,
+        'ci_high': mean + center + Z_95 * sem,
+        'delta': delta,
+        'delta_ci_low': delta - Z_95 * delta_se,
+        'delta_ci_high': delta + Z_95 * delta_se,
+        'effect_size': effect,
+    })[n > 0]
+
+
+def combine(pieces):
+    """Concatenate per-outcome results into one frame (RESULT_COLUMNS)."""
+    if not pieces:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    return compact(pd.concat(pieces, ignore_index=True))
+
+
+def level_ids(frame, factors=FACTORS):
+    """Global level id of every (factor, row) pair, factor-major, and the level count.
+
+    Ids index the levels of all factors back to back; a missing factor value
+    gets the spare id equal to the level count.
+    """
+    sizes, offsets = _layout(factors)
+    total = int(sizes.sum())
+    codes = np.vstack([_codes(frame, factor) for factor in factors])
+    return np.where(codes >= 0, codes + offsets[:, None], total).ravel(), total
+
+
+def analyze(frame, factors=FACTORS, outcomes=OUTCOMES):
+    """Per-level outcome statistics for every factor, as a DataFrame (RESULT_COLUMNS)."""
+    flat_ids, total = level_ids(frame, factors)
+
+    pieces = []
+    for outcome in outcomes:
+        y = pd.to_numeric(frame[outcome], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        known = ~np.isnan(y)
+        if not known.any():
+            continue
+        # Centering first keeps sum-of-squares variance numerically stable
+        center = y[known].mean()
+        deviations = np.where(known, y - center, 0.0)
+        # Rows without the outcome keep their level id but carry zero weight
+        weights = np.tile(deviations, len(factors))
+        n = np.bincount(flat_ids, weights=np.tile(known.astype(float), len(factors)),
+                        minlength=total + 1)[:total]
+        sums = np.bincount(flat_ids, weights=weights, minlength=total + 1)[:total]
+        squares = np.bincount(flat_ids, weights=weights * weights, minlength=total + 1)[:total]
+        pieces.append(level_statistics(factors, outcome, n, sums, squares, center))
+    return combine(pieces)
+
+
+def synthetic_frame(rows, seed=0):
+    """Random frame with the analyzed columns, for benchmarking."""
+    rng = np.random.default_rng(seed)
+    stress = rng.integers(1, 11, rows)
+    caffeine = rng.random(rows) < 0.4
+    duration = rng.normal(7.5, 1.0, rows) - 0.4 * caffeine - 0.05 * stress
+    rating = np.clip(np.round(rng.normal(7, 1.5, rows) - 0.2 * stress + 0.5 * duration - 3.75), 1, 10)
+    return pd.DataFrame({
+        'duration': duration,
+        'rating': rating,
+        'caffeine_intake': caffeine,
+        'exercise': rng.random(rows) < 0.5,
+        'screen_time_before_bed': rng.integers(0, 180, rows),
+        'stress_level': stress,
+        'times_woken': rng.poisson(1.0, rows),
+    })
+
+
+def benchmark(rows=1_000_000, repeat=5, seed=0):
+    """Best wall time in seconds of ``analyze`` over a synthetic frame."""
+    frame = synthetic_frame(rows, seed)
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        analyze(frame)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the sleep factor analysis.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    for rows in args.rows:
+        seconds = benchmark(rows, args.repeat)
+        print(f"{rows:>12,} rows: {seconds * 1000:8.1f} ms ({rows / seconds:,.0f} rows/sec)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Compact, typed DataFrames built straight from cursor rows.
+
+``pd.read_sql_query`` infers object and float64 columns for dates, ratings,
+BIT flags and nullable integers. ``frame_from_rows`` instead maps each known
+schema column to the narrowest dtype that holds it: datetime64 for dates and
+times, nullable Int8/Int16/Int32 for small integers (widened automatically if
+a value would not fit), nullable boolean for flags and category for label
+columns. Columns are converted with one NumPy call each, without the
+per-row work of the pandas SQL reader.
+"""
+import numpy as np
+import pandas as pd
+
+DTYPES = {
+    'session_id': 'Int32',
+    'user_id': 'Int32',
+    'date': 'datetime64[ns]',
+    'sleep_start_time': 'datetime64[ns]',
+    'sleep_end_time': 'datetime64[ns]',
+    'duration': 'Int16',                # minutes
+    'rating': 'Int8',
+    'times_woken': 'Int8',
+    'screen_time_before_bed': 'Int16',
+    'stress_level': 'Int8',
+    'caffeine_intake': 'boolean',
+    'exercise': 'boolean',
+    'factor': 'category',
+    'level': 'category',
+    'outcome': 'category',
+    'notes': 'string',
+}
+
+# Wider fallbacks for integer columns whose values overflow the compact type
+_WIDER = {'Int8': 'Int16', 'Int16': 'Int32', 'Int32': 'Int64'}
+
+
+def _integers(values, dtype):
+    data = np.asarray(values, dtype=float)   # None -> NaN
+    mask = np.isnan(data)
+    if not mask.all():
+        low, high = data[~mask].min(), data[~mask].max()
+        while dtype in _WIDER:
+            info = np.iinfo(dtype.lower())
+            if info.min <= low and high <= info.max:
+                break
+            dtype = _WIDER[dtype]
+    return pd.arrays.IntegerArray(np.where(mask, 0, data).astype(dtype.lower()), mask)
+
+
+def _flags(values):
+    data = np.asarray(values, dtype=float)
+    mask = np.isnan(data)
+    return pd.arrays.BooleanArray(np.where(mask, 0, data) != 0, mask)
+
+
+def _column(values, dtype):
+    if dtype is None:
+        return pd.array(list(values))
+    if dtype in _WIDER:
+        return _integers(values, dtype)
+    if dtype == 'boolean':
+        return _flags(values)
+    if dtype.startswith('datetime64'):
+        sample = next((value for value in values if value is not None), None)
+        if isinstance(sample, str):
+            try:
+                return np.asarray(values, dtype=dtype)
+            except ValueError:
+                pass
+        # date/datetime objects: pandas converts these far faster than numpy does
+        return pd.to_datetime(pd.Series(values, dtype=object)).to_numpy(dtype=dtype)
+    return pd.array(list(values), dtype=dtype)
+
+
+def frame_from_rows(rows, columns, dtypes=DTYPES):
+    """DataFrame from a sequence of row tuples, typed by ``dtypes`` where known."""
+    data = list(zip(*rows)) if rows else [()] * len(columns)
+    return pd.DataFrame({
+        column: _column(values, dtypes.get(column)) for column, values in zip(columns, data)
+    })
+
+
+def fetch_frame(cursor, query, params=(), dtypes=DTYPES):
+    """Run ``query`` and return its result as a typed frame."""
+    cursor.execute(query, params)
+    columns = [description[0] for description in cursor.description]
+    return frame_from_rows(cursor.fetchall(), columns, dtypes)
+
+
+def compact(frame, dtypes=DTYPES):
+    """Cast the known columns of an existing frame to their compact dtypes."""
+    frame = frame.copy()
+    for column in frame.columns.intersection(list(dtypes)):
+        dtype = dtypes[column]
+        if str(frame[column].dtype) == dtype:
+            continue
+        if dtype in _WIDER:
+            values = pd.to_numeric(frame[column], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+            frame[column] = _integers(values, dtype)
+        elif dtype == 'boolean':
+            values = pd.to_numeric(frame[column], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+            frame[column] = _flags(values)
+        elif dtype.startswith('datetime64'):
+            frame[column] = pd.to_datetime(frame[column]).astype(dtype)
+        else:
+            frame[column] = frame[column].astype(dtype)
+    return frame
+
+
+def as_float(series):
+    """Float64 NumPy array of a (possibly nullable) column, with NaN for missing."""
+    return series.to_numpy(dtype=float, na_value=np.nan)
@@ -0,0 +1,42 @@
+"""Keyset-paginated access to a user's sleep history."""
+from sleep_tracker.instrumentation import query_name
+
+PAGE_SIZE = 100
+
+# Newest first; session_id breaks ties between sessions starting at the same time
+HISTORY_QUERY = '''
+SELECT ss.session_id, ss.date, ss.sleep_start_time, ss.sleep_end_time, ss.duration, sq.rating
+FROM Sleep_Sessions ss
+LEFT JOIN Sleep_Quality sq ON ss.session_id = sq.session_id
+WHERE ss.user_id = ?{after}
+ORDER BY ss.date DESC, ss.sleep_start_time DESC, ss.session_id DESC
+'''
+
+AFTER_CLAUSE = '''
+  AND (ss.date < ?
+       OR (ss.date = ? AND (ss.sleep_start_time < ?
+                            OR (ss.sleep_start_time = ? AND ss.session_id < ?))))'''
+
+
+def page_key(row):
+    """Keyset position of a history row, to pass back as ``after``."""
+    session_id, day, start_time = row[0], row[1], row[2]
+    return day, start_time, session_id
+
+
+@query_name('history.page')
+def fetch_history_page(conn, backend, user_id, after=None, page_size=PAGE_SIZE):
+    """Fetch up to ``page_size`` history rows older than the ``after`` key.
+
+    Rows are ``(session_id, date, start, end, duration, rating)``. Each page
+    seeks straight to its position through the (user_id, date, start) index,
+    so the cost does not grow with how far back the user has scrolled.
+    """
+    cursor = conn.cursor()
+    if after is None:
+        cursor.execute(backend.limit(HISTORY_QUERY.format(after=''), page_size), (user_id,))
+    else:
+        day, start_time, session_id = after
+        cursor.execute(backend.limit(HISTORY_QUERY.format(after=AFTER_CLAUSE), page_size),
+                       (user_id, day, day, start_time, start_time, session_id))
+    return cursor.fetchall()
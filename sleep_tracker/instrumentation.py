@@ -0,0 +1,372 @@
+"""Query instrumentation: per-statement latency and row-count histograms.
+
+Pooled connections are wrapped in ``InstrumentedConnection``; its cursors
+time every connect, execute and fetch and record the result into log-linear
+histograms (HdrHistogram's bucket layout: about 1% relative error at any
+magnitude, fixed memory, mergeable). Statements are grouped under a logical
+name set with ``query_name`` (``with query_name('history.page'):`` or as a
+decorator). Untagged statements are named after their verb and table, e.g.
+``select.Users``.
+
+Statements slower than ``SLOW_QUERY_MS`` (``SLEEP_TRACKER_SLOW_QUERY_MS``)
+are logged as warnings on the ``sleep_tracker.queries`` logger, and to the
+file named by ``SLEEP_TRACKER_SLOW_QUERY_LOG`` if set. ``QUERY_STATS.dump()``
+writes every histogram as JSON; ``python -m sleep_tracker.instrumentation``
+prints a saved dump as a table.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
+SLOW_QUERY_MS = float(os.environ.get('SLEEP_TRACKER_SLOW_QUERY_MS', 100))
+SLOW_QUERY_LOG = os.environ.get('SLEEP_TRACKER_SLOW_QUERY_LOG')
+DUMP_PATH = os.environ.get(
+    'SLEEP_TRACKER_QUERY_STATS',
+    os.path.join(os.path.expanduser('~'), '.cache', 'sleep_tracker', 'query_stats.json'),
+)
+
+# Phases recorded per statement name; latencies are in microseconds
+PHASES = ('connect', 'execute', 'fetch', 'rows')
+
+logger = logging.getLogger('sleep_tracker.queries')
+
+_current_name = ContextVar('query_name', default=None)
+
+
+class Histogram:
+    """Log-linear histogram of non-negative integers, as in HdrHistogram.
+
+    Values below ``2 ** precision`` are counted exactly; above that each
+    power of two is split into ``2 ** (precision - 1)`` equal buckets, so a
+    reported value is within ``2 ** (1 - precision)`` of the true one.
+    Buckets are stored sparsely.
+    """
+
+    def __init__(self, precision=7):
+        self.precision = precision
+        self.counts = {}    # bucket index -> count
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        shift = max(value.bit_length() - self.precision, 0)
+        return (shift << self.precision) | (value >> shift)
+
+    def _value(self, index):
+        # Highest value that falls in the bucket, as HdrHistogram reports
+        shift = index >> self.precision
+        top = index & ((1 << self.precision) - 1)
+        return ((top + 1) << shift) - 1
+
+    def record(self, value, count=1):
+        value = max(int(value), 0)
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for bound, pick in (('min', min), ('max', max)):
+            ours, theirs = getattr(self, bound), getattr(other, bound)
+            setattr(self, bound, theirs if ours is None else ours if theirs is None
+                    else pick(ours, theirs))
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p):
+        """Value at or below which ``p`` percent of recordings fall (0 when empty)."""
+        if not self.count:
+            return 0
+        rank = max(1, -(-self.count * p // 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._value(index), self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'precision': self.precision, 'count': self.count, 'total': self.total,
+                'min': self.min, 'max': self.max,
+                'counts': [[index, count] for index, count in sorted(self.counts.items())]}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data['precision'])
+        histogram.counts = {index: count for index, count in data['counts']}
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
+
+
+class QueryStats:
+    """Thread-safe registry of histograms keyed by statement name and phase."""
+
+    def __init__(self, slow_ms=SLOW_QUERY_MS):
+        self.slow_ms = slow_ms
+        self._histograms = {}   # (name, phase) -> Histogram
+        self._lock = threading.Lock()
+
+    def record(self, name, phase, value):
+        with self._lock:
+            histogram = self._histograms.get((name, phase))
+            if histogram is None:
+                histogram = self._histograms[(name, phase)] = Histogram()
+            histogram.record(value)
+
+    def histogram(self, name, phase):
+        """A copy of one histogram (empty if nothing was recorded)."""
+        copy = Histogram()
+        with self._lock:
+            if (name, phase) in self._histograms:
+                copy.merge(self._histograms[(name, phase)])
+        return copy
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def to_dict(self):
+        with self._lock:
+            stats = {}
+            for (name, phase), histogram in sorted(self._histograms.items()):
+                stats.setdefault(name, {})[phase] = histogram.to_dict()
+        return {'unit': 'us', 'queries': stats}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        for name, phases in data['queries'].items():
+            for phase, histogram in phases.items():
+                stats._histograms[(name, phase)] = Histogram.from_dict(histogram)
+        return stats
+
+    def dump(self, path=DUMP_PATH):
+        """Write every histogram to ``path`` as JSON and return the path."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        return path
+
+    def report(self):
+        """Table of p50/p95/p99/max per statement and phase, slowest total first."""
+        histograms = {}
+        with self._lock:
+            for key, histogram in self._histograms.items():
+                histograms[key] = Histogram(histogram.precision)
+                histograms[key].merge(histogram)
+        spent = {}
+        for (name, phase), histogram in histograms.items():
+            if phase != 'rows':
+                spent[name] = spent.get(name, 0) + histogram.total
+
+        lines = [f"{'query':<28} {'phase':<8} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} "
+                 f"{'p99 ms':>9} {'max ms':>9} {'total ms':>9}"]
+        for name in sorted(spent, key=spent.get, reverse=True):
+            for phase in PHASES:
+                histogram = histograms.get((name, phase))
+                if histogram is None:
+                    continue
+                if phase == 'rows':
+                    lines.append(f"{'':<28} {phase:<8} {histogram.count:>7} "
+                                 f"{histogram.percentile(50):>9} {histogram.percentile(95):>9} "
+                                 f"{histogram.percentile(99):>9} {histogram.max:>9} "
+                                 f"{histogram.total:>9}")
+                    continue
+                p50, p95, p99 = (histogram.percentile(p) / 1000 for p in (50, 95, 99))
+                lines.append(f"{name:<28} {phase:<8} {histogram.count:>7} {p50:>9.2f} {p95:>9.2f} "
+                             f"{p99:>9.2f} {histogram.max / 1000:>9.2f} "
+                             f"{histogram.total / 1000:>9.1f}")
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.report()
+
+
+QUERY_STATS = QueryStats()
+
+
+@contextmanager
+def query_name(name):
+    """Record statements executed inside the block (or decorated call) under ``name``."""
+    token = _current_name.set(name)
+    try:
+        yield
+    finally:
+        _current_name.reset(token)
+
+
+_VERB = re.compile(r'^\s*(?:WITH\b.*?\)\s*)?(\w+)', re.IGNORECASE | re.DOTALL)
+_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE)\s+([\w.\[\]#]+)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=256)
+def statement_name(sql):
+    """Fallback name for an untagged statement: its verb and first table."""
+    verb = _VERB.match(sql)
+    table = _TABLE.search(sql)
+    name = verb.group(1).lower() if verb else 'sql'
+    return f"{name}.{table.group(1).strip('[]')}" if table else name
+
+
+def configure_slow_log(path=SLOW_QUERY_LOG):
+    """Also write slow statements to ``path`` (no-op when unset or already attached)."""
+    if not path:
+        return
+    path = os.path.abspath(path)
+    if any(getattr(handler, 'baseFilename', None) == path for handler in logger.handlers):
+        return
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    logger.addHandler(handler)
+
+
+class InstrumentedCursor:
+    """DB-API cursor proxy that times execute and fetch calls.
+
+    ``execute`` and ``executemany`` return the proxy, so chained calls such
+    as ``cursor.execute(...).fetchval()`` are timed too. Every other
+    attribute, including assignments like ``fast_executemany``, goes to the
+    wrapped cursor.
+    """
+
+    _own = ('_cursor', '_stats', '_name', '_sql')
+
+    def __init__(self, cursor, stats=QUERY_STATS):
+        object.__setattr__(self, '_cursor', cursor)
+        object.__setattr__(self, '_stats', stats)
+        object.__setattr__(self, '_name', None)
+        object.__setattr__(self, '_sql', None)
+
+    def __getattr__(self, attr):
+        return getattr(self._cursor, attr)
+
+    def __setattr__(self, attr, value):
+        if attr in self._own:
+            object.__setattr__(self, attr, value)
+        else:
+            setattr(self._cursor, attr, value)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def execute(self, sql, *params):
+        return self._run(self._cursor.execute, sql, params)
+
+    def executemany(self, sql, *params):
+        return self._run(self._cursor.executemany, sql, params)
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, *size):
+        return self._fetch(self._cursor.fetchmany, *size)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def fetchval(self):
+        return self._fetch(self._cursor.fetchval, scalar=True)
+
+    def _run(self, method, sql, params):
+        self._name = _current_name.get() or statement_name(sql)
+        self._sql = sql
+        started = time.perf_counter()
+        method(sql, *params)
+        self._observe('execute', started)
+        return self
+
+    def _fetch(self, method, *args, scalar=False):
+        started = time.perf_counter()
+        result = method(*args)
+        if scalar or not isinstance(result, list):
+            rows = int(result is not None)
+        else:
+            rows = len(result)
+        self._observe('fetch', started, rows)
+        return result
+
+    def _observe(self, phase, started, rows=None):
+        elapsed_us = (time.perf_counter() - started) * 1e6
+        name = self._name or 'unnamed'
+        self._stats.record(name, phase, elapsed_us)
+        if rows is not None:
+            self._stats.record(name, 'rows', rows)
+        if elapsed_us >= self._stats.slow_ms * 1000:
+            statement = ' '.join((self._sql or '').split())
+            logger.warning("slow %s %s: %.1f ms%s | %.300s", phase, name, elapsed_us / 1000,
+                           '' if rows is None else f", {rows} rows", statement)
+
+
+class InstrumentedConnection:
+    """DB-API connection proxy whose cursors are ``InstrumentedCursor``."""
+
+    def __init__(self, conn, stats=QUERY_STATS):
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_stats', stats)
+
+    def __getattr__(self, attr):
+        return getattr(self._conn, attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._conn, attr, value)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._stats)
+
+    def execute(self, sql, *params):
+        # sqlite3's shortcut; a fresh cursor per call, as sqlite3 does
+        return self.cursor().execute(sql, *params)
+
+    def unwrap(self):
+        """The underlying DB-API connection."""
+        return self._conn
+
+
+def instrument(connect, stats=QUERY_STATS, name='connection'):
+    """Wrap a ``connect`` callable so it is timed and returns instrumented connections."""
+    configure_slow_log()
+
+    def instrumented_connect():
+        started = time.perf_counter()
+        conn = connect()
+        elapsed_us = (time.perf_counter() - started) * 1e6
+        stats.record(name, 'connect', elapsed_us)
+        if elapsed_us >= stats.slow_ms * 1000:
+            logger.warning("slow connect %s: %.1f ms", name, elapsed_us / 1000)
+        return InstrumentedConnection(conn, stats)
+
+    return instrumented_connect
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print a saved query statistics dump.")
+    parser.add_argument('path', nargs='?', default=DUMP_PATH)
+    args = parser.parse_args(argv)
+    with open(args.path) as f:
+        print(QueryStats.from_dict(json.load(f)).report())
+
+
+if __name__ == "__main__":
+    main()
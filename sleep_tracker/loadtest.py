@@ -0,0 +1,236 @@
+"""Load test for the HTTP API against a seeded SQLite database.
+
+Seeds a database (or reuses ``--db``), starts ``python -m
+sleep_tracker.server`` on a free port in a separate process, and runs
+hundreds of concurrent keep-alive clients from one asyncio loop here. Each
+client logs in as its own synthetic user, then issues a weighted mix of
+history pages, dashboard reads, statistics and writes for the duration of
+the run. Reported: sustained requests per second and p50/p95/p99 latency per
+operation, from ``instrumentation.Histogram``. Requests issued during the
+warm-up are not counted.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sleep_tracker.benchmarks import PASSWORD, seed_database
+from sleep_tracker.instrumentation import Histogram
+
+# Operation -> relative weight in the request mix
+MIX = (
+    ('history', 35),
+    ('dashboard', 25),
+    ('statistics', 20),
+    ('record', 15),
+    ('session', 5),
+)
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class HttpClient:
+    """One keep-alive HTTP/1.1 connection speaking JSON."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.token = None
+        self._reader = self._writer = None
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+
+    async def request(self, method, path, payload=None):
+        """``(status, decoded body)``."""
+        body = json.dumps(payload).encode() if payload is not None else b''
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(body)}\r\n"
+        if self.token:
+            head += f"Authorization: Bearer {self.token}\r\n"
+        self._writer.write(head.encode() + b"\r\n" + body)
+        await self._writer.drain()
+
+        status = int((await self._reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        return status, json.loads(await self._reader.readexactly(length))
+
+
+class LoadResults:
+    """Latency histograms (microseconds) and status counts per operation."""
+
+    def __init__(self):
+        self.latency = {}
+        self.statuses = {}
+        self.errors = 0
+
+    def record(self, operation, seconds, status):
+        self.latency.setdefault(operation, Histogram()).record(seconds * 1e6)
+        counts = self.statuses.setdefault(operation, {})
+        counts[status] = counts.get(status, 0) + 1
+
+    @property
+    def requests(self):
+        return sum(histogram.count for histogram in self.latency.values())
+
+    def report(self, seconds, clients):
+        lines = [f"{self.requests} requests from {clients} clients in {seconds:.1f}s: "
+                 f"{self.requests / seconds:.0f} req/s, {self.errors} connection errors",
+                 f"{'operation':<14} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+                 f"{'max ms':>9}  statuses"]
+        for operation, histogram in sorted(self.latency.items()):
+            p50, p95, p99 = (histogram.percentile(p) / 1000 for p in (50, 95, 99))
+            statuses = ' '.join(f"{status}x{count}"
+                                for status, count in sorted(self.statuses[operation].items()))
+            lines.append(f"{operation:<14} {histogram.count:>7} {p50:>9.1f} {p95:>9.1f} "
+                         f"{p99:>9.1f} {histogram.max / 1000:>9.1f}  {statuses}")
+        return '\n'.join(lines)
+
+
+async def _operation(client, name, rng, state):
+    """Issue one ``name`` operation; returns the (sub-)requests as (label, seconds, status)."""
+    timings = []
+
+    async def call(label, method, path, payload=None):
+        started = time.perf_counter()
+        status, body = await client.request(method, path, payload)
+        timings.append((label, time.perf_counter() - started, status))
+        return status, body
+
+    if name == 'history':
+        # First page, then sometimes keep scrolling
+        status, body = await call('history', 'GET', '/history?limit=50')
+        while status == 200 and body['next'] and rng.random() < 0.5:
+            status, body = await call('history_next', 'GET',
+                                      f"/history?limit=50&after={body['next']}")
+    elif name == 'dashboard':
+        await call('dashboard', 'GET', '/dashboard')
+    elif name == 'statistics':
+        days = rng.choice((7, 30, 90))
+        await call(f'statistics_{days}d', 'GET', f'/statistics?days={days}')
+    elif name == 'record':
+        day = date.today() - timedelta(days=rng.randrange(1, 30))
+        await call('record', 'POST', '/records', {
+            'date': day.isoformat(), 'start': f"{rng.choice((21, 22, 23))}:{rng.randrange(60):02d}",
+            'end': f"0{rng.randrange(5, 9)}:{rng.randrange(60):02d}",
+            'rating': rng.randint(1, 10), 'times_woken': rng.randrange(4),
+            'caffeine_intake': rng.random() < 0.4, 'exercise': rng.random() < 0.5,
+            'screen_time_before_bed': rng.randrange(0, 180, 15), 'stress_level': rng.randint(1, 10),
+        })
+    else:
+        # Sessions alternate between starting and ending (with a rating)
+        if not state.get('active'):
+            status, _ = await call('session_start', 'POST', '/sessions/start')
+        else:
+            status, _ = await call('session_end', 'POST', '/sessions/end',
+                                   {'quality': {'rating': rng.randint(1, 10), 'times_woken': 0}})
+        state['active'] = not state.get('active') if status in (200, 201) else state.get('active')
+    return timings
+
+
+async def _client(host, port, username, seed, start_at, warm_until, stop_at, results):
+    rng = random.Random(seed)
+    names = [name for name, _ in MIX]
+    weights = [weight for _, weight in MIX]
+    client = HttpClient(host, port)
+    try:
+        # Stagger connects so the accept queue is not hit all at once
+        await asyncio.sleep(max(0.0, start_at - time.perf_counter()))
+        await client.connect()
+        status, body = await client.request('POST', '/login',
+                                            {'username': username, 'password': PASSWORD})
+        if status != 200:
+            raise RuntimeError(f"Login as {username} failed: {body}")
+        client.token = body['token']
+        state = {}
+        while time.perf_counter() < stop_at:
+            began = time.perf_counter()
+            timings = await _operation(client, rng.choices(names, weights)[0], rng, state)
+            if began >= warm_until:
+                for label, seconds, status in timings:
+                    results.record(label, seconds, status)
+    except (ConnectionError, asyncio.IncompleteReadError):
+        results.errors += 1
+    finally:
+        await client.close()
+
+
+async def run_load(host, port, clients, users, duration, warmup, seed=0):
+    """LoadResults of ``clients`` concurrent clients over ``duration`` seconds after warm-up."""
+    results = LoadResults()
+    now = time.perf_counter()
+    warm_until = now + warmup
+    stop_at = warm_until + duration
+    await asyncio.gather(*(
+        _client(host, port, f"bench{index % users + 1}", seed + index,
+                now + warmup * index / clients / 2, warm_until, stop_at, results)
+        for index in range(clients)
+    ))
+    return results
+
+
+def start_server(db_path, workers):
+    """Server process on a free port, and that port."""
+    env = dict(os.environ, SLEEP_TRACKER_BACKEND='sqlite', SLEEP_TRACKER_SQLITE_PATH=db_path)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'sleep_tracker.server', '--port', '0', '--workers', str(workers)],
+        cwd=_ROOT, env=env, stdout=subprocess.PIPE, text=True,
+    )
+    line = process.stdout.readline()
+    if not line.startswith('Listening on'):
+        process.kill()
+        raise RuntimeError(f"Server did not start (exit code {process.poll()})")
+    return process, int(line.rsplit(':', 1)[1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the Sleep Tracker HTTP API.")
+    parser.add_argument('--db', help="seeded SQLite database to use (default: a fresh temporary one)")
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--users', type=int, default=None,
+                        help="synthetic users to seed and spread clients over (default: --clients)")
+    parser.add_argument('--nights', type=int, default=365)
+    parser.add_argument('--duration', type=float, default=30, help="measured seconds")
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--workers', type=int, default=8, help="server database threads")
+    args = parser.parse_args(argv)
+    users = args.users or args.clients
+
+    with tempfile.TemporaryDirectory(prefix='sleep-load-') as scratch:
+        db_path = args.db
+        if db_path is None or not os.path.exists(db_path):
+            db_path = db_path or os.path.join(scratch, 'load.db')
+            started = time.perf_counter()
+            seed_database(db_path, users, args.nights)
+            print(f"Seeded {users} users x {args.nights} nights in "
+                  f"{time.perf_counter() - started:.1f}s")
+
+        server, port = start_server(db_path, args.workers)
+        try:
+            results = asyncio.run(run_load('127.0.0.1', port, args.clients, users,
+                                           args.duration, args.warmup))
+        finally:
+            server.terminate()
+            server.wait()
+    print(results.report(args.duration, args.clients))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""Versioned schema migrations for the Sleep Tracker database.
+
+Each migration lists its statements per SQL dialect and is written to be
+idempotent, so a database created before Schema_Version existed (such as the
+bundled sleep_tracker.db) can be brought under version control safely.
+"""
+import argparse
+
+from sleep_tracker.instrumentation import query_name
+from sleep_tracker.storage import load_backend
+
+
+# Backfills are frozen copies of the rebuild queries as they stood when each
+# migration was released: later edits to daily_summary or moments must not
+# change what an already-applied version does.
+
+# Version 3: Daily_Sleep_Summary from the raw tables
+_DAILY_SUMMARY_BACKFILL = '''
+INSERT INTO Daily_Sleep_Summary (user_id, date, total_minutes, session_count, rating_sum,
+                                 rating_count, factor_count, caffeine_count, exercise_count,
+                                 screen_time_sum, stress_sum, stress_count)
+SELECT ss.user_id, ss.date,
+       COALESCE(SUM(ss.duration), 0), COUNT(ss.duration),
+       COALESCE(SUM(sq.rating), 0), COUNT(sq.rating),
+       COUNT(sf.factor_id),
+       SUM(CASE WHEN sf.caffeine_intake = 1 THEN 1 ELSE 0 END),
+       SUM(CASE WHEN sf.exercise = 1 THEN 1 ELSE 0 END),
+       COALESCE(SUM(sf.screen_time_before_bed), 0),
+       COALESCE(SUM(sf.stress_level), 0), COUNT(sf.stress_level)
+FROM Sleep_Sessions ss
+LEFT JOIN Sleep_Quality sq ON ss.session_id = sq.session_id
+LEFT JOIN Sleep_Factors sf ON ss.session_id = sf.session_id
+GROUP BY ss.user_id, ss.date
+'''
+
+# Version 5: per-day Sleep_Moments buckets from the raw tables
+_MOMENTS_BACKFILL = '''
+INSERT INTO Sleep_Moments (user_id, date, duration_n, duration_mean, duration_m2, rating_n,
+                           rating_mean, rating_m2, pair_n, pair_mean_x, pair_mean_y,
+                           pair_m2_x, pair_m2_y, pair_c)
+SELECT user_id, date,
+       COUNT(d), COALESCE(AVG(d), 0),
+       COALESCE(SUM(d * d) - SUM(d) * SUM(d) / NULLIF(COUNT(d), 0), 0),
+       COUNT(r), COALESCE(AVG(r), 0),
+       COALESCE(SUM(r * r) - SUM(r) * SUM(r) / NULLIF(COUNT(r), 0), 0),
+       COUNT(px), COALESCE(AVG(px), 0), COALESCE(AVG(py), 0),
+       COALESCE(SUM(px * px) - SUM(px) * SUM(px) / NULLIF(COUNT(px), 0), 0),
+       COALESCE(SUM(py * py) - SUM(py) * SUM(py) / NULLIF(COUNT(py), 0), 0),
+       COALESCE(SUM(px * py) - SUM(px) * SUM(py) / NULLIF(COUNT(px), 0), 0)
+FROM (
+    SELECT ss.user_id, ss.date,
+           CAST(ss.duration AS FLOAT) AS d,
+           CAST(sq.rating AS FLOAT) AS r,
+           CASE WHEN sq.rating IS NOT NULL THEN CAST(ss.duration AS FLOAT) END AS px,
+           CASE WHEN ss.duration IS NOT NULL THEN CAST(sq.rating AS FLOAT) END AS py
+    FROM Sleep_Sessions ss
+    LEFT JOIN Sleep_Quality sq ON ss.session_id = sq.session_id
+) s
+GROUP BY user_id, date
+'''
+
+
+class Migration:
+    """One ordered schema change."""
+
+    def __init__(self, version, name, statements):
+        self.version = version
+        self.name = name
+        self.statements = statements  # dialect -> tuple of SQL statements
+
+    def apply(self, cursor, dialect):
+        for statement in self.statements[dialect]:
+            cursor.execute(statement)
+
+
+def _mssql_index(name, table, definition):
+    return f'''
+    IF NOT EXISTS (SELECT * FROM sys.indexes
+                   WHERE name = '{name}' AND object_id = OBJECT_ID('{table}'))
+    CREATE INDEX {name} ON {table} {definition}
+    '''
+
+
+MIGRATIONS = [
+    Migration(1, 'base tables', {
+        'mssql': (
+            '''
+            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='Users' AND xtype='U')
+            CREATE TABLE Users (
+                user_id INT IDENTITY(1,1) PRIMARY KEY,
+                username NVARCHAR(50) UNIQUE NOT NULL,
+                password NVARCHAR(100) NOT NULL,
+                name NVARCHAR(100),
+                email NVARCHAR(100),
+                date_created DATETIME DEFAULT GETDATE()
+            )
+            ''',
+            '''
+            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='Sleep_Sessions' AND xtype='U')
+            CREATE TABLE Sleep_Sessions (
+                session_id INT IDENTITY(1,1) PRIMARY KEY,
+                user_id INT NOT NULL,
+                sleep_start_time DATETIME NOT NULL,
+                sleep_end_time DATETIME,
+                duration INT,
+                date DATE NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES Users (user_id)
+            )
+            ''',
+            '''
+            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='Sleep_Quality' AND xtype='U')
+            CREATE TABLE Sleep_Quality (
+                quality_id INT IDENTITY(1,1) PRIMARY KEY,
+                session_id INT NOT NULL,
+                rating INT CHECK (rating >= 1 AND rating <= 10),
+                times_woken INT DEFAULT 0,
+                notes NVARCHAR(MAX),
+                FOREIGN KEY (session_id) REFERENCES Sleep_Sessions (session_id)
+            )
+            ''',
+            '''
+            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='Sleep_Factors' AND xtype='U')
+            CREATE TABLE Sleep_Factors (
+                factor_id INT IDENTITY(1,1) PRIMARY KEY,
+                session_id INT NOT NULL,
+                caffeine_intake BIT DEFAULT 0,
+                exercise BIT DEFAULT 0,
+                screen_time_before_bed INT DEFAULT 0,
+                stress_level INT CHECK (stress_level >= 1 AND stress_level <= 10),
+                FOREIGN KEY (session_id) REFERENCES Sleep_Sessions (session_id)
+            )
+            ''',
+        ),
+        'sqlite': (
+            '''
+            CREATE TABLE IF NOT EXISTS Users (
+                user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password TEXT NOT NULL,
+                name TEXT,
+                email TEXT,
+                date_created TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS Sleep_Sessions (
+                session_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                sleep_start_time TIMESTAMP NOT NULL,
+                sleep_end_time TIMESTAMP,
+                duration INTEGER,
+                date DATE NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES Users (user_id)
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS Sleep_Quality (
+                quality_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id INTEGER NOT NULL,
+                rating INTEGER CHECK (rating >= 1 AND rating <= 10),
+                times_woken INTEGER DEFAULT 0,
+                notes TEXT,
+                FOREIGN KEY (session_id) REFERENCES Sleep_Sessions (session_id)
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS Sleep_Factors (
+                factor_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id INTEGER NOT NULL,
+                caffeine_intake BOOLEAN DEFAULT 0,
+                exercise BOOLEAN DEFAULT 0,
+                screen_time_before_bed INTEGER DEFAULT 0,
+                stress_level INTEGER CHECK (stress_level >= 1 AND stress_level <= 10),
+                FOREIGN KEY (session_id) REFERENCES Sleep_Sessions (session_id)
+            )
+            ''',
+        ),
+    }),
+    Migration(2, 'sleep query indexes', {
+        # SQL Server: narrow keys with INCLUDE columns so the hot queries are covered
+        'mssql': (
+            _mssql_index('IX_Sleep_Sessions_user_date', 'Sleep_Sessions',
+                         '(user_id, date) INCLUDE (duration)'),
+            _mssql_index('IX_Sleep_Sessions_user_start', 'Sleep_Sessions',
+                         '(user_id, sleep_start_time DESC) INCLUDE (sleep_end_time, duration)'),
+            _mssql_index('IX_Sleep_Sessions_active', 'Sleep_Sessions',
+                         '(user_id) INCLUDE (sleep_start_time) WHERE sleep_end_time IS NULL'),
+            _mssql_index('IX_Sleep_Quality_session', 'Sleep_Quality',
+                         '(session_id) INCLUDE (rating)'),
+            _mssql_index('IX_Sleep_Factors_session', 'Sleep_Factors',
+                         '(session_id) INCLUDE (caffeine_intake, exercise, '
+                         'screen_time_before_bed, stress_level)'),
+        ),
+        # SQLite has no INCLUDE, so covered columns are appended to the key
+        'sqlite': (
+            '''
+            CREATE INDEX IF NOT EXISTS IX_Sleep_Sessions_user_date
+            ON Sleep_Sessions (user_id, date, duration)
+            ''',
+            '''
+            CREATE INDEX IF NOT EXISTS IX_Sleep_Sessions_user_start
+            ON Sleep_Sessions (user_id, sleep_start_time DESC, sleep_end_time, duration)
+            ''',
+            '''
+            CREATE INDEX IF NOT EXISTS IX_Sleep_Sessions_active
+            ON Sleep_Sessions (user_id, sleep_start_time) WHERE sleep_end_time IS NULL
+            ''',
+            '''
+            CREATE INDEX IF NOT EXISTS IX_Sleep_Quality_session
+            ON Sleep_Quality (session_id, rating)
+            ''',
+            '''
+            CREATE INDEX IF NOT EXISTS IX_Sleep_Factors_session
+            ON Sleep_Factors (session_id, caffeine_intake, exercise,
+                              screen_time_before_bed, stress_level)
+            ''',
+        ),
+    }),
+    Migration(3, 'daily sleep summary', {
+        'mssql': (
+            '''
+            IF OBJECT_ID('Daily_Sleep_Summary', 'U') IS NULL
+            CREATE TABLE Daily_Sleep_Summary (
+                user_id INT NOT NULL,
+                date DATE NOT NULL,
+                total_minutes INT NOT NULL DEFAULT 0,
+                session_count INT NOT NULL DEFAULT 0,
+                rating_sum INT NOT NULL DEFAULT 0,
+                rating_count INT NOT NULL DEFAULT 0,
+                factor_count INT NOT NULL DEFAULT 0,
+                caffeine_count INT NOT NULL DEFAULT 0,
+                exercise_count INT NOT NULL DEFAULT 0,
+                screen_time_sum INT NOT NULL DEFAULT 0,
+                stress_sum INT NOT NULL DEFAULT 0,
+                stress_count INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, date),
+                FOREIGN KEY (user_id) REFERENCES Users (user_id)
+            )
+            ''',
+            "DELETE FROM Daily_Sleep_Summary",
+            _DAILY_SUMMARY_BACKFILL,
+        ),
+        'sqlite': (
+            '''
+            CREATE TABLE IF NOT EXISTS Daily_Sleep_Summary (
+                user_id INTEGER NOT NULL,
+                date DATE NOT NULL,
+                total_minutes INTEGER NOT NULL DEFAULT 0,
+                session_count INTEGER NOT NULL DEFAULT 0,
+                rating_sum INTEGER NOT NULL DEFAULT 0,
+                rating_count INTEGER NOT NULL DEFAULT 0,
+                factor_count INTEGER NOT NULL DEFAULT 0,
+                caffeine_count INTEGER NOT NULL DEFAULT 0,
+                exercise_count INTEGER NOT NULL DEFAULT 0,
+                screen_time_sum INTEGER NOT NULL DEFAULT 0,
+                stress_sum INTEGER NOT NULL DEFAULT 0,
+                stress_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, date),
+                FOREIGN KEY (user_id) REFERENCES Users (user_id)
+            ) WITHOUT ROWID
+            ''',
+            "DELETE FROM Daily_Sleep_Summary",
+            _DAILY_SUMMARY_BACKFILL,
+        ),
+    }),
+    Migration(4, 'history keyset index', {
+        'mssql': (
+            _mssql_index('IX_Sleep_Sessions_user_history', 'Sleep_Sessions',
+                         '(user_id, date DESC, sleep_start_time DESC) '
+                         'INCLUDE (sleep_end_time, duration)'),
+        ),
+        'sqlite': (
+            '''
+            CREATE INDEX IF NOT EXISTS IX_Sleep_Sessions_user_history
+            ON Sleep_Sessions (user_id, date DESC, sleep_start_time DESC, sleep_end_time, duration)
+            ''',
+        ),
+    }),
+    Migration(5, 'sleep moments', {
+        'mssql': (
+            '''
+            IF OBJECT_ID('Sleep_Moments', 'U') IS NULL
+            CREATE TABLE Sleep_Moments (
+                user_id INT NOT NULL,
+                date DATE NOT NULL,
+                duration_n INT NOT NULL DEFAULT 0,
+                duration_mean FLOAT NOT NULL DEFAULT 0,
+                duration_m2 FLOAT NOT NULL DEFAULT 0,
+                rating_n INT NOT NULL DEFAULT 0,
+                rating_mean FLOAT NOT NULL DEFAULT 0,
+                rating_m2 FLOAT NOT NULL DEFAULT 0,
+                pair_n INT NOT NULL DEFAULT 0,
+                pair_mean_x FLOAT NOT NULL DEFAULT 0,
+                pair_mean_y FLOAT NOT NULL DEFAULT 0,
+                pair_m2_x FLOAT NOT NULL DEFAULT 0,
+                pair_m2_y FLOAT NOT NULL DEFAULT 0,
+                pair_c FLOAT NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, date),
+                FOREIGN KEY (user_id) REFERENCES Users (user_id)
+            )
+            ''',
+            "DELETE FROM Sleep_Moments",
+            _MOMENTS_BACKFILL,
+        ),
+        'sqlite': (
+            '''
+            CREATE TABLE IF NOT EXISTS Sleep_Moments (
+                user_id INTEGER NOT NULL,
+                date DATE NOT NULL,
+                duration_n INTEGER NOT NULL DEFAULT 0,
+                duration_mean REAL NOT NULL DEFAULT 0,
+                duration_m2 REAL NOT NULL DEFAULT 0,
+                rating_n INTEGER NOT NULL DEFAULT 0,
+                rating_mean REAL NOT NULL DEFAULT 0,
+                rating_m2 REAL NOT NULL DEFAULT 0,
+                pair_n INTEGER NOT NULL DEFAULT 0,
+                pair_mean_x REAL NOT NULL DEFAULT 0,
+                pair_mean_y REAL NOT NULL DEFAULT 0,
+                pair_m2_x REAL NOT NULL DEFAULT 0,
+                pair_m2_y REAL NOT NULL DEFAULT 0,
+                pair_c REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, date),
+                FOREIGN KEY (user_id) REFERENCES Users (user_id)
+            ) WITHOUT ROWID
+            ''',
+            "DELETE FROM Sleep_Moments",
+            _MOMENTS_BACKFILL,
+        ),
+    }),
+]
+
+VERSION_TABLE = {
+    'mssql': '''
+    IF OBJECT_ID('Schema_Version', 'U') IS NULL
+    CREATE TABLE Schema_Version (
+        version INT PRIMARY KEY,
+        name NVARCHAR(100) NOT NULL,
+        applied_at DATETIME DEFAULT GETDATE()
+    )
+    ''',
+    'sqlite': '''
+    CREATE TABLE IF NOT EXISTS Schema_Version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+}
+
+
+def current_version(conn, backend):
+    """Highest migration version recorded in the database (0 if none)."""
+    cursor = conn.cursor()
+    cursor.execute(VERSION_TABLE[backend.dialect])
+    conn.commit()
+    cursor.execute("SELECT MAX(version) FROM Schema_Version")
+    return cursor.fetchone()[0] or 0
+
+
+@query_name('migrations')
+def migrate(conn, backend, target=None):
+    """Apply pending migrations in order, one transaction each.
+
+    Returns the versions that were applied; an up-to-date database costs a
+    single version lookup.
+    """
+    version = current_version(conn, backend)
+    target = MIGRATIONS[-1].version if target is None else target
+    applied = []
+    cursor = conn.cursor()
+    for migration in MIGRATIONS:
+        if version < migration.version <= target:
+            try:
+                migration.apply(cursor, backend.dialect)
+                cursor.execute(
+                    "INSERT INTO Schema_Version (version, name) VALUES (?, ?)",
+                    (migration.version, migration.name)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied.append(migration.version)
+    return applied
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply Sleep Tracker schema migrations.")
+    parser.add_argument('--target', type=int, help="stop after this version")
+    parser.add_argument('--status', action='store_true', help="only print the current version")
+    args = parser.parse_args(argv)
+
+    backend = load_backend()
+    conn = backend.connect()
+    try:
+        if args.status:
+            print(f"Schema version {current_version(conn, backend)} "
+                  f"(latest {MIGRATIONS[-1].version})")
+            return
+        applied = migrate(conn, backend, args.target)
+        print(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""Streaming moments (Welford) for sleep duration, rating and their correlation.
+
+Sleep_Moments holds one mergeable accumulator set per user and day: count,
+mean and M2 for duration and for rating, plus the paired moments and
+co-moment of (duration, rating). Writes fold single observations into their
+day inside the same transaction; range statistics merge the day buckets with
+Chan's parallel formula, so mean, variance and Pearson r for any window are
+computed without reading raw sessions. ``rebuild`` recomputes it from scratch.
+"""
+import argparse
+import math
+import threading
+
+from sleep_tracker.instrumentation import query_name
+from sleep_tracker.storage import load_backend, window_start
+
+
+class Moments:
+    """Count, mean and sum of squared deviations (M2) of one variable."""
+
+    __slots__ = ('n', 'mean', 'm2')
+
+    def __init__(self, n=0, mean=0.0, m2=0.0):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+
+    @classmethod
+    def from_values(cls, values):
+        """Moments of an array in one vectorized pass (NaN entries are skipped)."""
+        # Deferred: the write path and migrations import this module before login
+        import numpy as np
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return cls()
+        mean = values.mean()
+        return cls(len(values), float(mean), float(((values - mean) ** 2).sum()))
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def merge(self, other):
+        if not other.n:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+
+    @property
+    def variance(self):
+        """Sample variance, or NaN with fewer than two observations."""
+        return self.m2 / (self.n - 1) if self.n > 1 else math.nan
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+
+class CoMoments:
+    """Paired moments of (x, y) including the co-moment, for covariance and Pearson r."""
+
+    __slots__ = ('n', 'mean_x', 'mean_y', 'm2_x', 'm2_y', 'c')
+
+    def __init__(self, n=0, mean_x=0.0, mean_y=0.0, m2_x=0.0, m2_y=0.0, c=0.0):
+        self.n = n
+        self.mean_x = mean_x
+        self.mean_y = mean_y
+        self.m2_x = m2_x
+        self.m2_y = m2_y
+        self.c = c
+
+    @classmethod
+    def from_values(cls, x, y):
+        """Paired moments of two arrays; pairs with a NaN on either side are skipped."""
+        import numpy as np
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        keep = ~(np.isnan(x) | np.isnan(y))
+        x, y = x[keep], y[keep]
+        if not len(x):
+            return cls()
+        mean_x, mean_y = x.mean(), y.mean()
+        dx, dy = x - mean_x, y - mean_y
+        return cls(len(x), float(mean_x), float(mean_y),
+                   float((dx * dx).sum()), float((dy * dy).sum()), float((dx * dy).sum()))
+
+    def add(self, x, y):
+        self.n += 1
+        dx = x - self.mean_x
+        dy = y - self.mean_y
+        self.mean_x += dx / self.n
+        self.mean_y += dy / self.n
+        self.m2_x += dx * (x - self.mean_x)
+        self.m2_y += dy * (y - self.mean_y)
+        self.c += dx * (y - self.mean_y)
+
+    def merge(self, other):
+        if not other.n:
+            return
+        n = self.n + other.n
+        dx = other.mean_x - self.mean_x
+        dy = other.mean_y - self.mean_y
+        weight = self.n * other.n / n
+        self.mean_x += dx * other.n / n
+        self.mean_y += dy * other.n / n
+        self.m2_x += other.m2_x + dx * dx * weight
+        self.m2_y += other.m2_y + dy * dy * weight
+        self.c += other.c + dx * dy * weight
+        self.n = n
+
+    @property
+    def covariance(self):
+        return self.c / (self.n - 1) if self.n > 1 else math.nan
+
+    @property
+    def correlation(self):
+        """Pearson r, or NaN when undefined (n < 2 or zero variance)."""
+        denominator = math.sqrt(self.m2_x * self.m2_y)
+        return self.c / denominator if self.n > 1 and denominator else math.nan
+
+
+class SleepMoments:
+    """Duration, rating and paired duration/rating accumulators for one bucket."""
+
+    __slots__ = ('duration', 'rating', 'pair')
+
+    def __init__(self, duration=None, rating=None, pair=None):
+        self.duration = duration or Moments()
+        self.rating = rating or Moments()
+        self.pair = pair or CoMoments()
+
+    def add(self, duration=None, rating=None, pair=None):
+        """Fold in a duration, a rating and/or a ``(duration, rating)`` pair."""
+        if duration is not None:
+            self.duration.add(duration)
+        if rating is not None:
+            self.rating.add(rating)
+        if pair is not None:
+            self.pair.add(*pair)
+
+    def merge(self, other):
+        self.duration.merge(other.duration)
+        self.rating.merge(other.rating)
+        self.pair.merge(other.pair)
+
+    def to_row(self):
+        d, r, p = self.duration, self.rating, self.pair
+        return (d.n, d.mean, d.m2, r.n, r.mean, r.m2,
+                p.n, p.mean_x, p.mean_y, p.m2_x, p.m2_y, p.c)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(Moments(*row[0:3]), Moments(*row[3:6]), CoMoments(*row[6:12]))
+
+
+MOMENT_COLUMNS = (
+    'duration_n', 'duration_mean', 'duration_m2',
+    'rating_n', 'rating_mean', 'rating_m2',
+    'pair_n', 'pair_mean_x', 'pair_mean_y', 'pair_m2_x', 'pair_m2_y', 'pair_c',
+)
+
+_COLUMNS = ', '.join(MOMENT_COLUMNS)
+
+# Row lock taken on SQL Server so concurrent writers serialize per bucket
+_LOCK_HINT = {'mssql': 'WITH (UPDLOCK, HOLDLOCK)', 'sqlite': ''}
+
+# Backfill: per-day M2 and co-moment from sums. Buckets hold a handful of
+# sessions, so the cancellation that Welford avoids cannot build up here.
+MOMENTS_INSERT = f'''
+INSERT INTO Sleep_Moments (user_id, date, {_COLUMNS})
+SELECT user_id, date,
+       COUNT(d), COALESCE(AVG(d), 0),
+       COALESCE(SUM(d * d) - SUM(d) * SUM(d) / NULLIF(COUNT(d), 0), 0),
+       COUNT(r), COALESCE(AVG(r), 0),
+       COALESCE(SUM(r * r) - SUM(r) * SUM(r) / NULLIF(COUNT(r), 0), 0),
+       COUNT(px), COALESCE(AVG(px), 0), COALESCE(AVG(py), 0),
+       COALESCE(SUM(px * px) - SUM(px) * SUM(px) / NULLIF(COUNT(px), 0), 0),
+       COALESCE(SUM(py * py) - SUM(py) * SUM(py) / NULLIF(COUNT(py), 0), 0),
+       COALESCE(SUM(px * py) - SUM(px) * SUM(py) / NULLIF(COUNT(px), 0), 0)
+FROM (
+    SELECT ss.user_id, ss.date,
+           CAST(ss.duration AS FLOAT) AS d,
+           CAST(sq.rating AS FLOAT) AS r,
+           CASE WHEN sq.rating IS NOT NULL THEN CAST(ss.duration AS FLOAT) END AS px,
+           CASE WHEN ss.duration IS NOT NULL THEN CAST(sq.rating AS FLOAT) END AS py
+    FROM Sleep_Sessions ss
+    LEFT JOIN Sleep_Quality sq ON ss.session_id = sq.session_id
+    {{where}}
+) s
+GROUP BY user_id, date
+'''
+
+
+@query_name('moments.record')
+def record_moments(cursor, backend, user_id, day, duration=None, rating=None, pair=None):
+    """Fold one observation into the user's bucket for ``day``; caller commits."""
+    cursor.execute(
+        f"SELECT {_COLUMNS} FROM Sleep_Moments {_LOCK_HINT[backend.dialect]} "
+        "WHERE user_id = ? AND date = ?", (user_id, day))
+    row = cursor.fetchone()
+    bucket = SleepMoments.from_row(row) if row else SleepMoments()
+    bucket.add(duration, rating, pair)
+    if row:
+        cursor.execute(
+            f"UPDATE Sleep_Moments SET {', '.join(f'{c} = ?' for c in MOMENT_COLUMNS)} "
+            "WHERE user_id = ? AND date = ?", (*bucket.to_row(), user_id, day))
+    else:
+        cursor.execute(
+            f"INSERT INTO Sleep_Moments (user_id, date, {_COLUMNS}) "
+            f"VALUES (?, ?, {', '.join('?' for _ in MOMENT_COLUMNS)})",
+            (user_id, day, *bucket.to_row()))
+
+
+def rebuild(conn, user_id=None):
+    """Recompute Sleep_Moments from the raw tables, for one user or everyone."""
+    cursor = conn.cursor()
+    try:
+        if user_id is None:
+            cursor.execute("DELETE FROM Sleep_Moments")
+            cursor.execute(MOMENTS_INSERT.format(where=''))
+        else:
+            cursor.execute("DELETE FROM Sleep_Moments WHERE user_id = ?", (user_id,))
+            cursor.execute(MOMENTS_INSERT.format(where='WHERE ss.user_id = ?'), (user_id,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+class MomentsStore:
+    """Per-user day buckets loaded once from Sleep_Moments and merged on demand."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._buckets = {}    # user_id -> list of (date, SleepMoments) sorted by date
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def range_moments(self, user_id, days_back):
+        """Merged SleepMoments over the last ``days_back`` days."""
+        with self._lock:
+            buckets = self._buckets.get(user_id)
+            version = self._versions.get(user_id, 0)
+        if buckets is None:
+            buckets = self._load(user_id)
+            with self._lock:
+                if self._versions.get(user_id, 0) == version:
+                    self._buckets[user_id] = buckets
+        since = window_start(days_back)
+        total = SleepMoments()
+        for day, bucket in buckets:
+            if day >= since:
+                total.merge(bucket)
+        return total
+
+    def invalidate(self, user_id):
+        """Drop a user's buckets after a committed write so they reload."""
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._buckets.pop(user_id, None)
+
+    @query_name('moments.load')
+    def _load(self, user_id):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT date, {_COLUMNS} FROM Sleep_Moments WHERE user_id = ? ORDER BY date",
+                (user_id,))
+            return [(row[0], SleepMoments.from_row(row[1:])) for row in cursor.fetchall()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild Sleep_Moments from raw sessions.")
+    parser.add_argument('--user-id', type=int, help="only rebuild this user's buckets")
+    args = parser.parse_args(argv)
+
+    conn = load_backend().connect()
+    try:
+        rebuild(conn, args.user_id)
+        print("Sleep moments rebuilt")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Bounded pool of reusable database connections."""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from sleep_tracker.instrumentation import query_name
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes available in time."""
+
+
+class ConnectionPool:
+    """Thread-safe pool handing out DB-API connections.
+
+    Connections are reused LIFO so the warm set stays small, pinged before
+    checkout once they have sat idle for ``ping_after`` seconds, and closed
+    once idle for longer than ``idle_timeout`` seconds.
+    """
+
+    def __init__(self, connect, max_size=5, idle_timeout=300, ping_after=30,
+                 checkout_timeout=10, ping_sql="SELECT 1"):
+        self._connect = connect
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.ping_after = ping_after
+        self.checkout_timeout = checkout_timeout
+        self.ping_sql = ping_sql
+        self._idle = deque()  # (connection, last_used) with the oldest on the left
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def acquire(self):
+        """Check out a healthy connection, opening a new one if none is idle."""
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise PoolTimeout(f"No connection available after {self.checkout_timeout}s")
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    stale = self._pop_expired(now)
+                    item = self._idle.pop() if self._idle else None
+                for conn in stale:
+                    self._close_quietly(conn)
+                if item is None:
+                    return self._connect()
+                conn, last_used = item
+                if now - last_used < self.ping_after or self._ping(conn):
+                    return conn
+                self._close_quietly(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn, discard=False):
+        """Return a connection to the pool, or close it if ``discard`` is set.
+
+        Uncommitted work is rolled back first so the next borrower starts
+        clean; connections that cannot even roll back are treated as broken
+        and dropped.
+        """
+        try:
+            if discard or self._closed or not self._rollback(conn):
+                self._close_quietly(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a pooled connection, released however the block exits."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Close every idle connection and refuse further checkouts."""
+        self._closed = True
+        with self._lock:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+        for conn in idle:
+            self._close_quietly(conn)
+
+    def _pop_expired(self, now):
+        expired = []
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            expired.append(self._idle.popleft()[0])
+        return expired
+
+    def _ping(self, conn):
+        try:
+            with query_name('pool.ping'):
+                cursor = conn.cursor()
+                cursor.execute(self.ping_sql)
+                cursor.fetchall()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _rollback(conn):
+        try:
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
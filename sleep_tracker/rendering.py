@@ -0,0 +1,177 @@
+"""Chart rendering in worker processes, with a bitmap cache.
+
+Drawing the two-panel figure with Agg takes far longer than anything else
+the Statistics tab does, and it holds the GIL, so it runs in a small
+process pool instead of on the Tk or I/O threads. Each worker keeps one
+offscreen ``SleepCharts`` per chart style and returns PNG bytes (or RGBA
+pixels). Images are cached in memory and on disk, keyed by user, range and
+a hash of the plotted data and style: showing a range whose data has not
+changed costs a hash and a lookup, never a render.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+ChartStyle = namedtuple(
+    'ChartStyle',
+    ['duration_color', 'quality_color', 'background', 'width', 'height', 'dpi', 'mode'],
+)
+
+RENDER_WORKERS = 2
+MAX_IMAGES = 64
+CACHE_DIR = os.environ.get(
+    'SLEEP_TRACKER_CHART_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'sleep_tracker', 'charts'),
+)
+
+# Per worker process: style -> offscreen SleepCharts, reused across renders
+_charts = {}
+
+
+def _offscreen_charts(style):
+    charts = _charts.get(style)
+    if charts is None:
+        from sleep_tracker.charts import SleepCharts
+        charts = _charts[style] = SleepCharts(
+            style.duration_color, style.quality_color, style.background, mode=style.mode,
+            size=(style.width / style.dpi, style.height / style.dpi), dpi=style.dpi,
+        )
+    return charts
+
+
+def render_chart(style, dates, durations, ratings, fmt='png'):
+    """Render both series headlessly; durations are in hours (runs in a worker process)."""
+    charts = _offscreen_charts(style)
+    charts.update(dates, durations, ratings)
+    return charts.render(fmt)
+
+
+def data_digest(style, dates, durations, ratings):
+    """Hash identifying a chart's pixels: its style and the exact plotted values."""
+    import numpy as np
+    digest = hashlib.blake2b(repr(tuple(style)).encode(), digest_size=16)
+    for values, dtype in ((dates, 'datetime64[ns]'), (durations, float), (ratings, float)):
+        digest.update(np.ascontiguousarray(values, dtype=dtype).tobytes())
+    return digest.hexdigest()
+
+
+class ChartRenderer:
+    """Render charts in worker processes and cache the PNGs in memory and on disk.
+
+    On disk only the newest image of each (user, range) is kept, so the
+    directory holds at most one file per range a user has looked at.
+    ``cache_dir=None`` disables the disk cache.
+    """
+
+    def __init__(self, style, cache_dir=CACHE_DIR, max_workers=RENDER_WORKERS,
+                 max_images=MAX_IMAGES):
+        self.style = style
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.max_images = max_images
+        self._images = OrderedDict()   # (user_id, days_back, digest) -> PNG bytes, LRU first
+        self._lock = threading.Lock()
+        self._pool = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.renders = 0
+
+    def render(self, user_id, days_back, dates, durations, ratings):
+        """PNG bytes of the chart for these series, rendered only if not cached.
+
+        Blocks until the image is ready, so call it from a worker thread.
+        """
+        import numpy as np
+        dates = np.asarray(dates, dtype='datetime64[ns]')
+        durations = np.asarray(durations, dtype=float)
+        ratings = np.asarray(ratings, dtype=float)
+        key = (user_id, days_back, data_digest(self.style, dates, durations, ratings))
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return image
+
+        image = self._read(key)
+        if image is not None:
+            self.disk_hits += 1
+        else:
+            image = self._executor().submit(render_chart, self.style, dates, durations,
+                                            ratings).result()
+            self.renders += 1
+            self._write(key, image)
+
+        with self._lock:
+            self._images[key] = image
+            while len(self._images) > self.max_images:
+                self._images.popitem(last=False)
+        return image
+
+    def warm(self):
+        """Start the worker processes ahead of the first render."""
+        executor = self._executor()
+        for _ in range(self.max_workers):
+            executor.submit(_offscreen_charts, self.style)
+
+    def clear(self):
+        """Forget every cached image, in memory and on disk."""
+        with self._lock:
+            self._images.clear()
+        if self.cache_dir is None:
+            return
+        try:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.png'):
+                    os.remove(os.path.join(self.cache_dir, name))
+        except OSError:
+            pass
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _executor(self):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        with self._lock:
+            if self._pool is None:
+                # Forking a process that runs Tk and worker threads is unsafe
+                self._pool = ProcessPoolExecutor(self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def _path(self, key):
+        user_id, days_back, digest = key
+        return os.path.join(self.cache_dir, f"{user_id}-{days_back}-{digest}.png")
+
+    def _read(self, key):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write(self, key, image):
+        if self.cache_dir is None:
+            return
+        path = self._path(key)
+        prefix = f"{key[0]}-{key[1]}-"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for name in os.listdir(self.cache_dir):
+                # Older images of the same range are superseded by this one
+                if name.startswith(prefix) and name != os.path.basename(path):
+                    os.remove(os.path.join(self.cache_dir, name))
+            temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary, 'wb') as f:
+                f.write(image)
+            os.replace(temporary, path)
+        except OSError:
+            # The disk cache is an optimization; a read-only home must not break charts
+            pass
@@ -0,0 +1,213 @@
+"""Database access for users, sleep sessions, quality ratings and factors.
+
+``SleepRepository`` owns every statement the app runs against a pooled
+connection. Each write method is one transaction that also folds the change
+into the Daily_Sleep_Summary and Sleep_Moments rollups, so callers never
+see a session without its rollup. Nothing here validates input or touches
+caches; that is ``service.SleepService``'s job.
+"""
+from collections import namedtuple
+
+from sleep_tracker.daily_summary import record_sleep
+from sleep_tracker.dashboard import fetch_dashboard_summary
+from sleep_tracker.history import PAGE_SIZE, fetch_history_page
+from sleep_tracker.instrumentation import query_name
+from sleep_tracker.moments import record_moments
+
+SleepFactors = namedtuple(
+    'SleepFactors', ['caffeine_intake', 'exercise', 'screen_time_before_bed', 'stress_level'])
+SleepFactors.__doc__ = "Answers about the day before a night, as stored in Sleep_Factors."
+
+SleepQuality = namedtuple('SleepQuality', ['rating', 'times_woken', 'notes', 'factors'])
+SleepQuality.__doc__ = "How a night went: a 1-10 rating, wake-ups, notes and SleepFactors."
+
+ActiveSession = namedtuple('ActiveSession', ['session_id', 'start_time', 'date'])
+EndedSession = namedtuple('EndedSession', ['session_id', 'date', 'duration'])
+EndedSession.__doc__ = "A session closed by ``end_session``; duration is in minutes."
+
+# Keeps the open-session check and the write after it atomic on SQL Server
+_LOCK_HINT = {'mssql': 'WITH (UPDLOCK, HOLDLOCK)', 'sqlite': ''}
+
+
+class SleepRepository:
+    """Reads and writes sleep data through a ``ConnectionPool``."""
+
+    def __init__(self, pool, backend):
+        self.pool = pool
+        self.backend = backend
+
+    # Users
+
+    @query_name('auth.login')
+    def find_user(self, username, password):
+        """``user_id`` matching the credentials, or None."""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT user_id FROM Users WHERE username = ? AND password = ?",
+                (username, password)
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    @query_name('auth.register')
+    def create_user(self, username, password, name=None, email=None):
+        """Insert a user and return its ``user_id``, or None if the username is taken."""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT user_id FROM Users WHERE username = ?", (username,))
+            if cursor.fetchone():
+                return None
+            user_id = self.backend.insert_returning_id(
+                cursor, 'Users', ('username', 'password', 'name', 'email'),
+                (username, password, name, email), 'user_id')
+            conn.commit()
+        return user_id
+
+    # Sessions
+
+    @query_name('session.active')
+    def active_session(self, user_id):
+        """The user's open ActiveSession, or None."""
+        with self.pool.connection() as conn:
+            return self._active_session(conn.cursor(), user_id)
+
+    @query_name('session.start')
+    def start_session(self, user_id, start_time):
+        """Open a session at ``start_time``; None if one is already open."""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            if self._lock_active_session(cursor, user_id):
+                conn.rollback()
+                return None
+            session_id = self.backend.insert_returning_id(
+                cursor, 'Sleep_Sessions', ('user_id', 'sleep_start_time', 'date'),
+                (user_id, start_time, start_time.date()), 'session_id')
+            conn.commit()
+        return session_id
+
+    @query_name('session.end')
+    def end_session(self, user_id, end_time, quality=None):
+        """Close the open session at ``end_time`` as an EndedSession; None if none is open.
+
+        SleepQuality, when given, is stored in the same transaction.
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            active = self._lock_active_session(cursor, user_id)
+            if not active:
+                conn.rollback()
+                return None
+            duration = int((end_time - active.start_time).total_seconds() / 60)
+            cursor.execute('''
+            UPDATE Sleep_Sessions
+            SET sleep_end_time = ?, duration = ?
+            WHERE session_id = ?
+            ''', (end_time, duration, active.session_id))
+            ended = EndedSession(active.session_id, active.date, duration)
+            if quality is None:
+                record_sleep(cursor, self.backend, user_id, active.date, duration=duration)
+                record_moments(cursor, self.backend, user_id, active.date, duration=duration)
+            else:
+                self._insert_quality(cursor, ended.session_id, quality)
+                record_sleep(cursor, self.backend, user_id, active.date, duration=duration,
+                             rating=quality.rating, factors=quality.factors)
+                record_moments(cursor, self.backend, user_id, active.date, duration=duration,
+                               rating=quality.rating, pair=(duration, quality.rating))
+            conn.commit()
+        return ended
+
+    @query_name('session.quality')
+    def add_quality(self, user_id, session, quality):
+        """Store SleepQuality for an EndedSession."""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            self._insert_quality(cursor, session.session_id, quality)
+            record_sleep(cursor, self.backend, user_id, session.date,
+                         rating=quality.rating, factors=quality.factors)
+            record_moments(cursor, self.backend, user_id, session.date,
+                           rating=quality.rating, pair=(session.duration, quality.rating))
+            conn.commit()
+
+    @query_name('session.record')
+    def add_record(self, user_id, start_time, end_time, duration, quality):
+        """Store a completed night with its SleepQuality; returns the new ``session_id``."""
+        day = start_time.date()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            session_id = self.backend.insert_returning_id(
+                cursor, 'Sleep_Sessions',
+                ('user_id', 'sleep_start_time', 'sleep_end_time', 'duration', 'date'),
+                (user_id, start_time, end_time, duration, day), 'session_id')
+            self._insert_quality(cursor, session_id, quality)
+
+            # Keep the rollups in the same transaction
+            record_sleep(cursor, self.backend, user_id, day, duration=duration,
+                         rating=quality.rating, factors=quality.factors)
+            record_moments(cursor, self.backend, user_id, day, duration=duration,
+                           rating=quality.rating, pair=(duration, quality.rating))
+            conn.commit()
+        return session_id
+
+    # Reads
+
+    def dashboard_summary(self, user_id, days=7):
+        """DashboardSummary over the last ``days`` days."""
+        with self.pool.connection() as conn:
+            return fetch_dashboard_summary(conn, self.backend, user_id, days)
+
+    def history_page(self, user_id, after=None, page_size=PAGE_SIZE):
+        """One keyset page of history rows (see ``history.fetch_history_page``)."""
+        with self.pool.connection() as conn:
+            return fetch_history_page(conn, self.backend, user_id, after=after,
+                                      page_size=page_size)
+
+    def series(self, user_id):
+        """Every session's date, duration and rating as a typed frame."""
+        from sleep_tracker.aggregates import fetch_series
+        with self.pool.connection() as conn:
+            return fetch_series(conn, user_id)
+
+    def factor_effects(self, user_id, days):
+        """Per-level factor effects over the last ``days`` days, aggregated in SQL."""
+        from sleep_tracker.aggregates import fetch_statistics
+        with self.pool.connection() as conn:
+            return fetch_statistics(conn, user_id, days).factors
+
+    def stream(self, user_id, days):
+        """StreamingStatistics over the last ``days`` days, read in bounded chunks."""
+        from sleep_tracker.streaming import stream_statistics
+        with self.pool.connection() as conn:
+            return stream_statistics(conn, user_id, days)
+
+    def _lock_active_session(self, cursor, user_id):
+        """The open ActiveSession, locked until the transaction ends.
+
+        Two concurrent requests then cannot both see no open session (or the
+        same one) and both write.
+        """
+        if self.backend.dialect == 'sqlite':
+            # No row locks: take the database write lock before reading
+            cursor.execute("BEGIN IMMEDIATE")
+        return self._active_session(cursor, user_id, _LOCK_HINT[self.backend.dialect])
+
+    @staticmethod
+    def _active_session(cursor, user_id, hint=''):
+        cursor.execute(f'''
+        SELECT session_id, sleep_start_time, date FROM Sleep_Sessions {hint}
+        WHERE user_id = ? AND sleep_end_time IS NULL
+        ''', (user_id,))
+        row = cursor.fetchone()
+        return ActiveSession(*row) if row else None
+
+    @staticmethod
+    def _insert_quality(cursor, session_id, quality):
+        cursor.execute('''
+        INSERT INTO Sleep_Quality (session_id, rating, times_woken, notes)
+        VALUES (?, ?, ?, ?)
+        ''', (session_id, quality.rating, quality.times_woken, quality.notes))
+        cursor.execute('''
+        INSERT INTO Sleep_Factors
+        (session_id, caffeine_intake, exercise, screen_time_before_bed, stress_level)
+        VALUES (?, ?, ?, ?, ?)
+        ''', (session_id, *quality.factors))
@@ -0,0 +1,425 @@
+"""HTTP/JSON API over the sleep-tracking core, for phones and wearables.
+
+A single asyncio event loop speaks HTTP/1.1 with keep-alive (standard
+library only) and never touches the database itself: every call into
+``SleepService``, ``SleepRepository`` or ``SleepAnalytics`` runs on a
+fixed-size thread pool sized to the connection pool, and at most
+``max_pending`` calls may be queued for it, so a burst of clients waits on
+the loop instead of piling threads or connections onto the database. On
+SQLite, which allows one writer at a time, writes are queued for a single
+writer thread rather than spinning in the busy handler against each other.
+
+Endpoints (JSON bodies; all but register and login need
+``Authorization: Bearer <token>`` from login):
+
+=======  ===================  ==============================================
+POST     /register            username, password[, name, email]
+POST     /login               username, password -> token, user_id
+POST     /logout
+GET      /dashboard           averages over the last 7 days, latest session
+POST     /sessions/start      open a session now
+POST     /sessions/end        close it; optional ``quality`` object as below
+POST     /records             date, start, end ("HH:MM"), rating,
+                              times_woken[, notes, caffeine_intake, exercise,
+                              screen_time_before_bed, stress_level]
+GET      /history             ?limit=&after=<cursor from the previous page>
+GET      /statistics          ?days=7[&series=1]
+=======  ===================  ==============================================
+
+Tokens are kept in memory and expire ``TOKEN_TTL`` seconds after login.
+Request and header lines longer than ``MAX_LINE`` are refused with 400 or
+431 and the connection is closed.
+
+Run with ``python -m sleep_tracker.server``; ``sleep_tracker.loadtest``
+drives it with many concurrent clients.
+"""
+import argparse
+import asyncio
+import base64
+import functools
+import json
+import logging
+import math
+import secrets
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+
+from sleep_tracker.analytics import TIME_RANGES, SleepAnalytics
+from sleep_tracker.history import PAGE_SIZE, page_key
+from sleep_tracker.migrations import migrate
+from sleep_tracker.moments import MomentsStore
+from sleep_tracker.repository import SleepRepository
+from sleep_tracker.service import SleepService, ValidationError, parse_quality, parse_record
+from sleep_tracker.stats_cache import StatsCache
+from sleep_tracker.storage import load_backend
+
+DB_WORKERS = 8          # threads running database work, and pooled connections
+MAX_PENDING = 256       # database calls running or queued before requests wait
+MAX_BODY = 64 * 1024
+MAX_LINE = 8 * 1024     # longest request or header line
+MAX_HEADERS = 100
+TOKEN_TTL = 12 * 3600   # seconds a login token stays valid
+MAX_TOKENS = 100_000    # live tokens kept before the oldest are dropped
+MAX_PAGE_SIZE = 500
+MAX_DAYS = max(TIME_RANGES.values())
+
+logger = logging.getLogger('sleep_tracker.server')
+
+Request = namedtuple('Request', ['method', 'path', 'query', 'headers', 'body', 'keep_alive'])
+
+
+class HttpError(Exception):
+    """Raised by handlers to answer with ``status`` and an error message."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if hasattr(value, 'item'):      # numpy scalars
+        return value.item()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _finite(value):
+    """``value`` with NaN and infinities replaced by None, which JSON can carry."""
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if hasattr(value, 'item') and not isinstance(value, (date, datetime)):
+        return _finite(value.item())
+    return value
+
+
+def encode_cursor(key):
+    """Opaque history cursor for a ``history.page_key``."""
+    day, start_time, session_id = key
+    raw = f"{day.isoformat()}|{start_time.isoformat()}|{session_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        day, start_time, session_id = raw.split('|')
+        return date.fromisoformat(day), datetime.fromisoformat(start_time), int(session_id)
+    except ValueError:
+        raise ValidationError("Invalid history cursor") from None
+
+
+def _bounded_int(value, label, low, high):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f"{label} must be a whole number") from None
+    if not low <= number <= high:
+        raise ValidationError(f"{label} must be between {low} and {high}")
+    return number
+
+
+def _quality(fields):
+    if not isinstance(fields, dict):
+        raise ValidationError("Quality must be an object")
+    return parse_quality(
+        fields.get('rating'), fields.get('times_woken', 0), fields.get('notes', ''),
+        fields.get('caffeine_intake', False), fields.get('exercise', False),
+        fields.get('screen_time_before_bed', 0), fields.get('stress_level', 5),
+    )
+
+
+def _clock(value, label):
+    hour, _, minute = str(value).partition(':')
+    if not minute:
+        raise ValidationError(f"{label} must look like HH:MM")
+    return hour, minute
+
+
+async def _read_line(reader, status, message):
+    try:
+        return await reader.readline()
+    except (ValueError, asyncio.LimitOverrunError):
+        # Longer than the stream limit; what is left of the line cannot be resynced
+        raise HttpError(status, message) from None
+
+
+async def read_request(reader):
+    """Next Request on a connection, or None once the client has closed it."""
+    line = await _read_line(reader, 400, "Request line too long")
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode('latin-1').split()
+    except ValueError:
+        raise HttpError(400, "Malformed request line") from None
+    headers = {}
+    for count in range(MAX_HEADERS + 1):
+        line = await _read_line(reader, 431, "Request header too long")
+        if line in (b'\r\n', b'\n', b''):
+            break
+        if count == MAX_HEADERS:
+            raise HttpError(431, "Too many request headers")
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise HttpError(400, "Invalid Content-Length") from None
+    if length > MAX_BODY:
+        raise HttpError(413, "Request body too large")
+    body = await reader.readexactly(length) if length else b''
+    connection = headers.get('connection', '').lower()
+    keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+    url = urlsplit(target)
+    return Request(method.upper(), url.path.rstrip('/') or '/', dict(parse_qsl(url.query)),
+                   headers, body, keep_alive)
+
+
+def render_response(status, payload, keep_alive=True):
+    body = json.dumps(payload, default=_json_default, allow_nan=False).encode()
+    head = (f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode('latin-1') + body
+
+
+class SleepApiServer:
+    """Routes HTTP requests to the sleep-tracking core on a bounded thread pool."""
+
+    def __init__(self, backend=None, workers=DB_WORKERS, max_pending=MAX_PENDING):
+        self.backend = backend or load_backend()
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='sleep-api')
+        self._writer = (ThreadPoolExecutor(1, thread_name_prefix='sleep-api-writer')
+                        if self.backend.dialect == 'sqlite' else self._executor)
+        # One connection per thread, so a checkout never waits
+        threads = workers + (self._writer is not self._executor)
+        self.pool = self.backend.create_pool(max_size=threads)
+        self.repository = SleepRepository(self.pool, self.backend)
+        stats_cache, moments = StatsCache(), MomentsStore(self.pool)
+        self.service = SleepService(self.repository, stats_cache, moments)
+        self.analytics = SleepAnalytics(self.repository, stats_cache, moments)
+        self._slots = asyncio.Semaphore(max_pending)
+        self._tokens = {}     # bearer token -> (user_id, expiry), oldest first
+        self.routes = {
+            ('POST', '/register'): (self.register, False),
+            ('POST', '/login'): (self.login, False),
+            ('POST', '/logout'): (self.logout, True),
+            ('GET', '/dashboard'): (self.dashboard, True),
+            ('POST', '/sessions/start'): (self.start_session, True),
+            ('POST', '/sessions/end'): (self.end_session, True),
+            ('POST', '/records'): (self.record, True),
+            ('GET', '/history'): (self.history, True),
+            ('GET', '/statistics'): (self.statistics, True),
+        }
+
+    async def run_db(self, fn, *args, write=False):
+        """Run blocking ``fn(*args)`` on the database threads (the writer, for ``write``)."""
+        executor = self._writer if write else self._executor
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, functools.partial(fn, *args))
+
+    async def start(self, host='127.0.0.1', port=8080):
+        """Migrate the schema and start listening; returns the ``asyncio.Server``."""
+        await self.run_db(self._migrate, write=True)
+        return await asyncio.start_server(self.handle_connection, host, port, backlog=1024,
+                                          limit=MAX_LINE)
+
+    def close(self):
+        self._writer.shutdown(wait=True)
+        self._executor.shutdown(wait=True)
+        self.pool.close()
+
+    def _migrate(self):
+        with self.pool.connection() as conn:
+            return migrate(conn, self.backend)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HttpError as e:
+                    writer.write(render_response(e.status, {'error': str(e)}, keep_alive=False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                status, payload = await self.dispatch(request)
+                writer.write(render_response(status, payload, request.keep_alive))
+                await writer.drain()
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, request):
+        """``(status, payload)`` for one request."""
+        route = self.routes.get((request.method, request.path))
+        if route is None:
+            if any(path == request.path for _, path in self.routes):
+                return 405, {'error': "Method not allowed"}
+            return 404, {'error': "Not found"}
+        handler, needs_auth = route
+        try:
+            user_id = self._authenticate(request) if needs_auth else None
+            fields = self._fields(request)
+            return await handler(request, fields, user_id)
+        except HttpError as e:
+            return e.status, {'error': str(e)}
+        except ValidationError as e:
+            return 400, {'error': str(e)}
+        except Exception:
+            logger.exception("%s %s failed", request.method, request.path)
+            return 500, {'error': "Internal server error"}
+
+    def _authenticate(self, request):
+        scheme, _, token = request.headers.get('authorization', '').partition(' ')
+        user_id, expiry = self._tokens.get(token, (None, 0))
+        if scheme.lower() != 'bearer' or user_id is None:
+            raise HttpError(401, "Missing or invalid token")
+        if expiry <= time.monotonic():
+            self._tokens.pop(token, None)
+            raise HttpError(401, "Token expired; log in again")
+        return user_id
+
+    def _issue_token(self, user_id):
+        now = time.monotonic()
+        # Tokens expire in the order they were issued, so expired ones are at the front
+        while self._tokens:
+            oldest = next(iter(self._tokens))
+            if self._tokens[oldest][1] > now and len(self._tokens) < MAX_TOKENS:
+                break
+            del self._tokens[oldest]
+        token = secrets.token_urlsafe(24)
+        self._tokens[token] = (user_id, now + TOKEN_TTL)
+        return token
+
+    @staticmethod
+    def _fields(request):
+        if not request.body:
+            return {}
+        try:
+            fields = json.loads(request.body)
+        except ValueError:
+            raise HttpError(400, "Body must be JSON") from None
+        if not isinstance(fields, dict):
+            raise HttpError(400, "Body must be a JSON object")
+        return fields
+
+    # Handlers: (request, fields, user_id) -> (status, payload)
+
+    async def register(self, request, fields, user_id):
+        user_id = await self.run_db(self.service.register, fields.get('username'),
+                                    fields.get('password'), fields.get('name'),
+                                    fields.get('email'), write=True)
+        return 201, {'user_id': user_id}
+
+    async def login(self, request, fields, user_id):
+        user_id = await self.run_db(self.service.login, fields.get('username'),
+                                    fields.get('password'))
+        if user_id is None:
+            raise HttpError(401, "Invalid username or password")
+        return 200, {'token': self._issue_token(user_id), 'user_id': user_id}
+
+    async def logout(self, request, fields, user_id):
+        self._tokens.pop(request.headers['authorization'].partition(' ')[2], None)
+        return 200, {}
+
+    async def dashboard(self, request, fields, user_id):
+        summary = await self.run_db(self.repository.dashboard_summary, user_id)
+        return 200, {name: _finite(value) for name, value in summary._asdict().items()}
+
+    async def start_session(self, request, fields, user_id):
+        start_time = await self.run_db(self.service.start_session, user_id, write=True)
+        if start_time is None:
+            raise HttpError(409, "A sleep session is already active")
+        return 201, {'start_time': start_time}
+
+    async def end_session(self, request, fields, user_id):
+        # Validate the rating before ending, so bad input leaves the session open
+        quality = _quality(fields['quality']) if fields.get('quality') is not None else None
+        ended = await self.run_db(self.service.end_session, user_id, None, quality, write=True)
+        if ended is None:
+            raise HttpError(409, "No active sleep session")
+        return 200, {**ended._asdict(), 'quality_saved': quality is not None}
+
+    async def record(self, request, fields, user_id):
+        record = parse_record(fields.get('date'), *_clock(fields.get('start'), "Start"),
+                              *_clock(fields.get('end'), "End"), _quality(fields))
+        session_id = await self.run_db(self.service.record_sleep, user_id, record, write=True)
+        return 201, {'session_id': session_id, 'duration': record.duration}
+
+    async def history(self, request, fields, user_id):
+        limit = _bounded_int(request.query.get('limit', PAGE_SIZE), "Limit", 1, MAX_PAGE_SIZE)
+        after = request.query.get('after')
+        after = decode_cursor(after) if after else None
+        rows = await self.run_db(self.repository.history_page, user_id, after, limit)
+        records = [{'session_id': row[0], 'date': row[1], 'start': row[2], 'end': row[3],
+                    'duration': row[4], 'rating': row[5]} for row in rows]
+        more = len(rows) == limit
+        return 200, {'records': records, 'next': encode_cursor(page_key(rows[-1])) if more else None}
+
+    async def statistics(self, request, fields, user_id):
+        days = _bounded_int(request.query.get('days', 7), "Days", 1, MAX_DAYS)
+        stats = await self.run_db(self.analytics.statistics, user_id, days)
+        if stats is None:
+            return 200, {'days': days, 'nights': 0}
+        payload = {
+            'days': days,
+            'nights': len(stats.series),
+            'avg_duration': _finite(stats.avg_duration),
+            'avg_quality': _finite(stats.avg_quality),
+            'correlation': _finite(stats.correlation),
+            'factors': [{name: _finite(value) for name, value in row.items()}
+                        for row in stats.factors.to_dict('records')],
+        }
+        if request.query.get('series') in ('1', 'true'):
+            series = stats.series
+            payload['series'] = [
+                {'date': day.date(), 'duration': _finite(duration), 'rating': _finite(rating)}
+                for day, duration, rating in zip(series['date'], series['duration'].astype(float),
+                                                 series['rating'].astype(float))
+            ]
+        return 200, payload
+
+
+async def serve(host, port, workers=DB_WORKERS, max_pending=MAX_PENDING):
+    server = SleepApiServer(workers=workers, max_pending=max_pending)
+    try:
+        listener = await server.start(host, port)
+        bound = listener.sockets[0].getsockname()
+        # The load test reads this line to find an ephemeral port
+        print(f"Listening on http://{bound[0]}:{bound[1]}", flush=True)
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the Sleep Tracker HTTP/JSON API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080, help="0 picks a free port")
+    parser.add_argument('--workers', type=int, default=DB_WORKERS,
+                        help="database threads and pooled connections")
+    parser.add_argument('--max-pending', type=int, default=MAX_PENDING,
+                        help="database calls queued before requests wait")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.max_pending))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Sleep-tracking use cases with validation, independent of any UI.
+
+``SleepService`` turns raw user input into checked values, runs the write
+through ``SleepRepository`` and then brings the in-memory caches in line
+with what was committed. The Tk app calls it from worker threads; the same
+calls serve scripts and servers. Input problems raise ``ValidationError``
+with a message fit to show the user.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sleep_tracker.repository import SleepFactors, SleepQuality
+
+RATING_RANGE = (1, 10)
+STRESS_RANGE = (1, 10)
+
+SleepRecord = namedtuple('SleepRecord', ['start_time', 'end_time', 'duration', 'quality'])
+SleepRecord.__doc__ = "A manually entered night; duration is in minutes, quality a SleepQuality."
+
+
+class ValidationError(ValueError):
+    """Raised when user input cannot be stored; the message is user-facing."""
+
+
+def _integer(value, label, low=0, high=None):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f"{label} must be a whole number") from None
+    if number < low or (high is not None and number > high):
+        bounds = f"between {low} and {high}" if high is not None else f"at least {low}"
+        raise ValidationError(f"{label} must be {bounds}")
+    return number
+
+
+def _credentials(username, password):
+    """Reject missing credentials, and values that are not text (JSON can send numbers)."""
+    if not username or not password:
+        raise ValidationError("Username and password are required")
+    if not isinstance(username, str) or not isinstance(password, str):
+        raise ValidationError("Username and password must be text")
+
+
+def parse_quality(rating, times_woken, notes='', caffeine_intake=False, exercise=False,
+                  screen_time_before_bed=0, stress_level=5):
+    """Validated SleepQuality from form values (numbers may be strings)."""
+    factors = SleepFactors(
+        bool(caffeine_intake), bool(exercise),
+        _integer(screen_time_before_bed, "Screen time"),
+        _integer(stress_level, "Stress level", *STRESS_RANGE),
+    )
+    # Scales report floats, which int() truncates like the form always has
+    return SleepQuality(_integer(rating, "Rating", *RATING_RANGE),
+                        _integer(times_woken, "Times woken"), (notes or '').strip(), factors)
+
+
+def parse_record(date_str, start_hour, start_min, end_hour, end_min, quality):
+    """Validated SleepRecord; an end time before the start means the next morning."""
+    try:
+        start_time = datetime.strptime(f"{date_str} {start_hour}:{start_min}", "%Y-%m-%d %H:%M")
+        end_time = datetime.strptime(f"{date_str} {end_hour}:{end_min}", "%Y-%m-%d %H:%M")
+    except ValueError as e:
+        raise ValidationError(f"Invalid date or time format: {e}") from None
+    if end_time < start_time:
+        end_time += timedelta(days=1)
+    duration = int((end_time - start_time).total_seconds() / 60)
+    return SleepRecord(start_time, end_time, duration, quality)
+
+
+class SleepService:
+    """Registration, login and the sleep session lifecycle for one store.
+
+    ``stats_cache`` (a StatsCache) and ``moments`` (a MomentsStore) are
+    optional; when given they are patched or invalidated after each commit.
+    """
+
+    def __init__(self, repository, stats_cache=None, moments=None):
+        self.repository = repository
+        self.stats_cache = stats_cache
+        self.moments = moments
+
+    def register(self, username, password, name=None, email=None):
+        """Create a user and return its ``user_id``."""
+        _credentials(username, password)
+        if not all(value is None or isinstance(value, str) for value in (name, email)):
+            raise ValidationError("Name and email must be text")
+        user_id = self.repository.create_user(username, password, name, email)
+        if user_id is None:
+            raise ValidationError("Username already exists")
+        return user_id
+
+    def login(self, username, password):
+        """``user_id`` for valid credentials, otherwise None."""
+        _credentials(username, password)
+        return self.repository.find_user(username, password)
+
+    def start_session(self, user_id, now=None):
+        """Start a session now; returns its start time, or None if one is already open."""
+        start_time = now or datetime.now()
+        session_id = self.repository.start_session(user_id, start_time)
+        if session_id is None:
+            return None
+        self._patch(user_id, session_id, date=start_time.date())
+        return start_time
+
+    def end_session(self, user_id, now=None, quality=None):
+        """End the open session; returns an EndedSession, or None if none is open.
+
+        SleepQuality, when given, is saved with the session in one transaction.
+        """
+        ended = self.repository.end_session(user_id, now or datetime.now(), quality)
+        if ended is None:
+            return None
+        if quality is None:
+            self._patch(user_id, ended.session_id, duration=ended.duration)
+        else:
+            self._patch(user_id, ended.session_id, duration=ended.duration,
+                        rating=quality.rating, times_woken=quality.times_woken,
+                        **quality.factors._asdict())
+        return ended
+
+    def record_quality(self, user_id, session, quality):
+        """Attach SleepQuality to a session returned by ``end_session``."""
+        self.repository.add_quality(user_id, session, quality)
+        self._patch(user_id, session.session_id, rating=quality.rating,
+                    times_woken=quality.times_woken, **quality.factors._asdict())
+
+    def record_sleep(self, user_id, record):
+        """Store a SleepRecord; returns the new ``session_id``."""
+        session_id = self.repository.add_record(user_id, record.start_time, record.end_time,
+                                                record.duration, record.quality)
+        self._patch(user_id, session_id, date=record.start_time.date(), duration=record.duration,
+                    rating=record.quality.rating, times_woken=record.quality.times_woken,
+                    **record.quality.factors._asdict())
+        return session_id
+
+    def _patch(self, user_id, session_id, **values):
+        if self.stats_cache is not None:
+            self.stats_cache.patch_session(user_id, session_id, **values)
+        if self.moments is not None and ('duration' in values or 'rating' in values):
+            self.moments.invalidate(user_id)
@@ -0,0 +1,96 @@
+"""Cold-start budget: what the login screen may import, and how long it may take.
+
+numpy, pandas and matplotlib together take most of a second to import, and
+nothing before login needs them. The app and the modules it uses before
+login (storage, migrations, the write path, the caches) import them inside
+the functions that use them. ``preload`` imports the analytics modules on a
+worker thread once the user is logged in, so the Statistics tab rarely
+waits for them.
+
+``main`` runs ``python -X importtime -c "import sleep_tracker_app"`` in
+fresh interpreters and fails when the import takes longer than the budget
+or pulls in one of the deferred packages, so a stray top-level import shows
+up as a failing check instead of a slower login screen.
+"""
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+
+# Packages that must not be imported before login
+DEFERRED = ('numpy', 'pandas', 'matplotlib', 'seaborn')
+
+# Imported ahead of the first Statistics visit
+ANALYTICS_MODULES = (
+    'numpy',
+    'pandas',
+    'sleep_tracker.frames',
+    'sleep_tracker.aggregates',
+    'sleep_tracker.streaming',
+)
+
+IMPORT_BUDGET_MS = 150
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def preload(modules=ANALYTICS_MODULES):
+    """Import ``modules`` now (call on a worker thread)."""
+    for name in modules:
+        importlib.import_module(name)
+
+
+def import_times(module='sleep_tracker_app'):
+    """Import ``module`` in a fresh interpreter.
+
+    Returns the cumulative import time of ``module`` in milliseconds and the
+    set of every module it imported.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=_ROOT, capture_output=True, text=True, check=True,
+    )
+    total, imported = None, set()
+    # Lines look like "import time:  self [us] | cumulative | <indent>package"
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            continue   # header line
+        imported.add(name.strip())
+        if name.strip() == module and not name[1:].startswith(' '):
+            total = int(cumulative) / 1000
+    return total, imported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the app's cold-start import budget.")
+    parser.add_argument('--module', default='sleep_tracker_app')
+    parser.add_argument('--budget-ms', type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument('--runs', type=int, default=5,
+                        help="fresh interpreters to try; the fastest run is judged")
+    args = parser.parse_args(argv)
+
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    best = min(total for total, _ in runs)
+    imported = set.union(*(modules for _, modules in runs))
+    deferred = sorted({name.split('.')[0] for name in imported} & set(DEFERRED))
+
+    print(f"import {args.module}: {best:.1f} ms (budget {args.budget_ms:.0f} ms), "
+          f"{len(imported)} modules")
+    failed = False
+    if best > args.budget_ms:
+        print(f"FAIL: cold start is over budget by {best - args.budget_ms:.1f} ms")
+        failed = True
+    if deferred:
+        print(f"FAIL: imported at startup: {', '.join(deferred)}")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""In-memory cache of per-user statistics frames.
+
+Each cached user holds one full-history frame sorted by date; every time
+range is served by slicing it, so switching ranges does not touch the
+database. Cached frames are never modified: writes patch a copy and swap
+it in (or drop the frame), so readers can slice one outside the lock. A
+per-user version counter keeps a load that raced with a write from
+storing stale data.
+"""
+import threading
+from collections import OrderedDict
+
+from sleep_tracker.storage import window_start
+
+MAX_USERS = 32
+MAX_BYTES = 256 * 1024 * 1024
+
+
+class StatsCache:
+    """LRU cache of full-history frames bounded by user count and memory size."""
+
+    def __init__(self, max_users=MAX_USERS, max_bytes=MAX_BYTES):
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self._frames = OrderedDict()   # user_id -> DataFrame, least recently used first
+        self._sizes = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def total_bytes(self):
+        return sum(self._sizes.values())
+
+    def get_frame(self, user_id, days_back, loader):
+        """Rows of the last ``days_back`` days, loading the full history on a miss.
+
+        ``loader(user_id)`` must return every row for the user with a
+        ``session_id`` and a ``date`` column. The returned frame is a copy the
+        caller may modify.
+        """
+        with self._lock:
+            frame = self._frames.get(user_id)
+            if frame is not None:
+                self._frames.move_to_end(user_id)
+                self.hits += 1
+            else:
+                self.misses += 1
+                version = self._versions.get(user_id, 0)
+        if frame is None:
+            frame = self._prepare(loader(user_id))
+            with self._lock:
+                # A write since the load started means the frame may miss it
+                if self._versions.get(user_id, 0) == version:
+                    self._store(user_id, frame)
+        return self._slice(frame, days_back)
+
+    def patch_session(self, user_id, session_id, **values):
+        """Apply a committed write for one session to the cached frame.
+
+        Columns in ``values`` are updated if the session is cached; otherwise
+        a row is appended, which needs a ``date`` value. Values for columns
+        the cached frame does not hold are ignored.
+        """
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            frame = self._frames.get(user_id)
+            if frame is None:
+                return
+            values = {column: value for column, value in values.items() if column in frame.columns}
+            mask = frame['session_id'] == session_id
+            if mask.any():
+                # Readers slice the stored frame without the lock: patch a copy
+                frame = frame.copy()
+                try:
+                    for column, value in values.items():
+                        frame.loc[mask, column] = value
+                except (TypeError, ValueError, OverflowError):
+                    # Value does not fit the compact column dtype; reload on next use
+                    self._drop(user_id)
+                    return
+            elif 'date' in values:
+                import pandas as pd
+                row = self._prepare(pd.DataFrame([{'session_id': session_id, **values}]))
+                frame = pd.concat([frame, row], ignore_index=True)
+                frame = frame.sort_values('date', kind='stable', ignore_index=True)
+            else:
+                self._drop(user_id)
+                return
+            self._store(user_id, frame)
+
+    def invalidate(self, user_id=None):
+        """Forget one user's frame, or everything."""
+        with self._lock:
+            users = list(self._frames) if user_id is None else [user_id]
+            for user in users:
+                self._versions[user] = self._versions.get(user, 0) + 1
+                self._drop(user)
+
+    @staticmethod
+    def _prepare(frame):
+        # pandas is only needed once a frame is cached, not to construct the cache
+        from sleep_tracker.frames import compact
+        frame = compact(frame)
+        return frame.sort_values('date', kind='stable', ignore_index=True)
+
+    @staticmethod
+    def _slice(frame, days_back):
+        import pandas as pd
+        # Frames are sorted by date, so the window start is a binary search
+        start = frame['date'].searchsorted(pd.Timestamp(window_start(days_back)))
+        return frame.iloc[start:].reset_index(drop=True).copy()
+
+    def _store(self, user_id, frame):
+        self._frames[user_id] = frame
+        self._frames.move_to_end(user_id)
+        self._sizes[user_id] = int(frame.memory_usage(index=True, deep=True).sum())
+        while self._frames and (len(self._frames) > self.max_users
+                                or self.total_bytes > self.max_bytes):
+            oldest = next(iter(self._frames))
+            self._drop(oldest)
+            if oldest == user_id:
+                break
+
+    def _drop(self, user_id):
+        self._frames.pop(user_id, None)
+        self._sizes.pop(user_id, None)
@@ -0,0 +1,145 @@
+"""Storage backends: SQL Server over ODBC and an in-process SQLite engine."""
+import os
+import sqlite3
+from datetime import date, datetime, timedelta
+
+from sleep_tracker.instrumentation import instrument
+from sleep_tracker.pool import ConnectionPool
+
+# Backend selection; override with SLEEP_TRACKER_BACKEND=sqlite for local use
+DB_CONFIG = {
+    'backend': os.environ.get('SLEEP_TRACKER_BACKEND', 'mssql'),
+    'mssql': {
+        'connection_string': os.environ.get(
+            'SLEEP_TRACKER_MSSQL',
+            "DRIVER={ODBC Driver 18 for SQL Server};"
+            "SERVER=DESKTOP-6TSK0HA;"  # Update as needed
+            "DATABASE=SleepTracker;"
+            "Trusted_Connection=yes;"
+            "TrustServerCertificate=yes;"
+        ),
+    },
+    'sqlite': {
+        'path': os.environ.get(
+            'SLEEP_TRACKER_SQLITE_PATH',
+            os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sleep_tracker.db'),
+        ),
+    },
+}
+
+
+def window_start(days):
+    """First date included in a "last N days" window ending today."""
+    return date.today() - timedelta(days=days - 1)
+
+
+class StorageBackend:
+    """A database engine together with the SQL dialect differences the app needs."""
+
+    dialect = None
+
+    def connect(self):
+        """Open a new DB-API connection."""
+        raise NotImplementedError
+
+    def create_pool(self, **kwargs):
+        """Create a connection pool backed by this engine.
+
+        Pooled connections are instrumented: their statements are timed
+        into ``instrumentation.QUERY_STATS``.
+        """
+        return ConnectionPool(instrument(self.connect), **kwargs)
+
+    def limit(self, query, count):
+        """Restrict an ORDER BY query to its first ``count`` rows."""
+        raise NotImplementedError
+
+    def insert_returning_id(self, cursor, table, columns, params, id_column):
+        """Insert one row into ``table`` and return its generated ``id_column`` value."""
+        raise NotImplementedError
+
+    @staticmethod
+    def _placeholders(columns):
+        return ', '.join('?' for _ in columns)
+
+
+class SqlServerBackend(StorageBackend):
+    """Microsoft SQL Server reached through pyodbc."""
+
+    dialect = 'mssql'
+
+    def __init__(self, connection_string=None):
+        self.connection_string = connection_string or DB_CONFIG['mssql']['connection_string']
+
+    def connect(self):
+        import pyodbc
+        return pyodbc.connect(self.connection_string)
+
+    def limit(self, query, count):
+        return f"{query.rstrip()}\nOFFSET 0 ROWS FETCH NEXT {int(count)} ROWS ONLY"
+
+    def insert_returning_id(self, cursor, table, columns, params, id_column):
+        # A separate SELECT SCOPE_IDENTITY() runs outside the scope of pyodbc's
+        # prepared INSERT and returns NULL; OUTPUT hands the id back with the row
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) OUTPUT INSERTED.{id_column} "
+            f"VALUES ({self._placeholders(columns)})", params)
+        return int(cursor.fetchone()[0])
+
+
+# Store dates the way the bundled database already does (ISO text) and parse
+# them back by declared column type
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("DATE", lambda raw: date.fromisoformat(raw.decode()))
+sqlite3.register_converter("TIMESTAMP", lambda raw: datetime.fromisoformat(raw.decode()))
+
+
+class SqliteBackend(StorageBackend):
+    """Embedded SQLite database file, by default the bundled sleep_tracker.db."""
+
+    dialect = 'sqlite'
+    pragmas = (
+        ('journal_mode', 'WAL'),       # readers never block the writer
+        ('synchronous', 'NORMAL'),     # safe with WAL, avoids an fsync per commit
+        ('foreign_keys', 'ON'),
+        ('temp_store', 'MEMORY'),
+        ('cache_size', -32000),        # 32 MB page cache per connection
+        ('mmap_size', 268435456),
+        ('busy_timeout', 5000),
+    )
+
+    def __init__(self, path=None):
+        self.path = path or DB_CONFIG['sqlite']['path']
+
+    def connect(self):
+        # Pooled connections are handed between threads, never shared concurrently
+        conn = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES,
+                               check_same_thread=False)
+        for name, value in self.pragmas:
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    def limit(self, query, count):
+        return f"{query.rstrip()}\nLIMIT {int(count)}"
+
+    def insert_returning_id(self, cursor, table, columns, params, id_column):
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({self._placeholders(columns)})",
+            params)
+        return cursor.lastrowid
+
+
+BACKENDS = {
+    'mssql': SqlServerBackend,
+    'sqlite': SqliteBackend,
+}
+
+
+def load_backend(config=None):
+    """Build the storage backend selected by ``config`` (defaults to DB_CONFIG)."""
+    config = config or DB_CONFIG
+    name = config['backend']
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown storage backend: {name}")
+    return BACKENDS[name](**config.get(name, {}))
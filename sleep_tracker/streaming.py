@@ -0,0 +1,214 @@
+"""Constant-memory statistics over arbitrarily long histories.
+
+Rows are read with ``fetchmany`` and each chunk is folded into mergeable
+aggregates: Welford moments for duration, rating and their correlation,
+per-factor-level moments, fixed-bin histograms and per-day sums for the
+charts. Memory depends on the chunk size and the number of distinct days,
+not on the number of sessions, so the same code serves "All Time" for one
+user and reports across every user. Durations are reported in hours.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from sleep_tracker.factors import FACTORS, OUTCOMES, combine, level_ids, level_statistics
+from sleep_tracker.frames import frame_from_rows
+from sleep_tracker.instrumentation import query_name
+from sleep_tracker.moments import CoMoments, Moments, SleepMoments
+from sleep_tracker.storage import load_backend, window_start
+
+CHUNK_SIZE = 20000
+
+# Histogram bins: quarter hours from 0 to 16 hours, and ratings 1-10
+DURATION_EDGES = np.arange(0, 16.25, 0.25)
+RATING_LEVELS = np.arange(1, 11)
+
+STREAM_COLUMNS = [
+    'date', 'duration', 'rating', 'times_woken',
+    'caffeine_intake', 'exercise', 'screen_time_before_bed', 'stress_level',
+]
+
+STREAM_QUERY = '''
+SELECT ss.date, ss.duration, sq.rating, sq.times_woken,
+       sf.caffeine_intake, sf.exercise, sf.screen_time_before_bed, sf.stress_level
+FROM Sleep_Sessions ss
+LEFT JOIN Sleep_Quality sq ON ss.session_id = sq.session_id
+LEFT JOIN Sleep_Factors sf ON ss.session_id = sf.session_id
+{where}
+'''
+
+_EPOCH = np.datetime64('1970-01-01', 'D')
+
+
+def _merge_levels(a, b):
+    """Chan merge of two (n, mean, m2) tuples of per-level arrays."""
+    n_a, mean_a, m2_a = a
+    n_b, mean_b, m2_b = b
+    n = n_a + n_b
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta = mean_b - mean_a
+        mean = np.where(n > 0, mean_a + delta * n_b / n, 0.0)
+        m2 = np.where(n > 0, m2_a + m2_b + delta * delta * n_a * n_b / n, 0.0)
+    return n, mean, m2
+
+
+def _pad_add(a, b):
+    if len(a) < len(b):
+        a, b = b, a
+    result = a.copy()
+    result[:len(b)] += b
+    return result
+
+
+class StreamingStatistics:
+    """Mergeable aggregates of any number of session chunks."""
+
+    def __init__(self, factors=FACTORS):
+        self.factors = factors
+        self.summary = SleepMoments()
+        total = sum(len(factor.levels) for factor in factors)
+        empty = np.zeros(total)
+        self.levels = {outcome: (empty, empty, empty) for outcome in OUTCOMES}
+        self.duration_histogram = np.zeros(len(DURATION_EDGES) - 1, dtype=np.int64)
+        self.rating_histogram = np.zeros(len(RATING_LEVELS), dtype=np.int64)
+        # Indexed by days since 1970-01-01: count and sum per outcome
+        self.daily = {name: np.zeros(0) for name in
+                      ('duration_n', 'duration_sum', 'rating_n', 'rating_sum')}
+
+    @property
+    def sessions(self):
+        """Completed sessions folded in so far."""
+        return self.summary.duration.n
+
+    def update(self, frame):
+        """Fold in one chunk with STREAM_COLUMNS (duration in minutes)."""
+        if frame.empty:
+            return
+        hours = frame['duration'].to_numpy(dtype=float, na_value=np.nan) / 60
+        rating = frame['rating'].to_numpy(dtype=float, na_value=np.nan)
+        chunk = SleepMoments(Moments.from_values(hours), Moments.from_values(rating),
+                             CoMoments.from_values(hours, rating))
+        self.summary.merge(chunk)
+
+        ids, total = level_ids(frame, self.factors)
+        repeats = len(self.factors)
+        for outcome, values in (('duration', hours), ('rating', rating)):
+            known = ~np.isnan(values)
+            weights = np.tile(np.where(known, values, 0.0), repeats)
+            n = np.bincount(ids, weights=np.tile(known.astype(float), repeats),
+                            minlength=total + 1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = np.nan_to_num(np.bincount(ids, weights=weights, minlength=total + 1) / n)
+            # Second pass around the chunk's level means keeps M2 exact
+            deviations = np.where(np.tile(known, repeats), weights - mean[ids], 0.0)
+            m2 = np.bincount(ids, weights=deviations * deviations, minlength=total + 1)
+            self.levels[outcome] = _merge_levels(self.levels[outcome],
+                                                 (n[:total], mean[:total], m2[:total]))
+
+        self.duration_histogram += np.histogram(hours[~np.isnan(hours)], DURATION_EDGES)[0]
+        rated = rating[~np.isnan(rating)].astype(np.int64)
+        self.rating_histogram += np.bincount(rated, minlength=11)[1:11]
+
+        days = (frame['date'].to_numpy(dtype='datetime64[D]') - _EPOCH).astype(np.int64)
+        for outcome, values in (('duration', hours), ('rating', rating)):
+            known = ~np.isnan(values)
+            self.daily[f'{outcome}_n'] = _pad_add(
+                self.daily[f'{outcome}_n'], np.bincount(days[known]).astype(float))
+            self.daily[f'{outcome}_sum'] = _pad_add(
+                self.daily[f'{outcome}_sum'], np.bincount(days[known], weights=values[known]))
+
+    def merge(self, other):
+        """Combine with aggregates computed elsewhere (another chunk range or worker)."""
+        self.summary.merge(other.summary)
+        for outcome in OUTCOMES:
+            self.levels[outcome] = _merge_levels(self.levels[outcome], other.levels[outcome])
+        self.duration_histogram += other.duration_histogram
+        self.rating_histogram += other.rating_histogram
+        for name in self.daily:
+            self.daily[name] = _pad_add(self.daily[name], other.daily[name])
+
+    def factor_effects(self):
+        """Per-level results in the same layout as ``factors.analyze``."""
+        pieces = []
+        for outcome, (n, mean, m2) in self.levels.items():
+            if not n.any():
+                continue
+            center = float((n * mean).sum() / n.sum())
+            offset = mean - center
+            pieces.append(level_statistics(self.factors, outcome, n, n * offset,
+                                           m2 + n * offset * offset, center))
+        return combine(pieces)
+
+    def daily_series(self):
+        """Per-day mean duration (hours) and rating for days with sessions."""
+        length = max(len(array) for array in self.daily.values())
+        daily = {name: np.pad(array, (0, length - len(array))) for name, array in self.daily.items()}
+        days = np.flatnonzero(daily['duration_n'] + daily['rating_n'])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return pd.DataFrame({
+                'date': (_EPOCH + days).astype('datetime64[ns]'),
+                'duration': daily['duration_sum'][days] / daily['duration_n'][days],
+                'rating': daily['rating_sum'][days] / daily['rating_n'][days],
+                'sessions': daily['duration_n'][days].astype(np.int64),
+            })
+
+
+def iter_chunks(conn, user_id=None, days=None, chunk_size=CHUNK_SIZE):
+    """Yield typed frames of at most ``chunk_size`` rows (STREAM_COLUMNS)."""
+    conditions, params = [], []
+    if user_id is not None:
+        conditions.append('ss.user_id = ?')
+        params.append(user_id)
+    if days is not None:
+        conditions.append('ss.date >= ?')
+        params.append(window_start(days))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    cursor = conn.cursor()
+    # Not a decorator: the fetches run between yields, outside any block
+    with query_name('statistics.stream'):
+        cursor.execute(STREAM_QUERY.format(where=where), params)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield frame_from_rows(rows, STREAM_COLUMNS)
+
+
+def stream_statistics(conn, user_id=None, days=None, chunk_size=CHUNK_SIZE):
+    """StreamingStatistics for one user (or everyone) over the last ``days`` days (or all)."""
+    stats = StreamingStatistics()
+    for chunk in iter_chunks(conn, user_id, days, chunk_size):
+        stats.update(chunk)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize sleep history in constant memory.")
+    parser.add_argument('--user-id', type=int, help="only this user (default: everyone)")
+    parser.add_argument('--days', type=int, help="only the last N days (default: all)")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    conn = load_backend().connect()
+    try:
+        started = time.perf_counter()
+        stats = stream_statistics(conn, args.user_id, args.days, args.chunk_size)
+        seconds = time.perf_counter() - started
+    finally:
+        conn.close()
+
+    summary = stats.summary
+    print(f"{stats.sessions:,} completed sessions in {seconds:.1f}s")
+    print(f"Duration: {summary.duration.mean:.2f} h (sd {summary.duration.std:.2f})")
+    print(f"Rating:   {summary.rating.mean:.2f} (sd {summary.rating.std:.2f})")
+    print(f"Duration-rating correlation: {summary.pair.correlation:.3f}")
+    effects = stats.factor_effects()
+    if not effects.empty:
+        print(effects[['factor', 'level', 'outcome', 'n', 'mean', 'delta', 'effect_size']]
+              .to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Notebook tabs that are built on first view and refreshed only while visible."""
+
+
+class LazyTabs:
+    """Build each tab of a ``ttk.Notebook`` the first time it is selected.
+
+    Writes mark tabs dirty instead of rebuilding them; a dirty tab is
+    refreshed when it is next shown (immediately, if it is showing). Tabs
+    added directly to the notebook are left alone.
+    """
+
+    def __init__(self, notebook):
+        self.notebook = notebook
+        self._tabs = {}       # tab widget path -> (build, refresh)
+        self._built = set()
+        self._dirty = set()
+        notebook.bind('<<NotebookTabChanged>>', lambda event: self.refresh_current(), add='+')
+
+    def add(self, frame, text, build, refresh=None):
+        """Add ``frame`` as a tab; ``build()`` fills it, ``refresh()`` updates it (default: build)."""
+        self.notebook.add(frame, text=text)
+        self._tabs[str(frame)] = (build, refresh or build)
+
+    def mark_dirty(self, *frames):
+        """Schedule a refresh of ``frames`` (all lazy tabs if none given)."""
+        names = [str(frame) for frame in frames] if frames else list(self._tabs)
+        # Tabs never built will be built fresh anyway
+        self._dirty.update(name for name in names if name in self._built)
+        self.refresh_current()
+
+    def refresh_current(self):
+        """Build or refresh the selected tab if it needs it."""
+        name = self.notebook.select()
+        if name not in self._tabs:
+            return
+        build, refresh = self._tabs[name]
+        if name not in self._built:
+            self._built.add(name)
+            self._dirty.discard(name)
+            build()
+        elif name in self._dirty:
+            self._dirty.discard(name)
+            refresh()
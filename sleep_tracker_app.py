@@ -1,24 +1,24 @@
+import base64
+import math
 import tkinter as tk
 from tkinter import ttk, messagebox
-import sqlite3
-import pyodbc
-from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import pandas as pd
-import seaborn as sns
-from matplotlib.figure import Figure
-import numpy as np
+from datetime import datetime
 
-# SQL Server connection
-def connect_to_db():
-    return pyodbc.connect(
-        "DRIVER={ODBC Driver 18 for SQL Server};"
-        "SERVER=DESKTOP-6TSK0HA;"  # Update as needed
-        "DATABASE=SleepTracker;"
-        "Trusted_Connection=yes;"
-        "TrustServerCertificate=yes;" 
-    )
+# numpy, pandas and matplotlib are imported where used so the login screen
+# paints without them (python -m sleep_tracker.startup checks this)
+from sleep_tracker.analytics import TIME_RANGES, SleepAnalytics
+from sleep_tracker.executor import TaskExecutor
+from sleep_tracker.history import PAGE_SIZE, page_key
+from sleep_tracker.instrumentation import QUERY_STATS
+from sleep_tracker.migrations import migrate
+from sleep_tracker.moments import MomentsStore
+from sleep_tracker.rendering import ChartRenderer, ChartStyle
+from sleep_tracker.repository import SleepRepository
+from sleep_tracker.service import SleepService, ValidationError, parse_quality, parse_record
+from sleep_tracker.stats_cache import StatsCache
+from sleep_tracker.startup import preload
+from sleep_tracker.storage import load_backend
+from sleep_tracker.tabs import LazyTabs
 
 # Style constants
 COLORS = {
@@ -43,6 +43,9 @@ FONTS = {
     'small': ('Helvetica', 10)
 }
 
+CHART_STYLE = ChartStyle(COLORS['secondary'], COLORS['success'], COLORS['white'], 1000, 800, 100,
+                         'lttb')
+
 class SleepTrackerApp:
     def __init__(self, root):
         self.root = root
@@ -54,11 +57,27 @@ class SleepTrackerApp:
         self.configure_styles()
         
         # Initialize database
+        self.backend = load_backend()
+        self.pool = self.backend.create_pool()
         self.init_database()
         
+        # Database and analytics work runs off the Tk thread, in the headless core
+        self.executor = TaskExecutor(self.root)
+        self.stats_cache = StatsCache()
+        self.moments = MomentsStore(self.pool)
+        self.repository = SleepRepository(self.pool, self.backend)
+        self.service = SleepService(self.repository, self.stats_cache, self.moments)
+        self.analytics = SleepAnalytics(self.repository, self.stats_cache, self.moments)
+        # Charts are drawn in worker processes; the Tk thread only shows the image
+        self.chart_renderer = ChartRenderer(CHART_STYLE)
+        # F12 prints per-query latency percentiles and saves the histograms
+        self.root.bind('<F12>', self.dump_query_stats)
+        
         # User state
         self.current_user_id = None
         self.is_logged_in = False
+        # Bumped on logout; writes compare it before touching the old session's widgets
+        self.login_generation = 0
         
         # Create authentication frame
         self.auth_frame = ttk.Frame(self.root, padding=20, style='Card.TFrame')
@@ -188,68 +207,12 @@ class SleepTrackerApp:
                        borderwidth=0)
     
     def init_database(self):
-        """Initialize the SQL Server database with required tables."""
+        """Initialize the configured database with required tables."""
         try:
-            # Connect to database
-            conn = connect_to_db()
-            cursor = conn.cursor()
-            
-            # Create Users table
-            cursor.execute('''
-            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='Users' AND xtype='U')
-            CREATE TABLE Users (
-                user_id INT IDENTITY(1,1) PRIMARY KEY,
-                username NVARCHAR(50) UNIQUE NOT NULL,
-                password NVARCHAR(100) NOT NULL,
-                name NVARCHAR(100),
-                email NVARCHAR(100),
-                date_created DATETIME DEFAULT GETDATE()
-            )
-            ''')
-            
-            # Create Sleep_Sessions table
-            cursor.execute('''
-            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='Sleep_Sessions' AND xtype='U')
-            CREATE TABLE Sleep_Sessions (
-                session_id INT IDENTITY(1,1) PRIMARY KEY,
-                user_id INT NOT NULL,
-                sleep_start_time DATETIME NOT NULL,
-                sleep_end_time DATETIME,
-                duration INT,
-                date DATE NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES Users (user_id)
-            )
-            ''')
-            
-            # Create Sleep_Quality table
-            cursor.execute('''
-            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='Sleep_Quality' AND xtype='U')
-            CREATE TABLE Sleep_Quality (
-                quality_id INT IDENTITY(1,1) PRIMARY KEY,
-                session_id INT NOT NULL,
-                rating INT CHECK (rating >= 1 AND rating <= 10),
-                times_woken INT DEFAULT 0,
-                notes NVARCHAR(MAX),
-                FOREIGN KEY (session_id) REFERENCES Sleep_Sessions (session_id)
-            )
-            ''')
-            
-            # Create Sleep_Factors table
-            cursor.execute('''
-            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='Sleep_Factors' AND xtype='U')
-            CREATE TABLE Sleep_Factors (
-                factor_id INT IDENTITY(1,1) PRIMARY KEY,
-                session_id INT NOT NULL,
-                caffeine_intake BIT DEFAULT 0,
-                exercise BIT DEFAULT 0,
-                screen_time_before_bed INT DEFAULT 0,
-                stress_level INT CHECK (stress_level >= 1 AND stress_level <= 10),
-                FOREIGN KEY (session_id) REFERENCES Sleep_Sessions (session_id)
-            )
-            ''')
-            
-            conn.commit()
-            conn.close()
+            with self.pool.connection() as conn:
+                applied = migrate(conn, self.backend)
+            if applied:
+                print(f"Applied schema migrations: {applied}")
             print("Database initialized successfully")
         except Exception as e:
             print(f"Error initializing database: {e}")
@@ -275,7 +238,8 @@ class SleepTrackerApp:
         self.password_entry = ttk.Entry(login_container, width=30, show="*", font=FONTS['body'])
         self.password_entry.pack(pady=5)
         
-        ttk.Button(login_container, text="Login", command=self.login, style='Primary.TButton').pack(pady=(20, 10))
+        self.login_button = ttk.Button(login_container, text="Login", command=self.login, style='Primary.TButton')
+        self.login_button.pack(pady=(20, 10))
         ttk.Button(login_container, text="Register", command=self.show_register_screen, style='Secondary.TButton').pack(pady=5)
     
     def show_register_screen(self):
@@ -313,62 +277,37 @@ class SleepTrackerApp:
         name = self.reg_name_entry.get()
         email = self.reg_email_entry.get()
         
-        if not username or not password:
-            messagebox.showerror("Error", "Username and password are required")
-            return
-        
-        try:
-            conn = connect_to_db()
-            cursor = conn.cursor()
-            
-            # Check if username already exists
-            cursor.execute("SELECT user_id FROM Users WHERE username = ?", (username,))
-            if cursor.fetchone():
-                messagebox.showerror("Error", "Username already exists")
-                conn.close()
-                return
-            
-            # Insert new user
-            cursor.execute(
-                "INSERT INTO Users (username, password, name, email) VALUES (?, ?, ?, ?)",
-                (username, password, name, email)
-            )
-            conn.commit()
-            conn.close()
-            
+        def on_registered(_):
             messagebox.showinfo("Success", "Registration successful! You can now login.")
             self.show_login_screen()
-        except Exception as e:
-            messagebox.showerror("Error", f"Registration failed: {e}")
+        
+        self.executor.submit(self.service.register, username, password, name, email,
+                             key='auth', on_success=on_registered,
+                             on_error=lambda e: messagebox.showerror(
+                                 "Error", self.error_message("Registration failed", e)))
     
     def login(self):
         """Authenticate the user and show the main app if successful."""
         username = self.username_entry.get()
         password = self.password_entry.get()
         
-        if not username or not password:
-            messagebox.showerror("Error", "Username and password are required")
-            return
-        
-        try:
-            conn = connect_to_db()
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "SELECT user_id FROM Users WHERE username = ? AND password = ?",
-                (username, password)
-            )
-            user = cursor.fetchone()
-            conn.close()
-            
-            if user:
-                self.current_user_id = user[0]
+        def on_authenticated(user_id):
+            if user_id is not None:
+                self.current_user_id = user_id
                 self.is_logged_in = True
                 self.show_main_app()
             else:
+                self.login_button.state(['!disabled'])
                 messagebox.showerror("Error", "Invalid username or password")
-        except Exception as e:
-            messagebox.showerror("Error", f"Login failed: {e}")
+        
+        def on_error(e):
+            self.login_button.state(['!disabled'])
+            messagebox.showerror("Error", self.error_message("Login failed", e))
+        
+        # Disabled while the credentials are being checked
+        self.login_button.state(['disabled'])
+        self.executor.submit(self.service.login, username, password, key='auth',
+                             on_success=on_authenticated, on_error=on_error)
     
     def show_main_app(self):
         """Display the main application after successful login."""
@@ -382,26 +321,32 @@ class SleepTrackerApp:
         # Create notebook for tabs
         self.notebook = ttk.Notebook(self.main_frame)
         self.notebook.pack(fill=tk.BOTH, expand=True)
+        # Tabs are built when first shown and refreshed after writes only when visible
+        self.tabs = LazyTabs(self.notebook)
         
         # Create dashboard frame
         self.dashboard_frame = ttk.Frame(self.notebook, padding=10)
-        self.notebook.add(self.dashboard_frame, text="Dashboard")
+        self.tabs.add(self.dashboard_frame, "Dashboard", self.update_dashboard)
         
         # Create history tab
         self.history_frame = ttk.Frame(self.notebook, padding=10)
-        self.notebook.add(self.history_frame, text="History")
+        self.tabs.add(self.history_frame, "History", self.update_history_tab,
+                      self.load_sleep_history)
         
         # Create statistics tab
         self.statistics_frame = ttk.Frame(self.notebook, padding=10)
-        self.notebook.add(self.statistics_frame, text="Statistics")
+        self.tabs.add(self.statistics_frame, "Statistics", self.update_statistics_tab,
+                      self.generate_statistics)
         
         # Create record sleep tab
         self.create_record_sleep_tab()
         
-        # Initialize dashboard
-        self.update_dashboard()
-        self.update_history_tab()
-        self.update_statistics_tab()
+        # Spawn the chart workers and load the analytics stack while the dashboard loads
+        self.chart_renderer.warm()
+        self.executor.submit(preload)
+        
+        # Only the dashboard is loaded up front
+        self.tabs.refresh_current()
         
         # Logout button
         ttk.Button(self.main_frame, text="Logout", command=self.logout).pack(pady=10)
@@ -422,36 +367,15 @@ class SleepTrackerApp:
         stats_frame = ttk.LabelFrame(left_frame, text="Sleep Summary", style='Card.TLabelframe', padding=15)
         stats_frame.pack(fill=tk.X, pady=10)
         
-        # Get sleep data
-        try:
-            conn = connect_to_db()
-            cursor = conn.cursor()
-            
-            # Get average sleep duration for last 7 days
-            cursor.execute('''
-            SELECT AVG(duration) FROM Sleep_Sessions
-            WHERE user_id = ? AND date >= DATEADD(day, -7, GETDATE())
-            ''', (self.current_user_id,))
-            avg_duration = cursor.fetchone()[0]
-            
-            # Get average sleep quality for last 7 days
-            cursor.execute('''
-            SELECT AVG(sq.rating) FROM Sleep_Quality sq
-            JOIN Sleep_Sessions ss ON sq.session_id = ss.session_id
-            WHERE ss.user_id = ? AND ss.date >= DATEADD(day, -7, GETDATE())
-            ''', (self.current_user_id,))
-            avg_quality = cursor.fetchone()[0]
-            
-            # Get last sleep session
-            cursor.execute('''
-            SELECT TOP 1 sleep_start_time, sleep_end_time, duration
-            FROM Sleep_Sessions
-            WHERE user_id = ?
-            ORDER BY sleep_start_time DESC
-            ''', (self.current_user_id,))
-            last_session = cursor.fetchone()
-            
-            conn.close()
+        # Get sleep data in the background
+        loading_label = ttk.Label(stats_frame, text="Loading sleep data...", style='Body.TLabel')
+        loading_label.pack(anchor="w", pady=5)
+        user_id = self.current_user_id
+        
+        def show_summary(summary):
+            loading_label.destroy()
+            avg_duration = summary.avg_duration
+            avg_quality = summary.avg_quality
             
             # Display stats with improved styling
             if avg_duration:
@@ -469,10 +393,10 @@ class SleepTrackerApp:
                 ttk.Label(stats_frame, text="Average Sleep Quality (7 days): No data", 
                          style='Body.TLabel').pack(anchor="w", pady=5)
             
-            if last_session:
-                start_time = last_session[0]
-                end_time = last_session[1] if last_session[1] else "In progress"
-                duration = f"{round(last_session[2] / 60, 1)} hours" if last_session[2] else "In progress"
+            if summary.last_start:
+                start_time = summary.last_start
+                end_time = summary.last_end if summary.last_end else "In progress"
+                duration = f"{round(summary.last_duration / 60, 1)} hours" if summary.last_duration else "In progress"
                 
                 ttk.Label(stats_frame, text="Last Sleep Session:", 
                          style='Subheader.TLabel').pack(anchor="w", pady=(10, 5))
@@ -486,9 +410,11 @@ class SleepTrackerApp:
                 ttk.Label(stats_frame, text="Last Sleep Session: No data", 
                          style='Body.TLabel').pack(anchor="w", pady=5)
         
-        except Exception as e:
-            ttk.Label(stats_frame, text=f"Error retrieving sleep data: {e}", 
-                     style='Body.TLabel').pack(anchor="w", pady=5)
+        def show_error(e):
+            loading_label.configure(text=f"Error retrieving sleep data: {e}")
+        
+        self.executor.submit(self.repository.dashboard_summary, user_id, key='dashboard',
+                             on_success=show_summary, on_error=show_error)
         
         # Quick actions
         actions_frame = ttk.LabelFrame(left_frame, text="Quick Actions", style='Card.TLabelframe', padding=15)
@@ -518,10 +444,10 @@ class SleepTrackerApp:
         self.history_tree.column("end_time", width=100)
         self.history_tree.column("duration", width=100)
         self.history_tree.column("quality", width=100)
-        scrollbar = ttk.Scrollbar(history_frame, orient=tk.VERTICAL, command=self.history_tree.yview)
-        self.history_tree.configure(yscroll=scrollbar.set)
+        self.history_scrollbar = ttk.Scrollbar(history_frame, orient=tk.VERTICAL, command=self.history_tree.yview)
+        self.history_tree.configure(yscroll=self.on_history_scroll)
         self.history_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.history_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.load_sleep_history()
     
     def update_statistics_tab(self):
@@ -536,13 +462,21 @@ class SleepTrackerApp:
         range_frame.pack(fill=tk.X, pady=10)
         ttk.Label(range_frame, text="Time Range:", style='Body.TLabel').pack(side=tk.LEFT, padx=5)
         self.time_range = ttk.Combobox(range_frame, width=15, 
-                                     values=["Last 7 Days", "Last 30 Days", "Last 90 Days", "All Time"],
+                                     values=list(TIME_RANGES),
                                      font=FONTS['body'])
         self.time_range.pack(side=tk.LEFT, padx=5)
         self.time_range.set("Last 7 Days")
+        self.time_range.bind("<<ComboboxSelected>>", self.generate_statistics)
         ttk.Button(range_frame, text="Generate Statistics", command=self.generate_statistics, style='Primary.TButton').pack(side=tk.LEFT, padx=5)
         self.charts_frame = ttk.Frame(self.statistics_frame, style='Card.TFrame')
         self.charts_frame.pack(fill=tk.BOTH, expand=True, pady=10)
+        
+        self.stats_status = ttk.Label(self.charts_frame, text="", style='Body.TLabel')
+        self.stats_status.pack(pady=5)
+        self.stats_chart = ttk.Label(self.charts_frame, background=COLORS['white'])
+        self.stats_photo = None
+        self.stats_details = ttk.Frame(self.charts_frame)
+        self.stats_details.pack(fill=tk.X)
         self.generate_statistics()
     
     def create_record_sleep_tab(self):
@@ -641,79 +575,53 @@ class SleepTrackerApp:
         # Save button
         ttk.Button(record_frame, text="Save Sleep Record", command=self.save_sleep_record).pack(pady=10)
     
-    def generate_statistics(self):
+    def generate_statistics(self, event=None):
         """Generate sleep statistics based on selected time range."""
-        # Clear existing charts
-        for widget in self.charts_frame.winfo_children():
+        days_back = TIME_RANGES.get(self.time_range.get(), 7)
+        
+        self.stats_status.config(text="Loading statistics...")
+        
+        # A newer range selection supersedes any request still in flight
+        self.executor.submit(self.load_statistics, self.current_user_id, days_back,
+                             key='statistics', on_success=self.show_statistics,
+                             on_error=self.show_statistics_error)
+    
+    def load_statistics(self, user_id, days_back):
+        """SleepStatistics and the chart PNG (base64) for a range (runs on a worker thread)."""
+        stats = self.analytics.statistics(user_id, days_back)
+        if stats is None:
+            return None
+        return stats, self.render_statistics_chart(user_id, days_back, stats.series)
+    
+    def render_statistics_chart(self, user_id, days_back, df):
+        """Base64 PNG of the range's charts, from the bitmap cache when unchanged."""
+        from sleep_tracker.frames import as_float
+        png = self.chart_renderer.render(user_id, days_back, df['date'],
+                                         as_float(df['duration']), as_float(df['rating']))
+        return base64.b64encode(png)
+    
+    def show_statistics(self, result):
+        """Render statistics produced by load_statistics."""
+        for widget in self.stats_details.winfo_children():
             widget.destroy()
         
-        # Get date range
-        range_selection = self.time_range.get()
-        days_back = 7
-        if range_selection == "Last 30 Days":
-            days_back = 30
-        elif range_selection == "Last 90 Days":
-            days_back = 90
-        elif range_selection == "All Time":
-            days_back = 3650  # ~10 years
+        if result is None:
+            self.stats_chart.pack_forget()
+            self.stats_status.config(text="No sleep data available for selected time range")
+            return
         
         try:
-            conn = connect_to_db()
+            stats, chart = result
+            self.stats_status.config(text="")
             
-            # Get sleep data
-            query = f'''
-            SELECT ss.date, ss.duration, sq.rating, sf.caffeine_intake, sf.exercise, 
-                   sf.screen_time_before_bed, sf.stress_level
-            FROM Sleep_Sessions ss
-            LEFT JOIN Sleep_Quality sq ON ss.session_id = sq.session_id
-            LEFT JOIN Sleep_Factors sf ON ss.session_id = sf.session_id
-            WHERE ss.user_id = ? AND ss.date >= DATEADD(day, -{days_back}, GETDATE())
-            ORDER BY ss.date
-            '''
-            
-            df = pd.read_sql_query(query, conn, params=(self.current_user_id,))
-            conn.close()
-            
-            if df.empty:
-                ttk.Label(self.charts_frame, text="No sleep data available for selected time range",
-                         style='Body.TLabel').pack(pady=20)
-                return
-            
-            # Convert duration from minutes to hours
-            df['duration'] = df['duration'] / 60
-            
-            # Create figure with subplots
-            fig = Figure(figsize=(10, 8), dpi=100)
-            fig.patch.set_facecolor(COLORS['white'])
-            
-            # Sleep duration over time
-            ax1 = fig.add_subplot(2, 1, 1)
-            ax1.plot(df['date'], df['duration'], 'o-', color=COLORS['secondary'], linewidth=2, markersize=8)
-            ax1.set_title('Sleep Duration Over Time', fontsize=14, pad=20)
-            ax1.set_ylabel('Hours', fontsize=12)
-            ax1.set_xlabel('Date', fontsize=12)
-            ax1.grid(True, linestyle='--', alpha=0.7)
-            ax1.set_facecolor(COLORS['white'])
-            
-            # Sleep quality over time
-            ax2 = fig.add_subplot(2, 1, 2)
-            ax2.plot(df['date'], df['rating'], 'o-', color=COLORS['success'], linewidth=2, markersize=8)
-            ax2.set_title('Sleep Quality Over Time', fontsize=14, pad=20)
-            ax2.set_ylabel('Quality Rating (1-10)', fontsize=12)
-            ax2.set_xlabel('Date', fontsize=12)
-            ax2.grid(True, linestyle='--', alpha=0.7)
-            ax2.set_facecolor(COLORS['white'])
-            
-            # Adjust layout
-            fig.subplots_adjust(hspace=0.4)
-            
-            # Embed in tkinter
-            canvas = FigureCanvasTkAgg(fig, master=self.charts_frame)
-            canvas.draw()
-            canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+            # The chart arrives pre-rendered; keep a reference or Tk drops the image
+            self.stats_photo = tk.PhotoImage(data=chart, format='png')
+            self.stats_chart.configure(image=self.stats_photo)
+            if not self.stats_chart.winfo_manager():
+                self.stats_chart.pack(padx=10, pady=10, before=self.stats_details)
             
             # Summary statistics
-            summary_frame = ttk.LabelFrame(self.charts_frame, text="Summary Statistics", 
+            summary_frame = ttk.LabelFrame(self.stats_details, text="Summary Statistics", 
                                          style='Card.TLabelframe', padding=15)
             summary_frame.pack(fill=tk.X, pady=10, padx=10)
             
@@ -721,10 +629,9 @@ class SleepTrackerApp:
             stats_grid = ttk.Frame(summary_frame)
             stats_grid.pack(fill=tk.X, pady=5)
             
-            # Calculate statistics
-            avg_duration = df['duration'].mean()
-            avg_quality = df['rating'].mean()
-            correlation = df['duration'].corr(df['rating']) if len(df) > 1 else None
+            avg_duration = stats.avg_duration
+            avg_quality = stats.avg_quality
+            correlation = stats.correlation
             
             # Duration stats
             duration_frame = ttk.Frame(stats_grid, style='Card.TFrame', padding=10)
@@ -752,172 +659,151 @@ class SleepTrackerApp:
                          style='Value.TLabel').pack(anchor="w")
             
             # Factors analysis
-            if 'caffeine_intake' in df.columns and not df['caffeine_intake'].isna().all():
-                factors_frame = ttk.LabelFrame(self.charts_frame, text="Sleep Factors Analysis", 
+            factors = stats.factors
+            if not factors.empty:
+                factors_frame = ttk.LabelFrame(self.stats_details, text="Sleep Factors Analysis", 
                                              style='Card.TLabelframe', padding=15)
                 factors_frame.pack(fill=tk.X, pady=10, padx=10)
                 
-                factors_grid = ttk.Frame(factors_frame)
-                factors_grid.pack(fill=tk.X, pady=5)
+                columns = ("Factor", "Level", "Nights", "Hours", "Δ Hours", "d (Hours)",
+                           "Rating", "Δ Rating", "d (Rating)")
+                by_level = factors.set_index(['factor', 'level', 'outcome'])
+                nights = factors.groupby(['factor', 'level'], sort=False, observed=True)['n'].max()
+                factors_tree = ttk.Treeview(factors_frame, columns=columns, show="headings",
+                                            height=len(nights))
+                for col in columns:
+                    factors_tree.heading(col, text=col)
+                    factors_tree.column(col, width=90, anchor="center")
                 
-                # Caffeine effect
-                caffeine_effect = df.groupby('caffeine_intake')['duration'].mean()
-                caffeine_frame = ttk.Frame(factors_grid, style='Card.TFrame', padding=10)
-                caffeine_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5)
-                ttk.Label(caffeine_frame, text="With Caffeine", 
-                         style='Subheader.TLabel').pack(anchor="w")
-                ttk.Label(caffeine_frame, text=f"{caffeine_effect.get(1, 0):.2f} hours", 
-                         style='Value.TLabel').pack(anchor="w")
-                
-                # No caffeine effect
-                no_caffeine_frame = ttk.Frame(factors_grid, style='Card.TFrame', padding=10)
-                no_caffeine_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5)
-                ttk.Label(no_caffeine_frame, text="Without Caffeine", 
-                         style='Subheader.TLabel').pack(anchor="w")
-                ttk.Label(no_caffeine_frame, text=f"{caffeine_effect.get(0, 0):.2f} hours", 
-                         style='Value.TLabel').pack(anchor="w")
-                
-                # Exercise effect
-                if 'exercise' in df.columns and not df['exercise'].isna().all():
-                    exercise_effect = df.groupby('exercise')['duration'].mean()
-                    exercise_frame = ttk.Frame(factors_grid, style='Card.TFrame', padding=10)
-                    exercise_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5)
-                    ttk.Label(exercise_frame, text="With Exercise", 
-                             style='Subheader.TLabel').pack(anchor="w")
-                    ttk.Label(exercise_frame, text=f"{exercise_effect.get(1, 0):.2f} hours", 
-                             style='Value.TLabel').pack(anchor="w")
-                    
-                    no_exercise_frame = ttk.Frame(factors_grid, style='Card.TFrame', padding=10)
-                    no_exercise_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5)
-                    ttk.Label(no_exercise_frame, text="Without Exercise", 
-                             style='Subheader.TLabel').pack(anchor="w")
-                    ttk.Label(no_exercise_frame, text=f"{exercise_effect.get(0, 0):.2f} hours", 
-                             style='Value.TLabel').pack(anchor="w")
+                for (factor, level), count in nights.items():
+                    cells = []
+                    for outcome in ('duration', 'rating'):
+                        key = (factor, level, outcome)
+                        if key in by_level.index:
+                            cells.extend(self.format_factor_effect(by_level.loc[key]))
+                        else:
+                            cells.extend(("N/A", "", ""))
+                    factors_tree.insert("", "end", values=(factor, level, count, *cells))
+                factors_tree.pack(fill=tk.X, pady=5)
         
         except Exception as e:
-            ttk.Label(self.charts_frame, text=f"Error generating statistics: {e}", 
-                     style='Body.TLabel').pack(pady=20)
+            self.show_statistics_error(e)
+    
+    @staticmethod
+    def format_factor_effect(row):
+        """Mean, difference from baseline (with 95% CI half-width) and Cohen's d."""
+        if row['baseline']:
+            return f"{row['mean']:.2f}", "baseline", ""
+        delta = f"{row['delta']:+.2f}"
+        if not math.isnan(row['delta_ci_low']):
+            delta += f" ±{(row['delta_ci_high'] - row['delta_ci_low']) / 2:.2f}"
+        effect = f"{row['effect_size']:+.2f}" if not math.isnan(row['effect_size']) else ""
+        return f"{row['mean']:.2f}", delta, effect
+    
+    def show_statistics_error(self, e):
+        """Replace the statistics area with an error message."""
+        for widget in self.stats_details.winfo_children():
+            widget.destroy()
+        self.stats_chart.pack_forget()
+        self.stats_status.config(text=f"Error generating statistics: {e}")
     
     def load_sleep_history(self):
-        """Load sleep history into the treeview."""
+        """Load the first page of sleep history into the treeview."""
         # Clear existing items
-        for item in self.history_tree.get_children():
-            self.history_tree.delete(item)
-        
-        try:
-            conn = connect_to_db()
-            cursor = conn.cursor()
-            
-            # Get sleep records
-            cursor.execute('''
-            SELECT ss.date, ss.sleep_start_time, ss.sleep_end_time, ss.duration, sq.rating
-            FROM Sleep_Sessions ss
-            LEFT JOIN Sleep_Quality sq ON ss.session_id = sq.session_id
-            WHERE ss.user_id = ?
-            ORDER BY ss.date DESC, ss.sleep_start_time DESC
-            ''', (self.current_user_id,))
-            
-            records = cursor.fetchall()
-            conn.close()
+        self.history_tree.delete(*self.history_tree.get_children())
+        self.history_next_key = None
+        self.history_exhausted = False
+        self.history_loading = False
+        self.load_more_history()
+    
+    def load_more_history(self):
+        """Fetch the next page of sleep history in the background and append it."""
+        if self.history_exhausted or self.history_loading:
+            return
+        self.history_loading = True
+        tree = self.history_tree
+        user_id = self.current_user_id
+        after = self.history_next_key
+        
+        def show_page(records):
+            self.history_loading = False
+            if len(records) < PAGE_SIZE:
+                self.history_exhausted = True
+            if records:
+                self.history_next_key = page_key(records[-1])
             
             # Insert records into treeview
             for record in records:
-                date = record[0]
-                start_time = record[1].strftime("%H:%M")
-                end_time = record[2].strftime("%H:%M") if record[2] else "In progress"
-                duration = f"{record[3] / 60:.2f}" if record[3] else "N/A"
-                quality = record[4] if record[4] else "N/A"
+                date = record[1]
+                start_time = record[2].strftime("%H:%M")
+                end_time = record[3].strftime("%H:%M") if record[3] else "In progress"
+                duration = f"{record[4] / 60:.2f}" if record[4] else "N/A"
+                quality = record[5] if record[5] else "N/A"
                 
-                self.history_tree.insert("", tk.END, values=(date, start_time, end_time, duration, quality))
+                tree.insert("", tk.END, values=(date, start_time, end_time, duration, quality))
         
-        except Exception as e:
+        def show_error(e):
+            self.history_loading = False
+            self.history_exhausted = True
             messagebox.showerror("Error", f"Failed to load sleep history: {e}")
+        
+        self.executor.submit(self.repository.history_page, user_id, after, key='history',
+                             on_success=show_page, on_error=show_error)
+    
+    def on_history_scroll(self, first, last):
+        """Update the scrollbar and fetch another page when nearing the end."""
+        self.history_scrollbar.set(first, last)
+        if float(last) >= 0.9:
+            self.load_more_history()
+    
+    def is_current_login(self, generation):
+        """True while the login that captured ``generation`` has not logged out."""
+        return self.is_logged_in and generation == self.login_generation
     
     def start_sleep_session(self):
         """Start a new sleep session."""
-        try:
-            conn = connect_to_db()
-            cursor = conn.cursor()
-            
-            # Check if there's an active session
-            cursor.execute('''
-            SELECT session_id FROM Sleep_Sessions
-            WHERE user_id = ? AND sleep_end_time IS NULL
-            ''', (self.current_user_id,))
-            
-            active_session = cursor.fetchone()
-            
-            if active_session:
+        user_id = self.current_user_id
+        generation = self.login_generation
+        
+        def on_started(current_time):
+            if current_time is None:
                 messagebox.showinfo("Already Active", "You already have an active sleep session. End it before starting a new one.")
-                conn.close()
                 return
             
-            # Insert new session
-            current_time = datetime.now()
-            current_date = current_time.date()
-            
-            cursor.execute('''
-            INSERT INTO Sleep_Sessions (user_id, sleep_start_time, date)
-            VALUES (?, ?, ?)
-            ''', (self.current_user_id, current_time, current_date))
-            
-            conn.commit()
-            conn.close()
-            
             messagebox.showinfo("Success", f"Sleep session started at {current_time}")
+            if not self.is_current_login(generation):
+                return
             
-            # Refresh dashboard
-            self.notebook.select(0)  # Switch to dashboard tab
-            self.update_dashboard()
+            # Show the dashboard; other tabs catch up when next opened
+            self.tabs.mark_dirty()
+            self.notebook.select(self.dashboard_frame)
         
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to start sleep session: {e}")
+        self.executor.submit(self.service.start_session, user_id, on_success=on_started,
+                             on_error=lambda e: messagebox.showerror("Error", f"Failed to start sleep session: {e}"))
     
     def end_sleep_session(self):
         """End the current sleep session."""
-        try:
-            conn = connect_to_db()
-            cursor = conn.cursor()
-            
-            # Check for active session
-            cursor.execute('''
-            SELECT session_id, sleep_start_time FROM Sleep_Sessions
-            WHERE user_id = ? AND sleep_end_time IS NULL
-            ''', (self.current_user_id,))
-            
-            active_session = cursor.fetchone()
-            
-            if not active_session:
+        user_id = self.current_user_id
+        generation = self.login_generation
+        
+        def on_ended(ended):
+            if ended is None:
                 messagebox.showinfo("No Active Session", "You don't have an active sleep session to end.")
-                conn.close()
                 return
-            
-            session_id = active_session[0]
-            start_time = active_session[1]
-            end_time = datetime.now()
-            
-            # Calculate duration in minutes
-            duration = int((end_time - start_time).total_seconds() / 60)
-            
-            # Update session
-            cursor.execute('''
-            UPDATE Sleep_Sessions
-            SET sleep_end_time = ?, duration = ?
-            WHERE session_id = ?
-            ''', (end_time, duration, session_id))
-            
-            conn.commit()
-            conn.close()
+            if not self.is_current_login(generation):
+                # Logged out meanwhile: the session is closed, but no one is left to rate it
+                messagebox.showinfo("Success", f"Sleep session ended after {ended.duration / 60:.2f} hours")
+                return
             
             # Ask for sleep quality data
-            self.show_end_session_dialog(session_id, duration)
-            self.update_history_tab()
+            self.show_end_session_dialog(ended)
+            self.tabs.mark_dirty()
         
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to end sleep session: {e}")
+        self.executor.submit(self.service.end_session, user_id, on_success=on_ended,
+                             on_error=lambda e: messagebox.showerror("Error", f"Failed to end sleep session: {e}"))
     
-    def show_end_session_dialog(self, session_id, duration):
-        """Show dialog to collect sleep quality data."""
+    def show_end_session_dialog(self, session):
+        """Show dialog to collect sleep quality data for an EndedSession."""
         dialog = tk.Toplevel(self.root)
         dialog.title("Sleep Session Ended")
         dialog.geometry("400x500")
@@ -925,7 +811,7 @@ class SleepTrackerApp:
         dialog.grab_set()
         
         ttk.Label(dialog, text=f"Sleep Session Ended", font=("Arial", 16)).pack(pady=10)
-        ttk.Label(dialog, text=f"Duration: {duration / 60:.2f} hours").pack(pady=5)
+        ttk.Label(dialog, text=f"Duration: {session.duration / 60:.2f} hours").pack(pady=5)
         
         # Sleep quality
         quality_frame = ttk.LabelFrame(dialog, text="Sleep Quality", padding=10)
@@ -980,105 +866,57 @@ class SleepTrackerApp:
         
         def save_quality_data():
             try:
-                conn = connect_to_db()
-                cursor = conn.cursor()
-                
-                # Insert quality data
-                cursor.execute('''
-                INSERT INTO Sleep_Quality (session_id, rating, times_woken, notes)
-                VALUES (?, ?, ?, ?)
-                ''', (session_id, int(quality_scale.get()), int(times_woken.get()), notes_text.get("1.0", tk.END).strip()))
-                
-                # Insert factors data
-                cursor.execute('''
-                INSERT INTO Sleep_Factors 
-                (session_id, caffeine_intake, exercise, screen_time_before_bed, stress_level)
-                VALUES (?, ?, ?, ?, ?)
-                ''', (session_id, caffeine_var.get(), exercise_var.get(), 
-                      int(screen_time.get()), int(stress_level.get())))
-                
-                conn.commit()
-                conn.close()
-                
+                quality = parse_quality(quality_scale.get(), times_woken.get(),
+                                        notes_text.get("1.0", tk.END), caffeine_var.get(),
+                                        exercise_var.get(), screen_time.get(), stress_level.get())
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to save sleep data: {e}")
+                return
+            user_id = self.current_user_id
+            generation = self.login_generation
+            
+            def on_saved(_):
                 messagebox.showinfo("Success", "Sleep data saved successfully!")
-                dialog.destroy()
+                if dialog.winfo_exists():
+                    dialog.destroy()
                 
-                # Refresh dashboard
-                self.update_dashboard()
-                self.update_history_tab()
-                
-            except Exception as e:
+                # Refresh whichever tabs are shown; the rest when next opened
+                if self.is_current_login(generation):
+                    self.tabs.mark_dirty()
+            
+            def on_error(e):
+                if dialog.winfo_exists():
+                    save_button.state(['!disabled'])
                 messagebox.showerror("Error", f"Failed to save sleep data: {e}")
+            
+            save_button.state(['disabled'])
+            self.executor.submit(self.service.record_quality, user_id, session, quality,
+                                 on_success=on_saved, on_error=on_error)
         
-        ttk.Button(dialog, text="Save Sleep Data", command=save_quality_data).pack(pady=10)
+        save_button = ttk.Button(dialog, text="Save Sleep Data", command=save_quality_data)
+        save_button.pack(pady=10)
     
     def save_sleep_record(self):
         """Save a manual sleep record from the form."""
         try:
-            # Get form data
-            date_str = self.date_entry.get()
-            start_hour = self.sleep_start_hour.get()
-            start_min = self.sleep_start_min.get()
-            end_hour = self.sleep_end_hour.get()
-            end_min = self.sleep_end_min.get()
-            
-            # Validate time format
-            try:
-                start_time = datetime.strptime(f"{date_str} {start_hour}:{start_min}", "%Y-%m-%d %H:%M")
-                end_time = datetime.strptime(f"{date_str} {end_hour}:{end_min}", "%Y-%m-%d %H:%M")
-                
-                # Handle overnight sleep (end time earlier than start time)
-                if end_time < start_time:
-                    end_time += timedelta(days=1)
-                
-                # Calculate duration in minutes
-                duration = int((end_time - start_time).total_seconds() / 60)
-                
-            except ValueError as e:
-                messagebox.showerror("Error", f"Invalid date or time format: {e}")
-                return
-            
-            # Get quality data
-            quality_rating = int(self.quality_scale.get())
-            times_woken = int(self.times_woken.get())
-            notes = self.notes_text.get("1.0", tk.END).strip()
-            
-            # Get factors data
-            caffeine = self.caffeine_var.get()
-            exercise = self.exercise_var.get()
-            screen_time = int(self.screen_time.get())
-            stress_level = int(self.stress_level.get())
-            
-            # Save to database
-            conn = connect_to_db()
-            cursor = conn.cursor()
-            
-            # Insert sleep session
-            cursor.execute('''
-            INSERT INTO Sleep_Sessions (user_id, sleep_start_time, sleep_end_time, duration, date)
-            VALUES (?, ?, ?, ?, ?)
-            ''', (self.current_user_id, start_time, end_time, duration, start_time.date()))
-            
-            session_id = cursor.execute("SELECT SCOPE_IDENTITY()").fetchval()
-            
-            # Insert quality data
-            cursor.execute('''
-            INSERT INTO Sleep_Quality (session_id, rating, times_woken, notes)
-            VALUES (?, ?, ?, ?)
-            ''', (session_id, quality_rating, times_woken, notes))
-            
-            # Insert factors data
-            cursor.execute('''
-            INSERT INTO Sleep_Factors 
-            (session_id, caffeine_intake, exercise, screen_time_before_bed, stress_level)
-            VALUES (?, ?, ?, ?, ?)
-            ''', (session_id, caffeine, exercise, screen_time, stress_level))
-            
-            conn.commit()
-            conn.close()
-            
+            quality = parse_quality(self.quality_scale.get(), self.times_woken.get(),
+                                    self.notes_text.get("1.0", tk.END), self.caffeine_var.get(),
+                                    self.exercise_var.get(), self.screen_time.get(),
+                                    self.stress_level.get())
+            record = parse_record(self.date_entry.get(), self.sleep_start_hour.get(),
+                                  self.sleep_start_min.get(), self.sleep_end_hour.get(),
+                                  self.sleep_end_min.get(), quality)
+            user_id = self.current_user_id
+        except Exception as e:
+            messagebox.showerror("Error", self.error_message("Failed to save sleep record", e))
+            return
+        generation = self.login_generation
+        
+        def on_saved(_):
             messagebox.showinfo("Success", "Sleep record saved successfully!")
-            
+            if not self.is_current_login(generation):
+                return
+        
             # Clear form
             self.date_entry.delete(0, tk.END)
             self.date_entry.insert(0, datetime.now().strftime("%Y-%m-%d"))
@@ -1089,18 +927,36 @@ class SleepTrackerApp:
             self.screen_time.set(30)
             self.stress_level.set(5)
             self.notes_text.delete("1.0", tk.END)
-            
-            # Refresh dashboard
-            self.update_dashboard()
-            self.update_history_tab()
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save sleep record: {e}")
+        
+            # Refresh whichever tabs are shown; the rest when next opened
+            self.tabs.mark_dirty()
+    
+        # Save to database in the background
+        self.executor.submit(self.service.record_sleep, user_id, record, on_success=on_saved,
+                             on_error=lambda e: messagebox.showerror("Error", f"Failed to save sleep record: {e}"))
+    
+    @staticmethod
+    def error_message(action, e):
+        """Validation messages are shown as they are; anything else names the failed action."""
+        return str(e) if isinstance(e, ValidationError) else f"{action}: {e}"
+    
+    def dump_query_stats(self, event=None):
+        """Print per-query latency and row-count percentiles and save them as JSON."""
+        print(QUERY_STATS.report())
+        try:
+            print(f"Query statistics saved to {QUERY_STATS.dump()}")
+        except OSError as e:
+            print(f"Could not save query statistics: {e}")
     
     def logout(self):
         """Log out the current user and return to login screen."""
         self.current_user_id = None
         self.is_logged_in = False
+        self.login_generation += 1
+        
+        # Drop results of reads still in flight for the old session; writes
+        # still report back, but skip the widgets destroyed here
+        self.executor.cancel()
         
         # Destroy main frame
         self.main_frame.destroy()
@@ -1116,3 +972,6 @@ if __name__ == "__main__":
     root = tk.Tk()
     app = SleepTrackerApp(root)
     root.mainloop()
+    app.executor.shutdown()
+    app.chart_renderer.shutdown()
+    app.pool.close()
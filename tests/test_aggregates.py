@@ -0,0 +1,56 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sleep_tracker import synthetic
+from sleep_tracker.aggregates import fetch_statistics
+from sleep_tracker.factors import RESULT_COLUMNS, analyze
+from sleep_tracker.migrations import migrate
+from sleep_tracker.storage import SqliteBackend, window_start
+
+RAW_QUERY = '''
+SELECT ss.date, CAST(ss.duration AS FLOAT) / 60 AS duration, sq.rating, sq.times_woken,
+       sf.caffeine_intake, sf.exercise, sf.screen_time_before_bed, sf.stress_level
+FROM Sleep_Sessions ss
+LEFT JOIN Sleep_Quality sq ON ss.session_id = sq.session_id
+LEFT JOIN Sleep_Factors sf ON ss.session_id = sf.session_id
+WHERE ss.user_id = ? AND ss.date >= ?
+'''
+
+
+@pytest.fixture(scope='module')
+def seeded(tmp_path_factory):
+    backend = SqliteBackend(str(tmp_path_factory.mktemp('aggregates') / 'seeded.db'))
+    conn = backend.connect()
+    migrate(conn, backend)
+    # Open sessions (NULL duration) and missing quality/factor rows are included
+    synthetic.generate(conn, backend, users=3, nights=400, seed=4, in_progress=1.0,
+                       end_date=date.today())
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize('days', [7, 30, 90, 3650])
+def test_sql_aggregates_match_pandas_analysis(seeded, days):
+    for user_id in (1, 2, 3):
+        frame = pd.read_sql_query(RAW_QUERY, seeded, params=(user_id, window_start(days)))
+        summary = fetch_statistics(seeded, user_id, days)
+
+        assert summary.sessions == frame['duration'].count()
+        assert summary.avg_duration == pytest.approx(frame['duration'].mean(), rel=1e-12)
+        assert summary.avg_quality == pytest.approx(frame['rating'].mean(), rel=1e-12)
+        assert summary.correlation == pytest.approx(
+            frame['duration'].corr(frame['rating']), rel=1e-9)
+
+        expected = analyze(frame)
+        actual = summary.factors
+        assert list(actual.columns) == RESULT_COLUMNS
+        assert actual[['factor', 'level', 'outcome', 'baseline']].astype(str).values.tolist() == \
+            expected[['factor', 'level', 'outcome', 'baseline']].astype(str).values.tolist()
+        numeric = [column for column in RESULT_COLUMNS if column not in
+                   ('factor', 'level', 'outcome', 'baseline')]
+        np.testing.assert_allclose(actual[numeric].to_numpy(dtype=float),
+                                   expected[numeric].to_numpy(dtype=float),
+                                   rtol=1e-9, atol=1e-12, equal_nan=True)
@@ -0,0 +1,118 @@
+import pandas as pd
+import pytest
+
+from sleep_tracker.bulk_import import import_file, validate
+from sleep_tracker.migrations import migrate
+from sleep_tracker.storage import SqliteBackend
+
+NIGHT = {'sleep_start_time': '2024-03-01 22:30', 'sleep_end_time': '2024-03-02 06:30'}
+
+
+@pytest.fixture
+def db(tmp_path):
+    backend = SqliteBackend(str(tmp_path / 'import.db'))
+    conn = backend.connect()
+    migrate(conn, backend)
+    conn.execute("INSERT INTO Users (user_id, username, password) VALUES (1, 'alice', 'pw')")
+    conn.commit()
+    yield conn, backend
+    conn.close()
+
+
+def _count(conn, table):
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+@pytest.mark.parametrize('column, value', [
+    ('rating', 7.5),
+    ('stress_level', 3.2),
+    ('times_woken', 1.5),
+    ('screen_time_before_bed', 12.25),
+    ('user_id', 1.5),
+])
+def test_fractional_integer_values_are_rejected(column, value):
+    frame = pd.DataFrame([{**NIGHT, 'user_id': 1, 'rating': 7, column: value},
+                          {**NIGHT, 'user_id': 1, 'rating': 7}])
+    clean, rejected = validate(frame)
+    assert rejected == 1
+    assert len(clean) == 1
+
+
+@pytest.mark.parametrize('column, value', [
+    ('rating', 0),
+    ('rating', 11),
+    ('stress_level', 11),
+    ('times_woken', -1),
+    ('screen_time_before_bed', -5),
+])
+def test_out_of_range_values_are_rejected(column, value):
+    frame = pd.DataFrame([{**NIGHT, 'user_id': 1, column: value}])
+    clean, rejected = validate(frame)
+    assert rejected == 1
+    assert clean.empty
+
+
+def test_unparseable_and_inverted_times_are_rejected():
+    frame = pd.DataFrame([
+        {'user_id': 1, 'sleep_start_time': 'not a time', 'sleep_end_time': '2024-03-02 06:30'},
+        {'user_id': 1, 'sleep_start_time': '2024-03-02 06:30', 'sleep_end_time': '2024-03-01 22:30'},
+        {'user_id': 1, 'sleep_start_time': '2024-03-01 22:30', 'sleep_end_time': '2024-03-03 22:30'},
+    ])
+    clean, rejected = validate(frame)
+    assert rejected == 3
+    assert clean.empty
+
+
+def test_missing_user_id_without_default_raises():
+    with pytest.raises(ValueError):
+        validate(pd.DataFrame([NIGHT]))
+
+
+def test_unknown_users_are_rejected(db, tmp_path):
+    conn, backend = db
+    path = tmp_path / 'nights.csv'
+    pd.DataFrame([{**NIGHT, 'user_id': 1, 'rating': 8},
+                  {**NIGHT, 'user_id': 2, 'rating': 8},
+                  {**NIGHT, 'user_id': 1, 'rating': 6}]).to_csv(path, index=False)
+
+    # One row per chunk: the unknown user must not fail a later chunk mid-import
+    report = import_file(conn, backend, str(path), chunk_size=1)
+
+    assert (report.rows_read, report.rows_imported, report.rows_rejected) == (3, 2, 1)
+    assert _count(conn, 'Sleep_Sessions') == 2
+    assert _count(conn, 'Sleep_Quality') == 2
+
+
+def test_bad_rows_are_counted_and_good_rows_imported(db, tmp_path):
+    conn, backend = db
+    path = tmp_path / 'nights.csv'
+    pd.DataFrame([{**NIGHT, 'rating': 7.5, 'stress_level': 4},
+                  {**NIGHT, 'rating': 8, 'stress_level': 4.5},
+                  {**NIGHT, 'rating': 8, 'times_woken': 2, 'stress_level': 4}]).to_csv(path, index=False)
+
+    report = import_file(conn, backend, str(path), user_id=1)
+
+    assert (report.rows_imported, report.rows_rejected) == (1, 2)
+    assert conn.execute("SELECT rating, times_woken FROM Sleep_Quality").fetchall() == [(8, 2)]
+    assert conn.execute("SELECT stress_level FROM Sleep_Factors").fetchall() == [(4,)]
+
+
+def test_ids_of_deleted_sessions_are_not_reused(db, tmp_path):
+    conn, backend = db
+    path = tmp_path / 'nights.csv'
+    pd.DataFrame([{**NIGHT, 'rating': 7}, {**NIGHT, 'rating': 8}]).to_csv(path, index=False)
+    import_file(conn, backend, str(path), user_id=1)
+    conn.execute("DELETE FROM Sleep_Quality WHERE session_id = 2")
+    conn.execute("DELETE FROM Sleep_Factors WHERE session_id = 2")
+    conn.execute("DELETE FROM Sleep_Sessions WHERE session_id = 2")
+    conn.commit()
+
+    import_file(conn, backend, str(path), user_id=1)
+
+    assert conn.execute("SELECT session_id FROM Sleep_Sessions ORDER BY 1").fetchall() == \
+        [(1,), (3,), (4,)]
+    # Child rows follow the ids SQLite assigned
+    assert conn.execute("SELECT session_id, rating FROM Sleep_Quality ORDER BY 1").fetchall() == \
+        [(1, 7), (3, 7), (4, 8)]
+    assert conn.execute("SELECT session_id FROM Sleep_Factors ORDER BY 1").fetchall() == \
+        [(1,), (3,), (4,)]
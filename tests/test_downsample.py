@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from sleep_tracker.downsample import downsample, lttb, minmax, spread_band
+
+
+@pytest.fixture
+def series():
+    rng = np.random.default_rng(5)
+    x = np.arange('2014-01-01', '2024-01-01', dtype='datetime64[D]')
+    y = 7 + np.cumsum(rng.normal(0, 0.1, len(x)))
+    return x, y
+
+
+@pytest.mark.parametrize('mode', ['lttb', 'minmax'])
+def test_series_at_or_below_threshold_are_unchanged(mode):
+    x = np.arange(1000)
+    y = np.where(x % 10 == 0, np.nan, np.sin(x / 50))
+    for length in (999, 1000):
+        out_x, out_y = downsample(x[:length], y[:length], 200, mode, threshold=1000)
+        assert np.array_equal(out_x, x[:length])
+        # NaN gaps included: nothing is dropped from a short series
+        assert np.array_equal(out_y, y[:length], equal_nan=True)
+
+
+@pytest.mark.parametrize('target', [3, 10, 500, 3651])
+def test_lttb_keeps_endpoints_and_returns_target_points(series, target):
+    x, y = series
+    index = lttb(x, y, target)
+    assert len(index) == target
+    assert index[0] == 0 and index[-1] == len(x) - 1
+    assert np.all(np.diff(index) > 0)
+
+
+def test_lttb_below_three_points_or_above_length_keeps_everything(series):
+    x, y = series
+    assert np.array_equal(lttb(x, y, 2), np.arange(len(x)))
+    assert np.array_equal(lttb(x, y, len(x) + 1), np.arange(len(x)))
+
+
+def test_minmax_keeps_each_buckets_extremes(series):
+    x, y = series
+    target = 100
+    index = minmax(x, y, target)
+    assert len(index) <= target
+    edges = np.linspace(0, len(y), target // 2 + 1).astype(np.int64)
+    kept = set(index.tolist())
+    for start, end in zip(edges[:-1], edges[1:]):
+        assert start + int(np.argmin(y[start:end])) in kept
+        assert start + int(np.argmax(y[start:end])) in kept
+    # The overall extremes always survive
+    assert y[index].min() == y.min() and y[index].max() == y.max()
+
+
+@pytest.mark.parametrize('mode', ['lttb', 'minmax'])
+def test_nan_points_are_skipped_when_reducing(series, mode):
+    x, y = series
+    y = y.copy()
+    y[::7] = np.nan
+    out_x, out_y = downsample(x, y, 300, mode, threshold=1000)
+    assert not np.isnan(out_y).any()
+    assert len(out_x) == len(out_y) <= 300
+    if mode == 'lttb':
+        # Endpoints of the NaN-free series
+        assert out_x[0] == x[1] and out_x[-1] == x[~np.isnan(y)][-1]
+
+
+def test_spread_band_envelopes_every_point(series):
+    x, y = series
+    y = y.copy()
+    y[::11] = np.nan
+    band_x, low, high = spread_band(x, y, 40)
+    assert len(band_x) == len(low) == len(high) == 40
+    assert np.all(low <= high)
+    assert low.min() == np.nanmin(y) and high.max() == np.nanmax(y)
+    assert np.all(np.diff(band_x.astype(np.int64)) > 0)
+
+
+def test_spread_band_with_fewer_points_than_buckets():
+    band_x, low, high = spread_band([1, 2, 3], [4.0, np.nan, 6.0], 10)
+    assert band_x.tolist() == [1, 3]
+    assert low.tolist() == high.tolist() == [4.0, 6.0]
+    empty = spread_band([1], [np.nan], 10)
+    assert all(len(part) == 0 for part in empty)
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sleep_tracker.factors import FACTORS, Z_95, analyze, synthetic_frame
+
+
+@pytest.fixture
+def frame():
+    frame = synthetic_frame(5000, seed=2)
+    rng = np.random.default_rng(8)
+    # Missing outcomes and factor answers are left out of their level
+    frame.loc[rng.random(len(frame)) < 0.05, 'rating'] = np.nan
+    frame.loc[rng.random(len(frame)) < 0.05, 'stress_level'] = np.nan
+    return frame
+
+
+def _grouped(frame, factor, outcome):
+    if factor.bins is None:
+        levels = frame[factor.column].astype(float).map({0.0: 0, 1.0: 1})
+    else:
+        levels = pd.cut(frame[factor.column], list(factor.bins) + [np.inf], right=False,
+                        labels=False)
+    return frame[outcome].groupby(levels).agg(['count', 'mean', 'std'])
+
+
+@pytest.mark.parametrize('outcome', ['duration', 'rating'])
+def test_analyze_matches_groupby(frame, outcome):
+    result = analyze(frame).set_index(['factor', 'level', 'outcome'])
+    for factor in FACTORS:
+        grouped = _grouped(frame, factor, outcome)
+        grouped = grouped[grouped['count'] > 0]
+        baseline = grouped.iloc[0]
+        for code, stats in grouped.iterrows():
+            row = result.loc[(factor.label, factor.levels[int(code)], outcome)]
+            half_width = Z_95 * stats['std'] / np.sqrt(stats['count'])
+            assert row['n'] == stats['count']
+            assert row['baseline'] == (code == grouped.index[0])
+            assert row['mean'] == pytest.approx(stats['mean'], rel=1e-9)
+            assert row['ci_low'] == pytest.approx(stats['mean'] - half_width, rel=1e-9)
+            assert row['ci_high'] == pytest.approx(stats['mean'] + half_width, rel=1e-9)
+            assert row['delta'] == pytest.approx(stats['mean'] - baseline['mean'],
+                                                 rel=1e-9, abs=1e-12)
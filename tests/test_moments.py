@@ -0,0 +1,133 @@
+import math
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+from sleep_tracker.migrations import migrate
+from sleep_tracker.moments import CoMoments, Moments, MomentsStore, SleepMoments, rebuild
+from sleep_tracker.repository import SleepFactors, SleepQuality, SleepRepository
+from sleep_tracker.storage import SqliteBackend
+
+
+def _added(values):
+    moments = Moments()
+    for value in values:
+        moments.add(value)
+    return moments
+
+
+def _merged(chunks):
+    total = Moments()
+    for chunk in chunks:
+        total.merge(_added(chunk))
+    return total
+
+
+@pytest.fixture
+def values():
+    return np.random.default_rng(7).normal(450, 60, 101)
+
+
+def test_add_matches_numpy(values):
+    moments = _added(values)
+    assert moments.n == len(values)
+    assert moments.mean == pytest.approx(values.mean(), rel=1e-12)
+    assert moments.variance == pytest.approx(values.var(ddof=1), rel=1e-12)
+
+
+def test_merge_of_disjoint_ranges_matches_the_whole(values):
+    # Empty and single-row buckets in between, and uneven chunk sizes
+    chunks = [values[:1], [], values[1:40], values[40:41], [], values[41:]]
+    merged = _merged(chunks)
+    assert merged.n == len(values)
+    assert merged.mean == pytest.approx(values.mean(), rel=1e-12)
+    assert merged.variance == pytest.approx(values.var(ddof=1), rel=1e-12)
+    assert Moments.from_values(values).m2 == pytest.approx(merged.m2, rel=1e-12)
+
+
+def test_empty_and_single_observation():
+    empty = _merged([[], []])
+    assert empty.n == 0
+    assert math.isnan(empty.variance)
+
+    single = _merged([[], [8.0]])
+    assert (single.n, single.mean, single.m2) == (1, 8.0, 0.0)
+    assert math.isnan(single.variance)
+
+
+def test_co_moments_merge_matches_corrcoef():
+    rng = np.random.default_rng(3)
+    x = rng.normal(7, 1, 57)
+    y = 0.8 * x + rng.normal(0, 0.5, 57)
+    total = CoMoments()
+    for start, stop in ((0, 1), (1, 1), (1, 20), (20, 57)):
+        part = CoMoments()
+        for a, b in zip(x[start:stop], y[start:stop]):
+            part.add(a, b)
+        total.merge(part)
+
+    assert total.n == len(x)
+    assert total.correlation == pytest.approx(np.corrcoef(x, y)[0, 1], rel=1e-12)
+    assert total.covariance == pytest.approx(np.cov(x, y)[0, 1], rel=1e-12)
+    assert CoMoments.from_values(x, y).c == pytest.approx(total.c, rel=1e-12)
+
+
+def test_correlation_is_undefined_without_spread():
+    assert math.isnan(CoMoments.from_values([1.0], [2.0]).correlation)
+    assert math.isnan(CoMoments.from_values([1.0, 1.0, 1.0], [2.0, 3.0, 4.0]).correlation)
+
+
+def test_sleep_moments_round_trip_through_a_row():
+    bucket = SleepMoments()
+    bucket.add(duration=420, rating=7, pair=(420, 7))
+    bucket.add(duration=480)
+    restored = SleepMoments.from_row(bucket.to_row())
+    assert restored.to_row() == bucket.to_row()
+
+
+def test_range_moments_match_raw_sessions(tmp_path):
+    backend = SqliteBackend(str(tmp_path / 'moments.db'))
+    conn = backend.connect()
+    migrate(conn, backend)
+    conn.execute("INSERT INTO Users (user_id, username, password) VALUES (1, 'alice', 'pw')")
+    conn.commit()
+    conn.close()
+    pool = backend.create_pool()
+    repository = SleepRepository(pool, backend)
+
+    rng = np.random.default_rng(11)
+    factors = SleepFactors(False, True, 30, 5)
+    nights = []
+    for back in range(60, 0, -1):
+        # Two sessions on some days, so buckets hold more than one observation
+        for _ in range(1 + (back % 7 == 0)):
+            start = datetime.combine(date.today() - timedelta(days=back), datetime.min.time())
+            start += timedelta(hours=22)
+            duration = int(rng.integers(300, 560))
+            rating = int(rng.integers(1, 11))
+            repository.add_record(1, start, start + timedelta(minutes=duration), duration,
+                                  SleepQuality(rating, 0, '', factors))
+            nights.append((back, duration, rating))
+
+    store = MomentsStore(pool)
+    for days in (7, 30, 90):
+        window = np.array([(d, r) for back, d, r in nights if back <= days - 1], dtype=float)
+        merged = store.range_moments(1, days)
+        assert merged.duration.n == len(window)
+        assert merged.duration.mean == pytest.approx(window[:, 0].mean(), rel=1e-12)
+        assert merged.duration.variance == pytest.approx(window[:, 0].var(ddof=1), rel=1e-9)
+        assert merged.rating.mean == pytest.approx(window[:, 1].mean(), rel=1e-12)
+        assert merged.pair.correlation == pytest.approx(
+            np.corrcoef(window[:, 0], window[:, 1])[0, 1], rel=1e-9)
+
+    # The set-based rebuild gives the same buckets as the incremental writes
+    with pool.connection() as conn:
+        incremental = conn.execute("SELECT * FROM Sleep_Moments ORDER BY date").fetchall()
+        rebuild(conn)
+        rebuilt = conn.execute("SELECT * FROM Sleep_Moments ORDER BY date").fetchall()
+    assert len(rebuilt) == len(incremental)
+    for before, after in zip(incremental, rebuilt):
+        assert before[:3] == after[:3]
+        assert after[3:] == pytest.approx(before[3:], rel=1e-9, abs=1e-9)
+    pool.close()
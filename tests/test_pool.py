@@ -0,0 +1,63 @@
+import sqlite3
+
+import pytest
+
+from sleep_tracker.pool import ConnectionPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    path = str(tmp_path / 'pool.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE Things (name TEXT)")
+    conn.close()
+    pool = ConnectionPool(lambda: sqlite3.connect(path, check_same_thread=False), max_size=1)
+    yield pool
+    pool.close()
+
+
+def test_uncommitted_work_is_not_handed_to_the_next_borrower(pool):
+    with pool.connection() as conn:
+        conn.execute("INSERT INTO Things VALUES ('left open')")
+        first = conn
+
+    with pool.connection() as conn:
+        # Same connection (max_size=1), but its open transaction was rolled back
+        assert conn is first
+        assert not conn.in_transaction
+        assert conn.execute("SELECT COUNT(*) FROM Things").fetchone()[0] == 0
+
+
+def test_block_that_raises_is_rolled_back(pool):
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            conn.execute("INSERT INTO Things VALUES ('failed')")
+            raise ValueError
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM Things").fetchone()[0] == 0
+
+
+class _BrokenConnection:
+    closed = False
+
+    def rollback(self):
+        raise sqlite3.OperationalError("connection lost")
+
+    def close(self):
+        self.closed = True
+
+
+def test_connection_that_cannot_roll_back_is_discarded():
+    opened = []
+
+    def connect():
+        opened.append(_BrokenConnection())
+        return opened[-1]
+
+    pool = ConnectionPool(connect, max_size=1)
+    with pool.connection():
+        pass
+    assert opened[0].closed
+    with pool.connection() as conn:
+        assert conn is opened[1]
+    pool.close()
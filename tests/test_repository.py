@@ -0,0 +1,88 @@
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from sleep_tracker.history import page_key
+from sleep_tracker.migrations import migrate
+from sleep_tracker.repository import SleepFactors, SleepQuality, SleepRepository
+from sleep_tracker.storage import SqliteBackend
+
+NIGHT = datetime(2024, 3, 1, 22, 30)
+
+
+@pytest.fixture
+def repository(tmp_path):
+    backend = SqliteBackend(str(tmp_path / 'sessions.db'))
+    conn = backend.connect()
+    migrate(conn, backend)
+    conn.execute("INSERT INTO Users (user_id, username, password) VALUES (1, 'alice', 'pw')")
+    conn.commit()
+    conn.close()
+    pool = backend.create_pool(max_size=8)
+    yield SleepRepository(pool, backend)
+    pool.close()
+
+
+def _concurrently(count, action):
+    barrier = threading.Barrier(count)
+    results = []
+
+    def run():
+        barrier.wait()
+        results.append(action())
+
+    threads = [threading.Thread(target=run) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_starts_open_one_session(repository):
+    for night in range(10):
+        start = NIGHT + timedelta(days=night)
+        opened = _concurrently(8, lambda: repository.start_session(1, start))
+        assert sum(session_id is not None for session_id in opened) == 1
+
+        ended = _concurrently(4, lambda: repository.end_session(1, start + timedelta(hours=8)))
+        assert sum(session is not None for session in ended) == 1
+
+
+def test_rejected_start_releases_the_write_lock(repository):
+    assert repository.start_session(1, NIGHT) is not None
+    assert repository.start_session(1, NIGHT) is None
+
+    # Another connection can write at once: nothing was left holding the lock
+    conn = sqlite3.connect(repository.backend.path, timeout=0)
+    conn.execute("UPDATE Users SET name = 'Alice' WHERE user_id = 1")
+    conn.commit()
+    conn.close()
+
+
+def test_history_pages_return_every_session_once_despite_ties(repository):
+    quality = SleepQuality(6, 1, '', SleepFactors(False, False, 0, 3))
+    expected = []
+    for night in range(4):
+        day = NIGHT + timedelta(days=night)
+        # Four sessions share (date, start) and two more share only the date
+        for start in (day, day, day, day + timedelta(hours=1), day, day - timedelta(hours=2)):
+            expected.append(repository.add_record(1, start, start + timedelta(hours=7), 420,
+                                                  quality))
+
+    seen = []
+    after = None
+    while True:
+        page = repository.history_page(1, after=after, page_size=4)
+        seen.extend(row[0] for row in page)
+        if len(page) < 4:
+            break
+        after = page_key(page[-1])
+
+    assert sorted(seen) == sorted(expected)
+    assert len(seen) == len(set(seen))
+    # Same order as one unpaged read: newest first, session_id descending within a tie
+    everything = repository.history_page(1, page_size=len(expected) + 1)
+    assert seen == [row[0] for row in everything]
@@ -0,0 +1,119 @@
+import asyncio
+import json
+
+import pytest
+
+from sleep_tracker import server as server_module
+from sleep_tracker.server import SleepApiServer
+from sleep_tracker.storage import SqliteBackend
+
+
+@pytest.fixture
+def api(tmp_path):
+    api = SleepApiServer(SqliteBackend(str(tmp_path / 'api.db')), workers=2)
+    yield api
+    api.close()
+
+
+async def _listen(api):
+    listener = await api.start('127.0.0.1', 0)
+    return listener, listener.sockets[0].getsockname()[1]
+
+
+async def _exchange(port, raw):
+    """Status line and body of the single response to ``raw``, read until close."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(raw)
+    await writer.drain()
+    response = await asyncio.wait_for(reader.read(), 5)
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return head.split(b'\r\n')[0].decode(), json.loads(body)
+
+
+def _post(path, payload, token=None):
+    body = json.dumps(payload).encode()
+    auth = f"Authorization: Bearer {token}\r\n" if token else ''
+    return (f"POST {path} HTTP/1.1\r\nHost: x\r\nConnection: close\r\n{auth}"
+            f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+
+
+def _run(api, scenario):
+    async def main():
+        listener, port = await _listen(api)
+        async with listener:
+            return await scenario(port)
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize('raw, status', [
+    (b"GET /" + b"a" * (70 * 1024) + b" HTTP/1.1\r\n\r\n", '400'),
+    (b"GET / HTTP/1.1\r\nX-Big: " + b"a" * (70 * 1024) + b"\r\n\r\n", '431'),
+    (b"GET / HTTP/1.1\r\n" + b"X-Many: 1\r\n" * 200 + b"\r\n", '431'),
+], ids=['request-line', 'header-line', 'header-count'])
+def test_oversized_requests_are_refused(api, raw, status):
+    status_line, body = _run(api, lambda port: _exchange(port, raw))
+    assert status_line.split()[1] == status
+    assert 'error' in body
+
+
+def test_tokens_expire(api, monkeypatch):
+    async def scenario(port):
+        await _exchange(port, _post('/register', {'username': 'ann', 'password': 'pw'}))
+        _, login = await _exchange(port, _post('/login', {'username': 'ann', 'password': 'pw'}))
+        fresh, _ = await _exchange(port, _post('/sessions/start', {}, login['token']))
+        monkeypatch.setattr(server_module, 'TOKEN_TTL', -1)
+        _, stale = await _exchange(port, _post('/login', {'username': 'ann', 'password': 'pw'}))
+        expired, _ = await _exchange(port, _post('/sessions/end', {}, stale['token']))
+        return fresh, expired
+
+    fresh, expired = _run(api, scenario)
+    assert fresh.split()[1] == '201'
+    assert expired.split()[1] == '401'
+    # Issuing a token drops the ones that have expired
+    assert len(api._tokens) == 1
+
+
+def test_expired_tokens_are_evicted_on_login(api, monkeypatch):
+    monkeypatch.setattr(server_module, 'TOKEN_TTL', -1)
+    for user_id in range(5):
+        api._issue_token(user_id)
+    assert len(api._tokens) == 1
+
+
+def test_session_ends_with_quality_in_one_write(api):
+    async def scenario(port):
+        await _exchange(port, _post('/register', {'username': 'ann', 'password': 'pw'}))
+        _, login = await _exchange(port, _post('/login', {'username': 'ann', 'password': 'pw'}))
+        await _exchange(port, _post('/sessions/start', {}, login['token']))
+        return await _exchange(port, _post('/sessions/end', {'quality': {'rating': 8}},
+                                           login['token']))
+
+    status_line, body = _run(api, scenario)
+    assert status_line.split()[1] == '200'
+    assert body['quality_saved']
+    with api.pool.connection() as conn:
+        rows = conn.execute("SELECT rating FROM Sleep_Quality").fetchall()
+        summary = conn.execute("SELECT session_count, rating_count FROM Daily_Sleep_Summary")
+        assert rows == [(8,)]
+        assert summary.fetchall() == [(1, 1)]
+
+
+@pytest.mark.parametrize('path', ['/register', '/login'])
+@pytest.mark.parametrize('fields', [
+    {'username': 123, 'password': 'pw'},
+    {'username': 'ann', 'password': 4567},
+    {'username': None, 'password': 'pw'},
+    {'username': ['ann'], 'password': {'pw': 1}},
+    {'username': 'ann', 'password': True},
+], ids=['number-username', 'number-password', 'null', 'containers', 'boolean'])
+def test_non_text_credentials_are_rejected(api, path, fields):
+    status_line, body = _run(api, lambda port: _exchange(port, _post(path, fields)))
+    assert status_line.split()[1] == '400'
+    assert 'error' in body
+
+
+def test_non_text_profile_fields_are_rejected(api):
+    fields = {'username': 'ann', 'password': 'pw', 'name': 5}
+    status_line, _ = _run(api, lambda port: _exchange(port, _post('/register', fields)))
+    assert status_line.split()[1] == '400'
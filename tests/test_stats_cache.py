@@ -0,0 +1,41 @@
+from datetime import date, timedelta
+
+import pandas as pd
+
+from sleep_tracker.stats_cache import StatsCache
+
+
+def _history(user_id):
+    today = date.today()
+    return pd.DataFrame({
+        'session_id': [1, 2, 3],
+        'date': pd.to_datetime([today - timedelta(days=d) for d in (3, 2, 1)]),
+        'duration': [420, 450, 480],
+        'rating': [6, 7, 8],
+    })
+
+
+def test_patch_swaps_in_a_new_frame():
+    cache = StatsCache()
+    cache.get_frame(1, 7, _history)
+    cached = cache._frames[1]
+
+    cache.patch_session(1, 2, duration=300, rating=3)
+
+    # A reader still slicing the old frame outside the lock never sees a half-applied patch
+    assert cached['duration'].tolist() == [420, 450, 480]
+    assert cache._frames[1] is not cached
+    patched = cache.get_frame(1, 7, _history)
+    assert patched['duration'].tolist() == [420, 300, 480]
+    assert patched['rating'].tolist() == [6, 3, 8]
+
+
+def test_patch_that_does_not_fit_drops_the_frame():
+    cache = StatsCache()
+    cache.get_frame(1, 7, _history)
+    cached = cache._frames[1]
+
+    cache.patch_session(1, 2, duration=300, rating='not a rating')
+
+    assert 1 not in cache._frames
+    assert cached['duration'].tolist() == [420, 450, 480]
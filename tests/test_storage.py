@@ -0,0 +1,37 @@
+from sleep_tracker.storage import SqlServerBackend, SqliteBackend
+
+
+class _RecordingCursor:
+    def __init__(self, row):
+        self.row = row
+        self.statements = []
+
+    def execute(self, sql, params=()):
+        self.statements.append((' '.join(sql.split()), params))
+        return self
+
+    def fetchone(self):
+        return self.row
+
+
+def test_sql_server_insert_returns_id_from_output_clause():
+    cursor = _RecordingCursor((42,))
+    new_id = SqlServerBackend('DSN=unused').insert_returning_id(
+        cursor, 'Users', ('username', 'password'), ('ann', 'pw'), 'user_id')
+
+    assert new_id == 42
+    # One statement: the id comes back with the INSERT, not from a later scope
+    assert cursor.statements == [
+        ("INSERT INTO Users (username, password) OUTPUT INSERTED.user_id VALUES (?, ?)",
+         ('ann', 'pw')),
+    ]
+
+
+def test_sqlite_insert_returns_rowid(tmp_path):
+    backend = SqliteBackend(str(tmp_path / 'ids.db'))
+    conn = backend.connect()
+    conn.execute("CREATE TABLE Things (thing_id INTEGER PRIMARY KEY, name TEXT)")
+    ids = [backend.insert_returning_id(conn.cursor(), 'Things', ('name',), (name,), 'thing_id')
+           for name in ('a', 'b')]
+    assert ids == [1, 2]
+    conn.close()
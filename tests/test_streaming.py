@@ -0,0 +1,87 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sleep_tracker import synthetic
+from sleep_tracker.factors import analyze
+from sleep_tracker.migrations import migrate
+from sleep_tracker.storage import SqliteBackend
+from sleep_tracker.streaming import (DURATION_EDGES, STREAM_COLUMNS, STREAM_QUERY,
+                                     StreamingStatistics, iter_chunks, stream_statistics)
+
+CHUNK = 997     # does not divide the row count, so the last chunk is short
+
+
+@pytest.fixture(scope='module')
+def seeded(tmp_path_factory):
+    backend = SqliteBackend(str(tmp_path_factory.mktemp('streaming') / 'seeded.db'))
+    conn = backend.connect()
+    migrate(conn, backend)
+    synthetic.generate(conn, backend, users=4, nights=900, seed=9, in_progress=0.5,
+                       end_date=date.today())
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(scope='module')
+def frame(seeded):
+    """Every streamed row at once, the in-memory reference."""
+    rows = seeded.execute(STREAM_QUERY.format(where='')).fetchall()
+    frame = pd.DataFrame(rows, columns=STREAM_COLUMNS)
+    assert len(frame) % CHUNK
+    return frame
+
+
+def _assert_same(streamed, frame):
+    hours = frame['duration'] / 60
+    summary = streamed.summary
+    assert streamed.sessions == hours.count()
+    assert summary.duration.mean == pytest.approx(hours.mean(), rel=1e-12)
+    assert summary.duration.variance == pytest.approx(hours.var(), rel=1e-9)
+    assert summary.rating.mean == pytest.approx(frame['rating'].mean(), rel=1e-12)
+    assert summary.rating.variance == pytest.approx(frame['rating'].var(), rel=1e-9)
+    assert summary.pair.correlation == pytest.approx(hours.corr(frame['rating']), rel=1e-9)
+
+    assert streamed.duration_histogram.tolist() == \
+        np.histogram(hours.dropna(), DURATION_EDGES)[0].tolist()
+    assert streamed.rating_histogram.tolist() == \
+        [int((frame['rating'] == level).sum()) for level in range(1, 11)]
+
+    expected = analyze(frame.assign(duration=hours))
+    actual = streamed.factor_effects()
+    assert actual[['factor', 'level', 'outcome']].astype(str).values.tolist() == \
+        expected[['factor', 'level', 'outcome']].astype(str).values.tolist()
+    for column in ('n', 'mean', 'ci_low', 'ci_high', 'delta', 'effect_size'):
+        np.testing.assert_allclose(actual[column].to_numpy(dtype=float),
+                                   expected[column].to_numpy(dtype=float),
+                                   rtol=1e-9, atol=1e-12, equal_nan=True)
+
+    daily = (frame.assign(duration=hours, date=pd.to_datetime(frame['date']))
+             .groupby('date')[['duration', 'rating']].mean())
+    series = streamed.daily_series().set_index('date')
+    # Days whose only session is still open have no duration and no rating
+    daily = daily.dropna(how='all')
+    assert series.index.tolist() == daily.index.tolist()
+    np.testing.assert_allclose(series[['duration', 'rating']].to_numpy(),
+                               daily[['duration', 'rating']].to_numpy(),
+                               rtol=1e-12, equal_nan=True)
+
+
+def test_chunked_statistics_match_the_in_memory_path(seeded, frame):
+    chunks = list(iter_chunks(seeded, chunk_size=CHUNK))
+    assert [len(chunk) for chunk in chunks[:-1]] == [CHUNK] * (len(chunks) - 1)
+    assert 0 < len(chunks[-1]) < CHUNK
+    _assert_same(stream_statistics(seeded, chunk_size=CHUNK), frame)
+
+
+def test_merged_partial_accumulators_match_the_in_memory_path(seeded, frame):
+    # Two "workers" take alternating chunks; their aggregates are merged at the end
+    workers = [StreamingStatistics(), StreamingStatistics()]
+    for index, chunk in enumerate(iter_chunks(seeded, chunk_size=CHUNK)):
+        workers[index % 2].update(chunk)
+    merged = StreamingStatistics()
+    merged.merge(workers[1])
+    merged.merge(workers[0])
+    _assert_same(merged, frame)